@@ -1,20 +1,30 @@
 import os
 import sys
-import re
-import requests
 import base64
+import functools
+import json
 from io import BytesIO
-from pdf2image import convert_from_bytes
-from pyzbar.pyzbar import decode
 from PIL import Image
 import streamlit as st
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict
+from extractor import DPI_LADDER, TEXT_FIRST, EMBEDDED_IMAGES, LOCALIZE, RENDER_BACKEND, SYMBOLOGIES, DECODERS, ZXING_FORMATS, available_backends, available_decoders, parse_dpi_ladder, parse_roi, merge_rung_stats, format_rung_stats
+from fetcher import MAX_PDF_SIZE, PER_HOST_LIMIT
+from pipeline import DEFAULT_DOWNLOAD_WORKERS, DEFAULT_DECODE_WORKERS, label_rows
+from result_cache import ResultCache
+from rules import parse_rules
+from job_journal import JobJournal, job_id_for_urls
+from local_files import expand_inputs
+from job_manager import JobManager
+from metrics import format_summary, summarize_run, to_json, to_prometheus
+from concurrency import format_limits
 
 # ---------- Cấu hình ----------
-TRIM_FROM = 8
-DEFAULT_MAX_WORKERS = 6
-REQUEST_TIMEOUT = 30
+MAX_DOWNLOAD_WORKERS = 64
+MAX_DECODE_WORKERS = 64
+# Trang hỏi job manager tiến độ / dòng mới mỗi POLL_INTERVAL giây khi đang có job chạy
+POLL_INTERVAL = 1.0
+# Bảng kết quả hiện theo trang (tính theo dòng URL): mỗi lần vẽ lại chỉ dựng + gửi một trang, batch lớn cỡ nào cũng vậy
+RESULTS_PAGE_SIZE = 200
 
 # ---------- Helpers ----------
 def get_poppler_path() -> str | None:
@@ -25,64 +35,47 @@ def get_poppler_path() -> str | None:
         return poppler_dir
     return None
 
-def normalize_drive_url(url: str) -> str:
-    """Chuẩn hóa link Google Drive sang link tải trực tiếp (direct download)."""
-    url = url.strip()
-    match = re.search(r"drive\.google\.com/file/d/([^/?]+)", url)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
-    match = re.search(r"drive\.google\.com/open\?id=([^&]+)", url)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
-    match = re.search(r"drive\.google\.com/uc\?id=([^&]+)", url)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
-    return url
-
-def extract_tracking_from_pdf_bytes(pdf_bytes: bytes, poppler_path: str | None) -> List[str]:
-    """Chuyển PDF -> ảnh -> decode barcode trên mỗi trang."""
+@st.cache_resource
+def get_result_cache() -> ResultCache | None:
+    """Một cache kết quả (SQLite) dùng chung cho mọi session của process; lỗi -> chạy không cache."""
     try:
-        images = convert_from_bytes(pdf_bytes, dpi=300, poppler_path=poppler_path)
-    except Exception as e:
-        raise RuntimeError(f"convert_from_bytes error: {e}")
-    found = []
-    for img in images:
-        try:
-            codes = decode(img)
-            codes_sorted = sorted(codes, key=lambda c: c.rect.top)
-            for c in codes_sorted:
-                try:
-                    s = c.data.decode("utf-8")
-                except:
-                    s = c.data.decode(errors="ignore")
-                found.append(s)
-        except Exception:
-            continue
-    return found
-
-def process_single(idx: int, url: str, poppler_path: str | None) -> Dict:
-    """Tải PDF từ URL (hỗ trợ link Drive) và đọc barcode."""
+        return ResultCache()
+    except Exception:
+        return None
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Một job manager cho cả server: batch chạy nền, không bị dừng khi trang rerun hay mất kết nối;
+    ngân sách luồng tải / process decode được chia đều cho các session đang chạy job."""
+    return JobManager()
+
+@st.cache_resource(show_spinner=False)
+def read_asset(path: str) -> bytes | None:
+    """Nội dung file tĩnh (ảnh bìa, QR...), đọc một lần cho cả process; không có file -> None."""
     try:
-        url = normalize_drive_url(url)
-        resp = requests.get(url, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-        pdf_bytes = resp.content
-        codes = extract_tracking_from_pdf_bytes(pdf_bytes, poppler_path)
-        if codes:
-            raw = codes[0]
-            if raw.startswith("9631"):
-                trimmed = raw[-12:]
-            else:
-                trimmed = raw[TRIM_FROM:] if len(raw) > TRIM_FROM else raw
-            result = {"index": idx, "url": url, "raw": raw, "trimmed": trimmed, "error": ""}
-        else:
-            result = {"index": idx, "url": url, "raw": "", "trimmed": "N/A", "error": "Not found"}
-    except Exception as e:
-        result = {"index": idx, "url": url, "raw": "", "trimmed": "N/A", "error": str(e)}
-    return result
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def sync_job() -> Dict | None:
+    """Chép các dòng mới của job hiện tại vào session_state -> trạng thái job (None nếu không còn job)."""
+    job_id = st.session_state.get("job_id")
+    job = get_job_manager().get(job_id) if job_id else None
+    if job is None:
+        st.session_state["running"] = False
+        return None
+    if len(st.session_state["results"]) != job.total:
+        st.session_state["results"] = [None] * job.total
+        st.session_state["cursor"] = 0
+    rows, st.session_state["cursor"] = job.rows_since(st.session_state["cursor"])
+    for row in rows:
+        st.session_state["results"][row["index"]] = row
+    status = job.status()
+    st.session_state["total"] = status["total"]
+    st.session_state["processed"] = status["processed"]
+    st.session_state["running"] = status["state"] == "running"
+    return status
 
 # ---------- Streamlit UI ----------
 st.set_page_config(page_title="PDF Barcode Batch Reader", layout="wide", initial_sidebar_state="expanded")
@@ -93,6 +86,12 @@ st.snow()
 # Thêm nhạc nền từ mã nhúng iframe (ẩn đi để làm nhạc nền)
 MUSIC_REL_PATH = os.path.join("music", "noel-music.mp3")
 
+@st.cache_resource(show_spinner=False)
+def _read_audio_base64(path: str) -> str:
+    """Base64 of the audio file, read and encoded once per process ("" if it cannot be read)."""
+    data = read_asset(path)
+    return base64.b64encode(data).decode("ascii") if data is not None else ""
+
 def _get_audio_html_from_file(path: str, volume: float = 0.2) -> str:
     """Return an HTML snippet that embeds the audio file as a base64 data URL.
 
@@ -100,12 +99,8 @@ def _get_audio_html_from_file(path: str, volume: float = 0.2) -> str:
     Note: Some browsers block autoplay with sound; the JS will try to play and will fail silently
     if autoplay is blocked. The user can toggle playback using the small button.
     """
-    if not os.path.exists(path):
-        return ""
-    try:
-        with open(path, "rb") as f:
-            data = base64.b64encode(f.read()).decode("ascii")
-    except Exception:
+    data = _read_audio_base64(path)
+    if not data:
         return ""
 
     # Build the HTML with simple concatenation to avoid f-string brace escaping issues
@@ -182,33 +177,18 @@ st.markdown("""
 
 # Hiển thị ảnh bìa trên đầu tiêu đề nếu file tồn tại
 cover_path = "qrcode/cover-photo.jpg"
-if os.path.exists(cover_path):
-    st.image(cover_path, use_column_width=True)
+cover = read_asset(cover_path)
+if cover is not None:
+    st.image(cover, use_column_width=True)
 else:
     st.warning(f"Không tìm thấy ảnh bìa tại '{cover_path}'. Vui lòng kiểm tra đường dẫn và đặt file đúng vị trí.")
 
-# Hiển thị nhạc nền nếu được bật (sử dụng embed base64 để cố gắng autoplay + loop)
-try:
-    if globals().get("music_enabled"):
-        music_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), MUSIC_REL_PATH)
-        audio_html = _get_audio_html_from_file(music_path, volume=globals().get("music_volume", 0.2))
-        if audio_html:
-            st.markdown(audio_html, unsafe_allow_html=True)
-        else:
-            # Fallback to st.audio to at least show a player if direct embed failed
-            if os.path.exists(music_path):
-                with open(music_path, "rb") as _mf:
-                    st.audio(_mf.read(), format="audio/mp3")
-            else:
-                st.warning(f"Không tìm thấy file nhạc tại '{MUSIC_REL_PATH}'.")
-except Exception:
-    pass
-
 st.title("🎄📦 PDF Barcode Batch Reader — Extract & Trim ❄️")
 st.markdown("### 🎅 Hướng dẫn sử dụng (Phiên bản Noel) 🎁")
 st.markdown("""
-- Dán danh sách **URL PDF hoặc link Google Drive** (mỗi link 1 dòng) vào ô bên dưới. 🎄
-- Chọn số lượng worker (threads) để xử lý song song (mặc định: 6). ❄️
+- Dán danh sách **URL PDF hoặc link Google Drive** (mỗi link 1 dòng, link thư mục Drive công khai cũng được) vào ô bên dưới. 🎄
+- Chạy app trên máy có sẵn file (vd. ổ mạng của kho)? Dán thẳng **đường dẫn file PDF, thư mục hoặc file ZIP** trên máy chủ: đọc từ đĩa, không cần tải lên đâu cả. 📁
+- Chọn số luồng tải (download workers) và số process đọc barcode (decode workers) ở thanh bên. ❄️
 - Nhấn **🚀 Start processing** để bắt đầu. 🌟
 - Kết quả sẽ hiển thị dưới dạng bảng, và bạn có thể tải về CSV hoặc copy danh sách trimmed. 🎅
 """)
@@ -222,17 +202,129 @@ if "results" not in st.session_state:
     st.session_state["running"] = False
     st.session_state["show_donut"] = False
     st.session_state["process_triggered"] = False
+    st.session_state["job_id"] = None
+    st.session_state["cursor"] = 0
+
+# Job chạy nền trên server: lấy tiến độ mới nhất trước khi vẽ nút Start
+sync_job()
 
 # --- Sidebar cho cấu hình ---
 with st.sidebar:
     st.header("⚙️ Cấu hình 🎄")
-    max_workers = st.number_input(
-        "Max workers (threads)",
+    download_workers = st.number_input(
+        "Download workers (threads)",
+        min_value=1,
+        max_value=MAX_DOWNLOAD_WORKERS,
+        value=DEFAULT_DOWNLOAD_WORKERS,
+        step=1,
+        help="Số luồng tải PDF song song (tầng I/O). ❄️"
+    )
+    per_host_limit = st.number_input(
+        "Max connections per host",
         min_value=1,
-        max_value=32,
-        value=DEFAULT_MAX_WORKERS,
+        max_value=MAX_DOWNLOAD_WORKERS,
+        value=PER_HOST_LIMIT,
         step=1,
-        help="Số lượng luồng song song để xử lý nhanh hơn (tùy thuộc vào tài nguyên máy). ❄️"
+        help="Số request đồng thời tối đa tới cùng một host (vd. drive.google.com); kết nối được giữ lại giữa các lần tải. Host trả 429 / hết quota thì tự giảm và chờ theo Retry-After, ổn định lại thì tăng dần. ❄️"
+    )
+    decode_workers = st.number_input(
+        "Decode workers (processes)",
+        min_value=1,
+        max_value=MAX_DECODE_WORKERS,
+        value=min(DEFAULT_DECODE_WORKERS, MAX_DECODE_WORKERS),
+        step=1,
+        help="Số process render + đọc barcode song song (tầng CPU) tối đa cho batch này; server chia đều các process cho những người đang chạy cùng lúc và tự giảm khi thiếu RAM / CPU (giới hạn thật hiện ở dòng tiến độ). ❄️"
+    )
+    max_pdf_mb = st.number_input(
+        "Dung lượng PDF tối đa (MB)",
+        min_value=1,
+        max_value=2048,
+        value=MAX_PDF_SIZE // (1024 * 1024),
+        step=10,
+        help="PDF lớn hơn sẽ bị hủy ngay khi đang tải và báo lỗi ở dòng kết quả. ❄️"
+    )
+    dpi_ladder_text = st.text_input(
+        "Thang DPI (DPI ladder)",
+        value=", ".join(str(d) for d in DPI_LADDER),
+        help="Render ở DPI thấp trước, chỉ render lại ở DPI cao hơn khi trang chưa đọc được barcode. ❄️"
+    )
+    try:
+        dpi_ladder = parse_dpi_ladder(dpi_ladder_text)
+    except ValueError:
+        st.error(f"Thang DPI không hợp lệ, dùng mặc định {DPI_LADDER}.")
+        dpi_ladder = DPI_LADDER
+    roi_text = st.text_input(
+        "Vùng ưu tiên ROI (left, top, right, bottom)",
+        value="",
+        placeholder="0, 0, 1, 0.33",
+        help="Tỉ lệ theo trang. Chỉ render vùng này trước (vd. 1/3 phía trên nhãn), không thấy barcode mới render cả trang. Để trống = cả trang. ❄️"
+    )
+    try:
+        roi = parse_roi(roi_text)
+    except ValueError:
+        st.error("ROI không hợp lệ, dùng cả trang.")
+        roi = None
+    text_first = st.checkbox(
+        "Đọc text layer trước (pdftotext)",
+        value=TEXT_FIRST,
+        help="Nếu PDF có sẵn số tracking dạng text thì lấy luôn, không cần render ảnh. ❄️"
+    )
+    embedded = st.checkbox(
+        "Đọc thẳng ảnh nhúng (pdfimages)",
+        value=EMBEDDED_IMAGES,
+        help="Trang chỉ gồm một ảnh nhãn lớn sẽ được decode từ ảnh gốc, không render lại trang. ❄️"
+    )
+    localize = st.checkbox(
+        "Khoanh vùng barcode trước khi decode",
+        value=LOCALIZE,
+        help="Tìm vùng có barcode trên ảnh thu nhỏ rồi chỉ decode các vùng đó (tự xoay barcode nghiêng), không thấy mới quét cả trang. ❄️"
+    )
+    multi_label = st.checkbox(
+        "PDF nhiều nhãn (đọc mọi mã)",
+        value=False,
+        help="Mỗi PDF gồm nhiều nhãn (vd. mỗi trang một nhãn): tải + render một lần, mỗi số tracking một dòng kèm số trang. Chế độ này không dùng cache. ❄️"
+    )
+    rules_file = st.file_uploader(
+        "Bảng luật chọn + cắt mã (JSON)",
+        type=["json"],
+        help="Để trống = bảng mặc định (9631... -> 12 ký tự cuối, còn lại bỏ 8 ký tự đầu). Mỗi luật: carrier, prefix / pattern, trim (last:N, from:N, group:N), skip. ❄️"
+    )
+    rules = None
+    if rules_file is not None:
+        try:
+            rules = parse_rules(json.loads(rules_file.getvalue().decode("utf-8")))
+        except ValueError as e:
+            st.error(f"Bảng luật không hợp lệ ({e}), dùng bảng mặc định.")
+    backends = available_backends()
+    render_backend = st.selectbox(
+        "Backend render",
+        backends,
+        index=backends.index(RENDER_BACKEND) if RENDER_BACKEND in backends else 0,
+        help="poppler: gọi pdftoppm/pdftotext cho mỗi PDF. pdfium: render ngay trong process (cần cài pypdfium2), nhanh hơn với nhãn 1 trang. ❄️"
+    )
+    symbologies = st.multiselect(
+        "Loại mã vạch cần đọc",
+        list(ZXING_FORMATS),
+        default=list(SYMBOLOGIES),
+        help="Chỉ quét các loại mã này (mã tracking là CODE128) nên decode nhanh hơn. Để trống = quét mọi loại. ❄️"
+    )
+    decoder_choices = [d for d in DECODERS if d in available_decoders()]
+    decoders = st.multiselect(
+        "Decoder (thử lần lượt)",
+        decoder_choices,
+        default=decoder_choices,
+        help="zbar chạy trước; zxing (nếu đã cài zxing-cpp) chỉ chạy khi zbar không đọc được. ❄️"
+    ) or ["zbar"]
+    bypass_cache = st.checkbox(
+        "Bỏ qua cache (tải + đọc lại tất cả)",
+        value=False,
+        help="Mặc định URL / PDF đã đọc được barcode sẽ lấy kết quả từ cache, chỉ xử lý các dòng mới hoặc lỗi. ❄️"
+    )
+    job_id_text = st.text_input(
+        "Job ID (chạy tiếp job cũ)",
+        value="",
+        placeholder="Để trống = tự tạo theo danh sách URL",
+        help="Bị ngắt giữa chừng (tắt tab, mất mạng) thì bấm Start lại với cùng danh sách URL: các dòng đã xong được giữ nguyên, chỉ xử lý phần còn lại. ❄️"
     )
     # Music controls for background audio
     music_enabled = st.checkbox("Phát nhạc nền (noel-music) 🎵", value=True, help="Bật/tắt nhạc nền")
@@ -242,12 +334,30 @@ with st.sidebar:
     st.markdown("Công cụ này hỗ trợ trích xuất mã vạch từ PDF vận đơn (ví dụ: mã tracking). 🌟")
     st.markdown("Nếu hữu ích, hãy ủng hộ developer một chiếc donut! 🍩🎁")
 
+# Hiển thị nhạc nền nếu được bật (sử dụng embed base64 để cố gắng autoplay + loop)
+# (đặt sau sidebar: music_enabled / music_volume là widget trong sidebar)
+try:
+    if music_enabled:
+        music_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), MUSIC_REL_PATH)
+        audio_html = _get_audio_html_from_file(music_path, volume=music_volume)
+        if audio_html:
+            st.markdown(audio_html, unsafe_allow_html=True)
+        else:
+            # Fallback to st.audio to at least show a player if direct embed failed
+            music = read_asset(music_path)
+            if music is not None:
+                st.audio(music, format="audio/mp3")
+            else:
+                st.warning(f"Không tìm thấy file nhạc tại '{MUSIC_REL_PATH}'.")
+except Exception:
+    pass
+
 # --- Giao diện chính ---
 urls_text = st.text_area(
     "Dán URLs PDF hoặc Google Drive (mỗi link 1 dòng) 🎄",
     height=220,
     value="\n".join(st.session_state.get("urls", [])),
-    help="Ví dụ: https://drive.google.com/file/d/ABC123/view ❄️"
+    help="Ví dụ: https://drive.google.com/file/d/ABC123/view hoặc /mnt/kho/nhan/2024-12 (thư mục / ZIP trên máy chủ) ❄️"
 )
 
 col_btn1, col_btn2 = st.columns([1, 1])
@@ -256,11 +366,12 @@ with col_btn1:
 with col_btn2:
     refresh_btn = st.button("🔄 Reset session ❄️")
 
-progress_bar = st.progress(0)
 status_text = st.empty()
 
 # --- Reset session ---
 if refresh_btn:
+    if st.session_state.get("job_id"):
+        get_job_manager().cancel(st.session_state["job_id"])
     st.session_state["results"] = []
     st.session_state["total"] = 0
     st.session_state["processed"] = 0
@@ -268,7 +379,9 @@ if refresh_btn:
     st.session_state["running"] = False
     st.session_state["show_donut"] = False
     st.session_state["process_triggered"] = False
-    progress_bar.progress(0)
+    st.session_state["job_id"] = None
+    st.session_state["cursor"] = 0
+    st.session_state.pop("results_page", None)
     status_text.text("Đã reset. Sẵn sàng sử dụng lại. 🎄")
     st.rerun()
 
@@ -286,8 +399,9 @@ if st.session_state.get("show_donut", False):
         """)
         # Giả sử QR code được lưu tại 'qrcode/qrcode.jpg' - bạn có thể thay bằng URL hoặc upload
         qr_path = "qrcode/qrcode.jpg"
-        if os.path.exists(qr_path):
-            st.image(qr_path, caption="Scan QR để ủng hộ 🎁", width=250)
+        qr = read_asset(qr_path)
+        if qr is not None:
+            st.image(qr, caption="Scan QR để ủng hộ 🎁", width=250)
         else:
             st.warning(f"Không tìm thấy QR code tại '{qr_path}'. Vui lòng kiểm tra đường dẫn. ❄️")
         if st.button("Đóng và tiếp tục xử lý 🎄"):
@@ -298,62 +412,153 @@ if st.session_state.get("show_donut", False):
 if st.session_state.get("process_triggered", False) and not st.session_state["show_donut"]:
     lines = [line.strip() for line in urls_text.splitlines() if line.strip()]
     st.session_state["urls"] = lines
-    total = len(lines)
+    # Thư mục / ZIP trên máy chủ, link thư mục Drive -> từng PDF bên trong (job ID vẫn tính theo danh sách đã dán)
+    with st.spinner("Đang liệt kê thư mục / ZIP..."):
+        urls = list(expand_inputs(lines))
+    total = len(urls)
     if total == 0:
-        status_text.text("Vui lòng dán URLs trước khi bắt đầu. 🎅")
+        if lines:
+            status_text.text("Không tìm thấy file PDF nào trong các URL / đường dẫn đã nhập. 🎅")
+        else:
+            status_text.text("Vui lòng dán URLs trước khi bắt đầu. 🎅")
         st.session_state["process_triggered"] = False  # Reset trigger
     else:
         st.session_state["total"] = total
         st.session_state["processed"] = 0
         st.session_state["results"] = [None] * total
-        st.session_state["running"] = True
-
-        poppler_path = get_poppler_path()
-        status_text.text(f"Đang xử lý {total} URLs... ❄️")
-
-        futures = {}
-        max_workers_to_use = min(max_workers, DEFAULT_MAX_WORKERS, total) if total > 0 else 1
-        with ThreadPoolExecutor(max_workers=max_workers_to_use) as ex:
-            for idx, url in enumerate(lines):
-                futures[ex.submit(process_single, idx, url, poppler_path)] = idx
-
-            for future in as_completed(futures):
-                idx_of = futures[future]
-                try:
-                    result = future.result()
-                except Exception as e:
-                    result = {"index": idx_of, "url": lines[idx_of], "raw": "", "trimmed": "N/A", "error": str(e)}
-                st.session_state["results"][idx_of] = result
-                st.session_state["processed"] += 1
-                progress_val = st.session_state["processed"] / st.session_state["total"]
-                progress_bar.progress(progress_val)
-                status_text.text(f"Đang xử lý {st.session_state['processed']}/{st.session_state['total']} 🎄")
-
-        st.session_state["running"] = False
-        st.session_state["process_triggered"] = False  # Reset trigger sau khi hoàn thành
-        status_text.text("✅ Hoàn thành xử lý! 🌟")
-
-# --- Hiển thị kết quả ---
-if st.session_state.get("results"):
-    st.markdown("### 📋 Kết quả xử lý 🎅")
-    display_rows = [r if r else {"index": idx, "url": "", "raw": "", "trimmed": "N/A", "error": "Đang chờ"} for idx, r in enumerate(st.session_state["results"])]
-    st.dataframe(display_rows, use_container_width=True)
+        st.session_state["cursor"] = 0
+        st.session_state.pop("results_page", None)
 
-    trimmed_list = [r.get("trimmed", "N/A") if r else "N/A" for r in st.session_state["results"]]
-    trimmed_text = "\n".join(trimmed_list)
+        extract_options = {"dpi_ladder": dpi_ladder, "roi": roi, "text_first": text_first, "embedded": embedded,
+                           "localize": localize, "multi_label": multi_label, "rules": rules,
+                           "backend": render_backend,
+                           "symbologies": tuple(symbologies), "decoders": tuple(decoders)}
 
-    csv_data = "\n".join([",".join(["index", "url", "raw", "trimmed", "error"])] + [
+        try:
+            journal = JobJournal(job_id_text.strip() or job_id_for_urls(lines))
+        except ValueError:
+            st.error("Job ID chỉ gồm chữ, số, '.', '_' hoặc '-'; tạo job theo danh sách URL.")
+            journal = JobJournal(job_id_for_urls(lines))
+
+        # Job chạy nền trên server; cùng job ID đang chạy (vd. mở ở tab khác) thì chỉ gắn vào job đó
+        st.session_state["job_id"] = get_job_manager().submit(
+            urls, get_poppler_path(), extract_options,
+            download_workers=int(download_workers), decode_workers=int(decode_workers),
+            per_host_limit=int(per_host_limit), cache=get_result_cache(), bypass_cache=bypass_cache,
+            journal=journal, max_pdf_size=int(max_pdf_mb) * 1024 * 1024)
+        st.session_state["running"] = True
+        st.session_state["process_triggered"] = False  # Reset trigger, job đã được giao cho server
+        st.rerun()
+
+# --- Tiến độ + kết quả (tự cập nhật khi job đang chạy) ---
+def _scalar_columns(row: Dict) -> Dict:
+    """Bỏ các cột không phải giá trị đơn (rungs, labels, box...): st.dataframe (Arrow) không chuyển được."""
+    return {k: v for k, v in row.items() if v is None or isinstance(v, (str, int, float, bool))}
+
+def page_display_rows(results: List[Dict | None], start: int, stop: int) -> List[Dict]:
+    """Dòng hiển thị của results[start:stop]; PDF nhiều nhãn: mỗi số tracking một dòng."""
+    return [_scalar_columns(row) for idx, r in enumerate(results[start:stop], start)
+            for row in (label_rows(r) if r else [{"index": idx, "url": "", "raw": "", "trimmed": "N/A", "error": "Đang chờ"}])]
+
+def results_csv(results: List[Dict | None]) -> str:
+    """CSV của cả batch (chỉ các dòng đã xong), dựng khi người dùng bấm tải."""
+    return "\n".join([",".join(["index", "url", "raw", "trimmed", "error", "carrier", "page"])] + [
         ",".join([
             str(r.get("index", "")),
             '"' + (r.get("url", "").replace('"', '""')) + '"',
             '"' + (r.get("raw", "").replace('"', '""')) + '"',
             '"' + (r.get("trimmed", "").replace('"', '""')) + '"',
-            '"' + (r.get("error", "").replace('"', '""')) + '"'
-        ]) for r in st.session_state["results"] if r
+            '"' + (r.get("error", "").replace('"', '""')) + '"',
+            '"' + ((r.get("carrier") or "").replace('"', '""')) + '"',
+            str(r.get("page") or "")
+        ]) for result in results if result for r in label_rows(result)
     ])
 
+def trimmed_text(results: List[Dict | None]) -> str:
+    """Danh sách trimmed của cả batch, mỗi dòng một mã (dòng chưa xong -> N/A)."""
+    return "\n".join(row.get("trimmed", "N/A") for row in page_display_rows(results, 0, len(results)))
+
+def run_stats(status: Dict | None):
+    """(merge_rung_stats, summarize_run) của batch; chỉ tính lại khi có dòng mới hoặc job đổi trạng thái."""
+    key = (st.session_state.get("job_id"), st.session_state["processed"], st.session_state["running"],
+           len(st.session_state["results"]))
+    if st.session_state.get("stats_key") != key:
+        results = st.session_state["results"]
+        st.session_state["stats"] = (merge_rung_stats(results),
+                                     summarize_run(results, status["elapsed"] if status else None))
+        st.session_state["stats_key"] = key
+    return st.session_state["stats"]
+
+def render_job_panel():
+    was_running = st.session_state["running"]
+    status = sync_job()
+    job_id = st.session_state.get("job_id")
+    total = st.session_state["total"]
+    processed = st.session_state["processed"]
+    if was_running and not st.session_state["running"]:
+        st.rerun()  # job vừa xong: vẽ lại cả trang (bật lại nút Start)
+
+    st.progress(processed / total if total else 0)
+    if status is None:
+        if job_id:
+            st.warning(f"Job {job_id} không còn trên server (server khởi động lại?). Bấm Start với cùng danh sách URL để chạy tiếp. ❄️")
+    elif status["state"] == "running":
+        col_status, col_cancel = st.columns([3, 1])
+        with col_status:
+            st.text(f"Đang xử lý {processed}/{total} (job {job_id}) 🎄")
+            if status["limits"]:
+                # Giới hạn thật của job lúc này (tự giảm khi Drive chặn 429 / hết quota hoặc server thiếu RAM / CPU)
+                st.caption("⚙️ " + format_limits(status["limits"]))
+        with col_cancel:
+            if st.button("⏹️ Dừng xử lý"):
+                get_job_manager().cancel(job_id)
+    elif status["state"] == "done":
+        st.text(f"✅ Hoàn thành xử lý! (job {job_id}) 🌟")
+    elif status["state"] == "cancelled":
+        st.text(f"⏹️ Đã dừng job {job_id} ở {processed}/{total}. Bấm Start để chạy tiếp phần còn lại. ❄️")
+    else:
+        st.error(f"❌ Job {job_id} lỗi: {status['error']}")
+
+    results = st.session_state.get("results")
+    if not results:
+        return
+    st.markdown("### 📋 Kết quả xử lý 🎅")
+    pages = max(1, -(-len(results) // RESULTS_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = int(st.number_input("Trang kết quả", min_value=1, max_value=pages, value=1, step=1, key="results_page",
+                                   help=f"{pages} trang, mỗi trang {RESULTS_PAGE_SIZE} URL. ❄️"))
+    first = (page - 1) * RESULTS_PAGE_SIZE
+    page_rows = page_display_rows(results, first, first + RESULTS_PAGE_SIZE)
+    st.dataframe(page_rows, use_container_width=True)
+    rung_totals, summary = run_stats(status)
+    if rung_totals:
+        st.caption("Thang DPI (hit/miss): " + format_rung_stats(rung_totals))
+    if summary["rows"]:
+        st.caption("📊 " + format_summary(summary))
+        with st.expander("📊 Số đo theo tầng (tải / chờ / render / decode)"):
+            st.dataframe([{"stage": stage, **s} for stage, s in summary["stages"].items()], use_container_width=True)
+            st.text(f"Tải {summary['bytes'] / (1024 * 1024):.1f} MB · render {summary['pages_rendered']} trang · "
+                    f"gọi decoder {summary['decode_attempts']} lần · cache {summary['cached']} dòng · "
+                    f"trùng {summary['duplicates']} dòng")
+            col_json, col_prom = st.columns(2)
+            with col_json:
+                st.download_button("Tải metrics JSON", data=to_json(summary), file_name="metrics.json",
+                                   mime="application/json")
+            with col_prom:
+                st.download_button("Tải metrics Prometheus", data=to_prometheus(summary), file_name="metrics.prom",
+                                   mime="text/plain")
+
+    # CSV / danh sách trimmed của cả batch chỉ được dựng khi bấm tải (không dựng + gửi lại mỗi lần vẽ)
     col_dl1, col_dl2 = st.columns(2)
     with col_dl1:
-        st.download_button("💾 Tải CSV kết quả 🎁", data=csv_data, file_name="results.csv", mime="text/csv")
+        st.download_button("💾 Tải CSV kết quả 🎁", data=functools.partial(results_csv, results),
+                           file_name="results.csv", mime="text/csv")
+        st.download_button("📋 Tải danh sách trimmed (.txt)", data=functools.partial(trimmed_text, results),
+                           file_name="trimmed.txt", mime="text/plain")
     with col_dl2:
-        st.text_area("Danh sách trimmed (copy-paste) ❄️", value=trimmed_text, height=200)
\ No newline at end of file
+        label = "Danh sách trimmed (copy-paste) ❄️" if pages == 1 else f"Danh sách trimmed trang {page} (copy-paste) ❄️"
+        st.text_area(label, value="\n".join(row.get("trimmed", "N/A") for row in page_rows), height=200)
+
+# Chỉ chạy lại phần này mỗi POLL_INTERVAL giây, không rerun cả trang (tuyết, nhạc, ...)
+st.fragment(run_every=POLL_INTERVAL if st.session_state["running"] else None)(render_job_panel)()
@@ -0,0 +1,579 @@
+"""Benchmark offline: sinh PDF nhãn giả lập (biết trước mã), phục vụ qua HTTP cục bộ và đo từng tầng.
+
+    python bench.py                              # 60 PDF, mọi tầng, in bảng kết quả
+    python bench.py -n 300 --backend pdfium --json bench.json
+    python bench.py --stages extract,pipeline --no-localize
+
+Mỗi tầng chạy trong một process riêng (spawn) nên peak RSS của tầng này không lẫn với tầng khác:
+
+- download:  tải mọi PDF qua Fetcher (thread pool) từ server HTTP cục bộ
+- rasterize: mở PDF + render mọi trang ở --dpi
+- decode:    decode các trang đã render (phần render không tính giờ), dừng ở trang đầu có mã
+- trim:      trim_code trên mã decode được (chạy chung process với decode)
+- extract:   extract_tracking_from_pdf_path như process decode thật (text layer, thang DPI, ảnh nhúng...)
+- pipeline:  run_pipeline trên toàn bộ URL (tải + decode song song, không cache)
+
+Độ chính xác của decode / extract / pipeline được so với mã đã biết của từng PDF.
+Cùng --seed và -n thì bộ PDF giống hệt nhau giữa các lần chạy.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from cli import get_poppler_path
+from extractor import (DECODERS, DEFAULT_DPI, LOCALIZE, RENDER_BACKEND, RENDER_BACKENDS, SYMBOLOGIES, TEXT_FIRST,
+                       _decode_localized, extract_tracking_from_pdf_path, get_decoders, open_renderer,
+                       parse_decoders, parse_symbologies)
+from fetcher import Fetcher
+from metrics import percentile
+from pipeline import DEFAULT_DECODE_WORKERS, DEFAULT_DOWNLOAD_WORKERS, run_pipeline, trim_code
+
+try:
+    import resource
+except ImportError:  # Windows: không đo được peak RSS
+    resource = None
+
+# ---------- Cấu hình ----------
+DEFAULT_COUNT = 60
+DEFAULT_SEED = 1
+# vector: barcode vẽ bằng path; -text: thêm số tracking dạng text; raster: trang là ảnh scan 300 dpi;
+# -skew: ảnh scan bị nghiêng; multi-: trang 1 là phiếu đóng gói, nhãn ở trang 2
+KINDS = ("vector", "vector-text", "raster", "raster-skew", "multi-vector", "multi-raster")
+# Khổ trang (point): nhãn 4x6 inch và A4
+PAGE_SIZES = {"4x6": (288, 432), "a4": (595, 842)}
+# Độ rộng một module của barcode (point); 0.75 pt ~ 3 pixel ở 300 dpi
+MODULE_WIDTHS = (0.75, 1.0, 1.5)
+SCAN_DPI = 300
+MAX_SKEW = 20
+STAGES = ("download", "rasterize", "decode", "trim", "extract", "pipeline")
+
+# ---------- Code 128 ----------
+# Độ rộng bar/space của 107 ký hiệu Code 128 (103-105: Start A/B/C, 106: Stop)
+CODE128_PATTERNS = (
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+    "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+    "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+    "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+    "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+    "114131", "311141", "411131", "211412", "211214", "211232", "2331112",
+)
+START_B, START_C, STOP = 104, 105, 106
+QUIET_ZONE = 10
+
+
+def code128_modules(data: str) -> str:
+    """Mã hóa Code 128 (toàn số độ dài chẵn -> bộ C, còn lại bộ B) -> chuỗi module '1' = vạch, '0' = nền."""
+    if data.isdigit() and len(data) % 2 == 0:
+        values = [START_C] + [int(data[i:i + 2]) for i in range(0, len(data), 2)]
+    else:
+        values = [START_B] + [ord(c) - 32 for c in data]
+    values.append((values[0] + sum(i * v for i, v in enumerate(values[1:], 1))) % 103)
+    values.append(STOP)
+    modules = []
+    for v in values:
+        for i, width in enumerate(CODE128_PATTERNS[v]):
+            modules.append(("1" if i % 2 == 0 else "0") * int(width))
+    return "".join(modules)
+
+
+def _bar_runs(modules: str) -> List[Tuple[int, int]]:
+    """Các vạch liền nhau -> [(module bắt đầu, số module), ...]."""
+    runs = []
+    start = None
+    for i, m in enumerate(modules + "0"):
+        if m == "1" and start is None:
+            start = i
+        elif m == "0" and start is not None:
+            runs.append((start, i - start))
+            start = None
+    return runs
+
+
+# ---------- Labels ----------
+STREETS = ("MAIN", "OAK", "PINE", "MAPLE", "CEDAR", "ELM", "LAKE", "HILL", "PARK", "RIVER")
+NAMES = ("JOHN DOE", "JANE ROE", "ACME CORP", "NGUYEN VAN A", "TRAN THI B", "GLOBEX LLC", "INITECH")
+
+
+def random_tracking(rng: random.Random) -> str:
+    """Số tracking giả theo các dạng trên nhãn thật (UPS 1Z, USPS IMpb 420..., FedEx 9631...)."""
+    carrier = rng.choice(("ups", "usps", "fedex"))
+    if carrier == "ups":
+        return "1Z" + "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(16))
+    if carrier == "usps":
+        return "420" + "".join(rng.choice(string.digits) for _ in range(5)) + "9" + rng.choice("2345") + \
+            "".join(rng.choice(string.digits) for _ in range(20))
+    return "9631" + "".join(rng.choice(string.digits) for _ in range(22))
+
+
+def _address_lines(rng: random.Random) -> List[str]:
+    return [f"SHIP TO: {rng.choice(NAMES)}", f"{rng.randint(1, 9999)} {rng.choice(STREETS)} ST",
+            f"CITY {rng.randint(10, 99)}, ZIP {rng.randint(10000, 99999)}", f"WEIGHT: {rng.randint(1, 70)} LBS"]
+
+
+def label_layout(code: str, size: Tuple[float, float], module: float, rng: random.Random,
+                 human_readable: bool) -> List[tuple]:
+    """Bố cục một nhãn: [("rect", x, y, w, h) | ("text", x, y, cỡ chữ, text)], point, gốc ở góc trên trái."""
+    w, h = size
+    items = []
+    y = 0.05 * h
+    for line in _address_lines(rng):
+        items.append(("text", 0.06 * w, y, 9, line))
+        y += 13
+    modules = "0" * QUIET_ZONE + code128_modules(code) + "0" * QUIET_ZONE
+    module = min(module, 0.9 * w / len(modules))
+    x0 = (w - len(modules) * module) / 2
+    y0 = max(y + 20, 0.3 * h)
+    bar_h = max(40.0, 0.12 * h)
+    for start, width in _bar_runs(modules):
+        items.append(("rect", x0 + start * module, y0, width * module, bar_h))
+    y = y0 + bar_h + 6
+    if human_readable:
+        items.append(("text", x0 + QUIET_ZONE * module, y, 10, code))
+    y += 30
+    for line in _address_lines(rng):
+        items.append(("text", 0.06 * w, y, 9, line.replace("SHIP TO", "FROM")))
+        y += 13
+    return items
+
+
+def packing_slip_layout(size: Tuple[float, float], rng: random.Random) -> List[tuple]:
+    """Trang phiếu đóng gói chỉ có chữ (không barcode) đứng trước nhãn trong PDF nhiều trang."""
+    w, h = size
+    items = [("text", 0.06 * w, 0.05 * h, 14, "PACKING SLIP")]
+    y = 0.05 * h + 30
+    for _ in range(12):
+        items.append(("text", 0.06 * w, y, 9, f"ITEM {rng.randint(100, 999)}  QTY {rng.randint(1, 9)}"))
+        y += 13
+    return items
+
+
+def _pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def vector_pdf(pages: List[List[tuple]], size: Tuple[float, float]) -> bytes:
+    """Ghi PDF vector tối giản: vạch là path tô đen, chữ là Helvetica (có text layer)."""
+    w, h = size
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, items in enumerate(pages):
+        ops = []
+        for item in items:
+            if item[0] == "rect":
+                _, x, y, rw, rh = item
+                ops.append(f"{x:.3f} {h - y - rh:.3f} {rw:.3f} {rh:.3f} re f")
+            else:
+                _, x, y, font_size, text = item
+                ops.append(f"BT /F1 {font_size} Tf {x:.2f} {h - y - font_size:.2f} Td ({_pdf_text(text)}) Tj ET")
+        content = "\n".join(ops)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w} {h}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1: font bitmap cố định
+        return ImageFont.load_default()
+
+
+def raster_page(items: List[tuple], size: Tuple[float, float], dpi: int = SCAN_DPI, skew: float = 0.0) -> Image.Image:
+    """Vẽ bố cục thành ảnh xám như bản scan ở `dpi`; skew != 0 -> trang bị xoay lệch (độ)."""
+    k = dpi / 72
+    img = Image.new("L", (round(size[0] * k), round(size[1] * k)), 255)
+    draw = ImageDraw.Draw(img)
+    for item in items:
+        if item[0] == "rect":
+            _, x, y, rw, rh = item
+            draw.rectangle((round(x * k), round(y * k), round((x + rw) * k) - 1, round((y + rh) * k) - 1), fill=0)
+        else:
+            _, x, y, font_size, text = item
+            draw.text((x * k, y * k), text, fill=0, font=_font(round(font_size * k)))
+    if skew:
+        img = img.rotate(skew, resample=Image.BICUBIC, fillcolor=255)
+    return img
+
+
+def raster_pdf(images: List[Image.Image], dpi: int = SCAN_DPI) -> bytes:
+    buf = BytesIO()
+    images[0].save(buf, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    return buf.getvalue()
+
+
+# ---------- Corpus ----------
+def build_corpus(out_dir: str, count: int = DEFAULT_COUNT, seed: int = DEFAULT_SEED,
+                 kinds: Tuple[str, ...] = KINDS) -> List[Dict]:
+    """Sinh `count` PDF vào out_dir (+ manifest.json) -> [{"name", "kind", "size", "module", "pages", "code"}]."""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    samples = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        size_name = rng.choice(sorted(PAGE_SIZES))
+        size = PAGE_SIZES[size_name]
+        module = rng.choice(MODULE_WIDTHS)
+        code = random_tracking(rng)
+        pages = [label_layout(code, size, module, rng, human_readable=kind == "vector-text")]
+        if kind.startswith("multi-"):
+            pages.insert(0, packing_slip_layout(size, rng))
+        if "raster" in kind:
+            skew = rng.uniform(-MAX_SKEW, MAX_SKEW) if kind == "raster-skew" else 0.0
+            data = raster_pdf([raster_page(items, size, skew=skew) for items in pages])
+        else:
+            data = vector_pdf(pages, size)
+        name = f"{i:04d}-{kind}-{size_name}.pdf"
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+        samples.append({"name": name, "kind": kind, "size": size_name, "module": module,
+                        "pages": len(pages), "code": code})
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"seed": seed, "samples": samples}, f, indent=1)
+    return samples
+
+
+# ---------- Local server ----------
+class _LabelHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive như server thật
+
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        self.latency = latency
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _LabelHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # backlog mặc định (5) làm rớt SYN khi nhiều luồng tải cùng kết nối
+
+
+class LabelServer:
+    """Server HTTP cục bộ (thread nền) phục vụ thư mục corpus, thay cho Drive / server của hãng vận chuyển.
+
+    latency: độ trễ (giây) thêm vào mỗi request để giả lập mạng thật.
+    """
+
+    def __init__(self, root: str, latency: float = 0.0):
+        handler = partial(_LabelHandler, directory=root, latency=latency)
+        self.httpd = _LabelHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/{name}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ---------- Stages ----------
+def peak_rss(children: bool = False) -> int | None:
+    """Peak RSS (byte) của process hiện tại, hoặc lớn nhất trong các process con đã kết thúc."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _stage_download(urls: List[str], workers: int) -> Dict:
+    fetcher = Fetcher(pool_size=workers, per_host_limit=workers)
+
+    def fetch(url):
+        started = time.perf_counter()
+        try:
+            fetcher.fetch_spooled(url).cleanup()
+        except Exception as e:
+            return time.perf_counter() - started, str(e)
+        return time.perf_counter() - started, ""
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        done = list(pool.map(fetch, urls))
+    wall = time.perf_counter() - started
+    fetcher.close()
+    return {"times": [t for t, _ in done], "errors": [e for _, e in done], "wall": wall}
+
+
+def _render_all(paths: List[str], backend: str, poppler_path: str | None, dpi: int, times: List[float] | None):
+    """Render mọi trang của từng PDF -> [[ảnh trang, ...] | lỗi (str), ...]; times: ghi thời gian mỗi PDF."""
+    rendered = []
+    for path in paths:
+        started = time.perf_counter()
+        renderer = None
+        try:
+            renderer = open_renderer(backend, path, poppler_path)
+            pages = [renderer.render(page, dpi) for page in range(1, renderer.page_count() + 1)]
+        except Exception as e:
+            pages = str(e)
+        finally:
+            if renderer is not None:
+                renderer.close()
+        if times is not None:
+            times.append(time.perf_counter() - started)
+        rendered.append(pages)
+    return rendered
+
+
+def _stage_rasterize(paths: List[str], backend: str, poppler_path: str | None, dpi: int) -> Dict:
+    times = []
+    rendered = _render_all(paths, backend, poppler_path, dpi, times)
+    errors = [pages if isinstance(pages, str) else "" for pages in rendered]
+    return {"times": times, "errors": errors, "wall": sum(times)}
+
+
+def _stage_decode(paths: List[str], backend: str, poppler_path: str | None, dpi: int, options: Dict) -> Dict:
+    """decode + trim trên ảnh đã render sẵn (mỗi PDF render xong thì decode luôn để RAM không phình)."""
+    decoders = get_decoders(tuple(options["decoders"]), tuple(options["symbologies"]))
+    decode_times, trim_times, codes, errors = [], [], [], []
+    for path in paths:
+        pages = _render_all([path], backend, poppler_path, dpi, None)[0]
+        if isinstance(pages, str):
+            errors.append(pages)
+            codes.append("")
+            continue
+        started = time.perf_counter()
+        found = []
+        for img in pages:
+            found, _ = _decode_localized(img, decoders, options["localize"])
+            if found:
+                break
+        decode_times.append(time.perf_counter() - started)
+        raw = found[0] if found else ""
+        if raw:
+            started = time.perf_counter()
+            trim_code(raw)
+            trim_times.append(time.perf_counter() - started)
+        codes.append(raw)
+        errors.append("")
+    return {"times": decode_times, "trim_times": trim_times, "codes": codes, "errors": errors,
+            "wall": sum(decode_times)}
+
+
+def _stage_extract(paths: List[str], poppler_path: str | None, options: Dict) -> Dict:
+    times, codes, errors = [], [], []
+    for path in paths:
+        started = time.perf_counter()
+        try:
+            found = extract_tracking_from_pdf_path(path, poppler_path, first_only=True, **options)
+            error = ""
+        except Exception as e:
+            found, error = [], str(e)
+        times.append(time.perf_counter() - started)
+        codes.append(found[0] if found else "")
+        errors.append(error)
+    return {"times": times, "codes": codes, "errors": errors, "wall": sum(times)}
+
+
+def _stage_pipeline(urls: List[str], poppler_path: str | None, options: Dict,
+                    download_workers: int, decode_workers: int) -> Dict:
+    rows = [None] * len(urls)
+
+    def on_result(result):
+        rows[result["index"]] = result
+
+    started = time.perf_counter()
+    run_pipeline(urls, poppler_path, on_result, options,
+                 download_workers=download_workers, decode_workers=decode_workers)
+    wall = time.perf_counter() - started
+    return {"times": [], "wall": wall,
+            "codes": [row["raw"] if row else "" for row in rows],
+            "errors": [row["error"] if row and row["error"] != "Not found" else "" for row in rows],
+            "worker_rss": peak_rss(children=True)}
+
+
+def run_stage(stage: str, paths: List[str], urls: List[str], args_dict: Dict, options: Dict) -> Dict:
+    """Chạy một tầng (trong process con riêng) -> thời gian từng PDF, lỗi, mã đọc được và peak RSS."""
+    baseline = peak_rss()
+    poppler_path = args_dict["poppler_path"]
+    if stage == "download":
+        result = _stage_download(urls, args_dict["download_workers"])
+    elif stage == "rasterize":
+        result = _stage_rasterize(paths, options["backend"], poppler_path, args_dict["dpi"])
+    elif stage == "decode":
+        result = _stage_decode(paths, options["backend"], poppler_path, args_dict["dpi"], options)
+    elif stage == "extract":
+        result = _stage_extract(paths, poppler_path, options)
+    elif stage == "pipeline":
+        result = _stage_pipeline(urls, poppler_path, options, args_dict["download_workers"],
+                                 args_dict["decode_workers"])
+    else:
+        raise ValueError(f"Unknown stage: {stage!r}")
+    result["rss"] = peak_rss()
+    result["baseline_rss"] = baseline
+    return result
+
+
+# ---------- Report ----------
+def summarize(times: List[float], wall: float, errors: List[str], rss: int | None,
+              baseline_rss: int | None, count: int | None = None) -> Dict:
+    n = count if count is not None else len(times)
+    return {
+        "n": n,
+        "errors": sum(1 for e in errors if e),
+        "throughput": n / wall if wall > 0 else None,
+        "p50_ms": None if not times else percentile(times, 50) * 1000,
+        "p95_ms": None if not times else percentile(times, 95) * 1000,
+        "peak_rss_mb": None if rss is None else rss / (1024 * 1024),
+        "baseline_rss_mb": None if baseline_rss is None else baseline_rss / (1024 * 1024),
+    }
+
+
+def accuracy(samples: List[Dict], codes: List[str], errors: List[str]) -> Dict:
+    """So mã đọc được với mã đã biết -> số đúng / sai / không thấy / lỗi, tổng và theo loại PDF."""
+    total = {"correct": 0, "wrong": 0, "missed": 0, "errors": 0, "n": 0}
+    by_kind = {}
+    for sample, raw, error in zip(samples, codes, errors):
+        outcome = "errors" if error else "correct" if raw == sample["code"] else "wrong" if raw else "missed"
+        for bucket in (total, by_kind.setdefault(sample["kind"], {"correct": 0, "n": 0})):
+            bucket["n"] += 1
+            if outcome in bucket:
+                bucket[outcome] += 1
+    total["by_kind"] = by_kind
+    return total
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(report: Dict, stream=sys.stdout):
+    print(f"{'stage':<10} {'n':>5} {'errors':>6} {'PDF/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'peak RSS MB':>12}",
+          file=stream)
+    for stage, s in report["stages"].items():
+        print(f"{stage:<10} {s['n']:>5} {s['errors']:>6} {_fmt(s['throughput'], '.1f'):>9} "
+              f"{_fmt(s['p50_ms'], '.3f'):>9} {_fmt(s['p95_ms'], '.3f'):>9} {_fmt(s['peak_rss_mb'], '.1f'):>12}",
+              file=stream)
+    for stage, acc in report["accuracy"].items():
+        pct = 100 * acc["correct"] / acc["n"] if acc["n"] else 0.0
+        kinds = ", ".join(f"{k} {v['correct']}/{v['n']}" for k, v in sorted(acc["by_kind"].items()))
+        print(f"accuracy {stage:<9} {acc['correct']}/{acc['n']} ({pct:.1f}%)  wrong {acc['wrong']}  "
+              f"missed {acc['missed']}  errors {acc['errors']}  [{kinds}]", file=stream)
+
+
+# ---------- Run ----------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python bench.py", description="Benchmark PDF Barcode Reader (offline)")
+    parser.add_argument("-n", "--count", type=int, default=DEFAULT_COUNT, help="Số PDF sinh ra")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--kinds", default=",".join(KINDS), help="Các loại PDF, vd. vector,raster-skew")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Các tầng cần đo")
+    parser.add_argument("--corpus", default=None, help="Thư mục ghi bộ PDF (giữ lại sau khi chạy); mặc định thư mục tạm")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi request HTTP")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="DPI của tầng rasterize / decode")
+    parser.add_argument("--download-workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS)
+    parser.add_argument("--decode-workers", type=int, default=DEFAULT_DECODE_WORKERS)
+    parser.add_argument("--backend", choices=RENDER_BACKENDS, default=RENDER_BACKEND)
+    parser.add_argument("--symbologies", default=",".join(SYMBOLOGIES))
+    parser.add_argument("--decoders", default=",".join(DECODERS))
+    parser.add_argument("--no-localize", action="store_true", default=not LOCALIZE)
+    parser.add_argument("--no-text-first", action="store_true", default=not TEXT_FIRST)
+    parser.add_argument("--poppler-path", default=get_poppler_path())
+    parser.add_argument("--json", default=None, help="Ghi kết quả chi tiết ra file JSON")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    kinds = tuple(k for k in args.kinds.split(",") if k)
+    stages = [s for s in STAGES if s in args.stages.split(",")]
+    unknown = [k for k in kinds if k not in KINDS] + [s for s in args.stages.split(",") if s and s not in STAGES]
+    if unknown or not kinds or args.count <= 0:
+        print(f"error: invalid --kinds / --stages / --count: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    try:
+        options = {"backend": args.backend, "symbologies": parse_symbologies(args.symbologies),
+                   "decoders": parse_decoders(args.decoders), "localize": not args.no_localize,
+                   "text_first": not args.no_text_first}
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="pdf_barcode_bench_")
+    try:
+        started = time.perf_counter()
+        samples = build_corpus(corpus_dir, args.count, args.seed, kinds)
+        print(f"Corpus: {len(samples)} PDF in {corpus_dir} ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+        paths = [os.path.join(corpus_dir, s["name"]) for s in samples]
+        args_dict = {"poppler_path": args.poppler_path, "dpi": args.dpi,
+                     "download_workers": args.download_workers, "decode_workers": args.decode_workers}
+        report = {"config": {**vars(args), "options": options}, "stages": {}, "accuracy": {}}
+        context = multiprocessing.get_context("spawn")
+        with LabelServer(corpus_dir, latency=args.latency_ms / 1000) as server:
+            urls = [server.url(s["name"]) for s in samples]
+            for stage in stages:
+                if stage == "trim":
+                    continue  # đo chung process với decode
+                print(f"... {stage}", file=sys.stderr)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_stage, stage, paths, urls, args_dict, options).result()
+                rss = result["rss"]
+                if result.get("worker_rss") is not None:
+                    rss = max(rss or 0, result["worker_rss"])
+                count = len(samples) if stage == "pipeline" else None
+                report["stages"][stage] = summarize(result["times"], result["wall"], result["errors"], rss,
+                                                    result["baseline_rss"], count)
+                if stage == "decode" and "trim" in stages:
+                    trim_times = result["trim_times"]
+                    report["stages"]["trim"] = summarize(trim_times, sum(trim_times), [], result["rss"],
+                                                         result["baseline_rss"])
+                if "codes" in result:
+                    report["accuracy"][stage] = accuracy(samples, result["codes"], result["errors"])
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
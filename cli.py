@@ -0,0 +1,232 @@
+"""Chạy batch không cần giao diện.
+
+    python -m cli batch urls.txt -o out.jsonl
+    cat urls.txt | python -m cli batch - -o - --format csv
+
+Mỗi dòng kết quả được ghi ra ngay khi xử lý xong (theo thứ tự hoàn thành, có cột index),
+URL được đọc dần từ input nên bộ nhớ không tăng theo kích thước batch.
+
+Mỗi batch có một job ID (in ra stderr) và một journal trên đĩa; bị ngắt giữa chừng thì chạy lại
+với `--job-id <id>` để bỏ qua các dòng đã xong (chúng được ghi lại ra output trước) và chỉ xử lý
+phần còn lại. Batch chạy hết mà không có dòng lỗi thì journal bị xóa.
+
+Mỗi dòng input là URL hoặc đường dẫn local: file PDF, thư mục (quét đệ quy) hoặc file ZIP, đọc thẳng
+từ đĩa không qua HTTP. Link thư mục Google Drive (chia sẻ công khai) được mở rộng thành các file PDF
+bên trong. URL trùng
+(kể cả các link khác nhau tới cùng file Drive) và PDF trùng nội dung chỉ được xử lý một lần, các dòng
+trùng vẫn có dòng kết quả riêng với cột duplicate_of (tắt bằng --no-dedup).
+
+Với --multi-label, một PDF nhiều nhãn (vd. mỗi trang một nhãn) được tải + render một lần và ghi ra
+mỗi số tracking một dòng (cùng index, thêm label / page / box).
+
+Các số --download-workers / --per-host-limit / --decode-workers là mức tối đa: host trả 429 / hết quota
+Drive thì số request tới host đó tự giảm và chờ theo Retry-After, máy thiếu RAM / CPU thì decode ít lại
+(giới hạn hiện tại được in kèm dòng tiến độ); --no-adaptive để luôn chạy đúng các số đã cho.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, TextIO
+
+from concurrency import ConcurrencyController, format_limits
+from extractor import (DECODERS, DPI_LADDER, EMBEDDED_IMAGES, LOCALIZE, RENDER_BACKEND, RENDER_BACKENDS, SYMBOLOGIES,
+                       TEXT_FIRST, parse_decoders, parse_dpi_ladder, parse_roi, parse_symbologies)
+from fetcher import MAX_PDF_SIZE, MAX_RETRIES, PER_HOST_LIMIT, REQUEST_TIMEOUT, RETRY_BACKOFF
+from job_journal import JobJournal, is_completed, new_job_id
+from local_files import expand_inputs
+from metrics import RunMetrics, export_metrics, format_summary
+from pipeline import DEFAULT_DECODE_WORKERS, DEFAULT_DOWNLOAD_WORKERS, METRIC_FIELDS, label_rows, run_pipeline
+from result_cache import ResultCache
+from rules import load_rules
+
+# ---------- Cấu hình ----------
+BUNDLED_POPPLER_DIRNAME = "poppler_bin"
+CSV_COLUMNS = ["index", "url", "raw", "trimmed", "carrier", "error", "label", "page", "box", "source", "dpi",
+               "region", "decoder", "cached", "duplicate_of", *METRIC_FIELDS]
+
+
+# ---------- Helpers ----------
+def get_poppler_path() -> str | None:
+    """poppler_bin cạnh source nếu có, không thì dùng poppler trong PATH."""
+    poppler_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), BUNDLED_POPPLER_DIRNAME)
+    return poppler_dir if os.path.exists(poppler_dir) else None
+
+
+def iter_urls(stream: TextIO) -> Iterator[str]:
+    """Đọc dần từng URL, bỏ dòng trống (giống ô nhập của hai UI)."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+class RowWriter:
+    """Ghi từng dòng kết quả ra JSONL hoặc CSV và flush ngay."""
+
+    def __init__(self, stream: TextIO, fmt: str):
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, row: Dict):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+# ---------- Commands ----------
+def cmd_batch(args) -> int:
+    try:
+        dpi_ladder = parse_dpi_ladder(args.dpi)
+        roi = parse_roi(args.roi)
+        symbologies = parse_symbologies(args.symbologies)
+        decoders = parse_decoders(args.decoders)
+        rules = load_rules(args.rules) if args.rules else None
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    extract_options = {"dpi_ladder": dpi_ladder, "roi": roi,
+                       "text_first": not args.no_text_first, "embedded": not args.no_embedded,
+                       "localize": not args.no_localize, "multi_label": args.multi_label, "rules": rules,
+                       "backend": args.backend, "symbologies": symbologies, "decoders": decoders}
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    try:
+        journal = JobJournal(args.job_id or new_job_id(), args.jobs_dir)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    cache = None if args.no_cache else ResultCache(args.cache_path)
+
+    in_stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    out_stream = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    writer = RowWriter(out_stream, fmt)
+    started = time.time()
+    metrics = RunMetrics()
+    controller = ConcurrencyController(args.download_workers, args.decode_workers, args.per_host_limit,
+                                       adaptive=not args.no_adaptive)
+
+    failed = 0
+    finished = False
+
+    def emit(result):
+        nonlocal failed
+        if not is_completed(result):
+            failed += 1
+        for row in label_rows(result):
+            writer.write(row)
+        metrics.add(result)
+        if not args.quiet and metrics.rows % 100 == 0:
+            print(f"... {metrics.rows} rows ({format_limits(controller.snapshot())})", file=sys.stderr)
+
+    def on_result(result):
+        journal.append(result)
+        emit(result)
+
+    # Luôn in job ID (kể cả -q): cần nó để chạy tiếp khi bị ngắt
+    resumed = f" (resuming, {len(journal)} rows already done)" if len(journal) else ""
+    print(f"Job ID: {journal.job_id}{resumed}", file=sys.stderr)
+
+    try:
+        for row in journal.completed_rows():
+            emit(row)
+        run_pipeline(expand_inputs(iter_urls(in_stream)), args.poppler_path, on_result, extract_options,
+                     download_workers=args.download_workers, decode_workers=args.decode_workers,
+                     queue_size=args.queue_size, per_host_limit=args.per_host_limit,
+                     request_timeout=args.timeout, cache=cache, bypass_cache=args.bypass_cache,
+                     retries=args.retries, retry_backoff=args.retry_backoff,
+                     max_pdf_size=int(args.max_size_mb * 1024 * 1024) if args.max_size_mb > 0 else None,
+                     skip=journal.is_done, dedup=not args.no_dedup, controller=controller)
+        finished = True
+    finally:
+        # Xong trọn vẹn thì bỏ journal; còn dòng lỗi hoặc bị ngắt thì giữ để chạy tiếp với --job-id
+        if finished and not failed:
+            journal.discard()
+        else:
+            journal.close()
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+        if cache is not None:
+            cache.close()
+
+    summary = metrics.summary(time.time() - started)
+    if args.metrics:
+        export_metrics(summary, args.metrics)
+    if not args.quiet:
+        print(f"Done: {summary['rows']} rows, {summary['outcomes']['found']} found, "
+              f"{summary['outcomes']['error']} errors in {time.time() - started:.1f}s", file=sys.stderr)
+        print(format_summary(summary), file=sys.stderr)
+    return 0
+
+
+# ---------- Run ----------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="PDF Barcode Batch Reader (headless)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("batch", help="Đọc barcode cho danh sách URL (file hoặc stdin)")
+    p.add_argument("input", help="File URL, mỗi dòng một link; '-' = stdin")
+    p.add_argument("-o", "--output", default="-", help="File kết quả; '-' = stdout (mặc định)")
+    p.add_argument("--format", choices=["jsonl", "csv"], help="Mặc định theo đuôi file output, còn lại là jsonl")
+    p.add_argument("--download-workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS)
+    p.add_argument("--decode-workers", type=int, default=DEFAULT_DECODE_WORKERS)
+    p.add_argument("--queue-size", type=int, default=None, help="Số PDF đã tải chờ decode tối đa")
+    p.add_argument("--per-host-limit", type=int, default=PER_HOST_LIMIT)
+    p.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="Timeout mỗi request (giây)")
+    p.add_argument("--retries", type=int, default=MAX_RETRIES, help="Số lần thử lại khi lỗi mạng tạm thời")
+    p.add_argument("--retry-backoff", type=float, default=RETRY_BACKOFF,
+                   help="Thời gian chờ trước lần thử lại đầu tiên (giây), gấp đôi mỗi lần")
+    p.add_argument("--max-size-mb", type=float, default=MAX_PDF_SIZE / (1024 * 1024),
+                   help="Hủy tải PDF lớn hơn mức này (MB); 0 = không giới hạn")
+    p.add_argument("--dpi", default=",".join(str(d) for d in DPI_LADDER), help="Thang DPI, vd. 120,200,300")
+    p.add_argument("--roi", default="", help="Vùng ưu tiên left,top,right,bottom theo tỉ lệ trang")
+    p.add_argument("--no-text-first", action="store_true", default=not TEXT_FIRST,
+                   help="Không đọc text layer trước khi render")
+    p.add_argument("--no-embedded", action="store_true", default=not EMBEDDED_IMAGES,
+                   help="Không decode thẳng ảnh nhúng")
+    p.add_argument("--no-localize", action="store_true", default=not LOCALIZE,
+                   help="Không khoanh vùng barcode trước, luôn quét cả trang")
+    p.add_argument("--multi-label", action="store_true",
+                   help="PDF gồm nhiều nhãn: ghi mọi số tracking (mỗi mã một dòng, kèm trang + vị trí), không dùng cache")
+    p.add_argument("--rules", default=None,
+                   help="File JSON bảng luật chọn + cắt mã (xem rules.py); mặc định rules.DEFAULT_RULES")
+    p.add_argument("--backend", choices=RENDER_BACKENDS, default=RENDER_BACKEND,
+                   help="Backend render: poppler (mặc định) hoặc pdfium (cần cài pypdfium2)")
+    p.add_argument("--symbologies", default=",".join(SYMBOLOGIES),
+                   help="Chỉ đọc các loại mã này, vd. CODE128,QRCODE; '' = mọi loại")
+    p.add_argument("--decoders", default=",".join(DECODERS),
+                   help="Thứ tự thử decoder, vd. zbar,zxing (zxing cần cài zxing-cpp, chưa cài thì bỏ qua)")
+    p.add_argument("--poppler-path", default=get_poppler_path())
+    p.add_argument("--no-dedup", action="store_true",
+                   help="Xử lý cả các URL trùng / PDF trùng nội dung thay vì dùng lại kết quả của bản đầu tiên")
+    p.add_argument("--no-adaptive", action="store_true",
+                   help="Giữ cố định số luồng tải / request mỗi host / process decode (không tự điều chỉnh)")
+    p.add_argument("--no-cache", action="store_true", help="Không dùng cache kết quả")
+    p.add_argument("--bypass-cache", action="store_true", help="Không đọc cache (vẫn ghi kết quả mới)")
+    p.add_argument("--cache-path", default=None, help="File SQLite của cache (mặc định trong thư mục cache của user)")
+    p.add_argument("--job-id", default=None,
+                   help="Chạy tiếp job đã có (bỏ qua các dòng đã xong); mặc định tạo job mới")
+    p.add_argument("--jobs-dir", default=None, help="Thư mục chứa journal của các job")
+    p.add_argument("--metrics", default=None,
+                   help="Ghi số đo theo tầng của batch ra file: .json -> JSON, còn lại -> Prometheus text")
+    p.add_argument("-q", "--quiet", action="store_true", help="Không in tiến độ ra stderr")
+    p.set_defaults(func=cmd_batch)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
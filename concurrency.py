@@ -0,0 +1,244 @@
+"""Điều chỉnh số request tải / số PDF decode đồng thời theo những gì quan sát được trong lúc chạy.
+
+- Tải: mỗi host có một AdaptiveLimit (tối đa `per_host_limit`) theo kiểu AIMD. Host trả 429 / hết quota
+  (403 của Drive) / lỗi mạng -> giảm một nửa và cả host tạm nghỉ theo Retry-After; đủ một lượt request
+  thành công mà thời gian chờ header không tăng quá LATENCY_TOLERANCE lần mức tốt nhất -> tăng thêm 1.
+- Decode: số PDF decode cùng lúc (tối đa `decode_workers`) giảm khi RAM còn trống ít hoặc máy đang quá tải
+  (load average trên số CPU), tăng lại dần khi có chỗ trống. Cần psutil, hoặc /proc/meminfo + os.getloadavg
+  (Linux); không đo được thì giữ nguyên mức tối đa.
+- snapshot() / format_limits(): giới hạn hiện tại để các UI hiển thị trực tiếp.
+"""
+import os
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+try:
+    import psutil
+except ImportError:  # psutil là tùy chọn: không có thì đọc /proc/meminfo + os.getloadavg nếu được
+    psutil = None
+
+# ---------- Cấu hình ----------
+# Giảm theo cấp số nhân khi bị chặn / lỗi, nhưng không quá một lần mỗi DECREASE_INTERVAL giây
+# (một loạt 429 cùng lúc chỉ tính là một lần)
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 2.0
+# Thời gian chờ header (ms, trung bình trượt) vượt quá LATENCY_TOLERANCE x mức tốt nhất thì không tăng nữa
+LATENCY_TOLERANCE = 2.0
+LATENCY_SMOOTHING = 0.2
+# Số decode đồng thời được xem xét lại mỗi ADJUST_INTERVAL giây
+ADJUST_INTERVAL = 2.0
+# RAM còn trống (tỉ lệ) dưới LOW_MEMORY -> giảm một nửa; trên COMFORT_MEMORY (và máy không quá tải) -> tăng 1
+LOW_MEMORY = 0.10
+COMFORT_MEMORY = 0.25
+# Load average / số CPU vượt CPU_OVERLOAD -> giảm 1 (máy đang bận việc khác ngoài batch này)
+CPU_OVERLOAD = 1.5
+
+
+# ---------- Limits ----------
+class AdaptiveLimit:
+    """Semaphore đổi được số slot khi đang chạy; giảm thì các slot đang dùng vẫn chạy nốt."""
+
+    def __init__(self, limit: int, max_limit: int | None = None):
+        self.max_limit = max(1, max_limit or limit)
+        self._limit = min(max(1, limit), self.max_limit)
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def set(self, limit: int) -> int:
+        with self._cond:
+            self._limit = min(max(1, int(limit)), self.max_limit)
+            self._cond.notify_all()
+            return self._limit
+
+    def acquire(self):
+        with self._cond:
+            while self._in_use >= self._limit:
+                self._cond.wait()
+            self._in_use += 1
+
+    def release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _HostState:
+    def __init__(self, limit: int):
+        self.slots = AdaptiveLimit(limit)
+        self.cool_until = 0.0
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.latency_ms = None
+        self.best_latency_ms = None
+        self.rate_limited = 0
+        self.errors = 0
+
+
+def system_headroom() -> Dict:
+    """{"memory": tỉ lệ RAM còn trống, "load": load average 1 phút / số CPU}; không đo được -> None."""
+    memory = load = None
+    cpus = os.cpu_count() or 1
+    if psutil is not None:
+        try:
+            vm = psutil.virtual_memory()
+            memory = vm.available / vm.total
+            load = psutil.getloadavg()[0] / cpus
+        except Exception:
+            pass
+    if memory is None:
+        try:
+            with open("/proc/meminfo") as f:
+                info = dict(line.split(":", 1) for line in f)
+            memory = int(info["MemAvailable"].split()[0]) / int(info["MemTotal"].split()[0])
+        except (OSError, KeyError, ValueError):
+            pass
+    if load is None and hasattr(os, "getloadavg"):
+        try:
+            load = os.getloadavg()[0] / cpus
+        except OSError:
+            pass
+    return {"memory": memory, "load": load}
+
+
+# ---------- Controller ----------
+class ConcurrencyController:
+    """Giới hạn tải (theo host) và decode của một batch, tự điều chỉnh khi adaptive=True.
+
+    Fetcher gọi host_slot() / wait_host() quanh mỗi request và báo lại kết quả qua record_success(),
+    record_rate_limited(), record_error(); pipeline hỏi decode_limit() trước khi gửi thêm PDF đi decode.
+    adaptive=False: giữ nguyên các mức tối đa (vẫn tôn trọng Retry-After của host).
+    Dùng được từ nhiều thread cùng lúc.
+    """
+
+    def __init__(self, download_workers: int, decode_workers: int, per_host_limit: int, adaptive: bool = True):
+        self.download_workers = max(1, download_workers)
+        self.decode_max = max(1, decode_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.adaptive = adaptive
+        self._decode = self.decode_max
+        self._last_adjust = 0.0
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url: str) -> _HostState:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.per_host_limit)
+            return state
+
+    # --- Tải ---
+    def host_slot(self, url: str) -> AdaptiveLimit:
+        return self._host(url).slots
+
+    def wait_host(self, url: str):
+        """Host đang tạm nghỉ (vừa trả 429 / hết quota) -> chờ hết thời gian nghỉ trước khi gửi request."""
+        state = self._host(url)
+        while True:
+            delay = state.cool_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 1.0))
+
+    def record_success(self, url: str, latency_ms: float):
+        state = self._host(url)
+        with self._lock:
+            state.latency_ms = latency_ms if state.latency_ms is None else (
+                (1 - LATENCY_SMOOTHING) * state.latency_ms + LATENCY_SMOOTHING * latency_ms)
+            if state.best_latency_ms is None or state.latency_ms < state.best_latency_ms:
+                state.best_latency_ms = state.latency_ms
+            state.successes += 1
+            # Tăng 1 sau mỗi lượt thành công trọn vẹn (số request bằng giới hạn hiện tại)
+            if not self.adaptive or state.successes < state.slots.limit:
+                return
+            state.successes = 0
+            if state.latency_ms <= LATENCY_TOLERANCE * state.best_latency_ms:
+                state.slots.set(state.slots.limit + 1)
+
+    def _decrease(self, state: _HostState):
+        now = time.monotonic()
+        state.successes = 0
+        if self.adaptive and now - state.last_decrease >= DECREASE_INTERVAL:
+            state.last_decrease = now
+            state.slots.set(int(state.slots.limit * DECREASE_FACTOR))
+
+    def record_rate_limited(self, url: str, delay: float):
+        """Host trả 429 / hết quota: giảm giới hạn và cho cả host nghỉ `delay` giây."""
+        state = self._host(url)
+        with self._lock:
+            state.rate_limited += 1
+            state.cool_until = max(state.cool_until, time.monotonic() + delay)
+            self._decrease(state)
+
+    def record_error(self, url: str):
+        """Lỗi mạng / timeout / 5xx: coi như host đang quá tải."""
+        state = self._host(url)
+        with self._lock:
+            state.errors += 1
+            self._decrease(state)
+
+    # --- Decode ---
+    def decode_limit(self) -> int:
+        """Số PDF tối đa đang decode cùng lúc, xem lại theo RAM / CPU mỗi ADJUST_INTERVAL giây."""
+        if not self.adaptive:
+            return self.decode_max
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_adjust < ADJUST_INTERVAL:
+                return self._decode
+            self._last_adjust = now
+        headroom = system_headroom()
+        memory, load = headroom["memory"], headroom["load"]
+        with self._lock:
+            if memory is not None and memory < LOW_MEMORY:
+                self._decode = max(1, int(self._decode * DECREASE_FACTOR))
+            elif load is not None and load > CPU_OVERLOAD:
+                self._decode = max(1, self._decode - 1)
+            elif (memory is None or memory > COMFORT_MEMORY) and (load is None or load <= 1.0):
+                self._decode = min(self.decode_max, self._decode + 1)
+            return self._decode
+
+    # --- Hiển thị ---
+    def snapshot(self) -> Dict:
+        """Giới hạn hiện tại: {"download", "download_max", "decode", "decode_max", "hosts": {...},
+        "rate_limited", "errors"}; hosts[host] = {"limit", "in_use", "latency_ms", "cool_down" (giây còn nghỉ)}."""
+        now = time.monotonic()
+        with self._lock:
+            hosts = {host: {"limit": s.slots.limit, "in_use": s.slots.in_use,
+                            "latency_ms": None if s.latency_ms is None else round(s.latency_ms, 1),
+                            "cool_down": round(max(0.0, s.cool_until - now), 1)}
+                     for host, s in self._hosts.items() if host}
+            rate_limited = sum(s.rate_limited for s in self._hosts.values())
+            errors = sum(s.errors for s in self._hosts.values())
+            decode = self._decode if self.adaptive else self.decode_max
+        download = min(self.download_workers, sum(h["limit"] for h in hosts.values())) if hosts else self.download_workers
+        return {"download": download, "download_max": self.download_workers, "decode": decode,
+                "decode_max": self.decode_max, "hosts": hosts, "rate_limited": rate_limited, "errors": errors}
+
+
+def format_limits(snapshot: Dict) -> str:
+    """Một dòng cho thanh trạng thái, vd. "download 6/16 · decode 4/8 · 429/403: 3 (drive.usercontent... paused 12s)"."""
+    parts = [f"download {snapshot['download']}/{snapshot['download_max']}",
+             f"decode {snapshot['decode']}/{snapshot['decode_max']}"]
+    if snapshot["rate_limited"]:
+        paused = [f"{host} paused {h['cool_down']:.0f}s" for host, h in snapshot["hosts"].items() if h["cool_down"] > 0]
+        parts.append(f"429/403: {snapshot['rate_limited']}" + (f" ({', '.join(paused)})" if paused else ""))
+    return " · ".join(parts)
@@ -0,0 +1,140 @@
+"""Google Drive: tải thẳng từ host download, vượt trang cảnh báo virus-scan, mở rộng link thư mục.
+
+- direct_download_url(): link file Drive (mọi dạng) -> link tải trên drive.usercontent.google.com, không qua
+  bước redirect của drive.google.com/uc; confirm=t để file lớn khỏi bị chặn bởi trang cảnh báo.
+- find_confirm_url(): Drive vẫn trả về trang HTML cảnh báo ("can't scan this file for viruses") thì lấy
+  link xác nhận trong trang đó để tải tiếp trên cùng session (cookie của trang cảnh báo được giữ lại).
+- expand_drive_folders(): link thư mục Drive (chia sẻ công khai) -> link từng file PDF trong đó.
+"""
+import html
+import re
+from typing import Iterable, Iterator, List, Tuple
+from urllib.parse import parse_qs, urlencode, urljoin, urlsplit
+
+import requests
+
+# ---------- Cấu hình ----------
+DRIVE_HOSTS = ("drive.google.com", "docs.google.com", "drive.usercontent.google.com")
+DIRECT_DOWNLOAD_URL = "https://drive.usercontent.google.com/download"
+# Trang liệt kê thư mục công khai, không cần API key
+FOLDER_VIEW_URL = "https://drive.google.com/embeddedfolderview"
+FOLDER_TIMEOUT = 30
+# Mở rộng cả thư mục con, tối đa MAX_FOLDER_DEPTH cấp
+MAX_FOLDER_DEPTH = 3
+# Trang cảnh báo chỉ vài chục KB; đọc tối đa chừng này để tìm link xác nhận
+INTERSTITIAL_MAX_BYTES = 1024 * 1024
+
+
+# ---------- Links ----------
+def is_drive_url(url: str) -> bool:
+    return urlsplit(url).netloc.lower() in DRIVE_HOSTS
+
+
+def drive_file_id(url: str) -> str | None:
+    """ID file trong link Drive (/file/d/<id>, open?id=, uc?id=, download?id=), không phải link Drive -> None."""
+    if not is_drive_url(url):
+        return None
+    match = re.search(r"/file/d/([^/?#]+)", url)
+    if match:
+        return match.group(1)
+    parts = urlsplit(url)
+    if parts.path.rstrip("/") in ("/open", "/uc", "/download"):
+        ids = parse_qs(parts.query).get("id")
+        if ids:
+            return ids[0]
+    return None
+
+
+def drive_folder_id(url: str) -> str | None:
+    """ID thư mục trong link Drive (/drive/folders/<id>, folderview?id=), không phải thư mục -> None."""
+    if not is_drive_url(url):
+        return None
+    match = re.search(r"/folders/([^/?#]+)", url)
+    if match:
+        return match.group(1)
+    parts = urlsplit(url)
+    if parts.path.rstrip("/") in ("/folderview", "/embeddedfolderview"):
+        ids = parse_qs(parts.query).get("id")
+        if ids:
+            return ids[0]
+    return None
+
+
+def direct_download_url(url: str) -> str:
+    """Link file Drive -> link tải trực tiếp (bỏ qua redirect + trang cảnh báo); link khác giữ nguyên."""
+    file_id = drive_file_id(url)
+    if file_id is None:
+        return url
+    params = {"id": file_id, "export": "download", "confirm": "t"}
+    resource_key = parse_qs(urlsplit(url).query).get("resourcekey")
+    if resource_key:
+        params["resourcekey"] = resource_key[0]
+    return f"{DIRECT_DOWNLOAD_URL}?{urlencode(params)}"
+
+
+# ---------- Virus-scan interstitial ----------
+def find_confirm_url(page: str, base_url: str) -> str | None:
+    """Link tải tiếp trong trang cảnh báo của Drive, không tìm thấy (trang lỗi / hết quota...) -> None."""
+    # Dạng hiện tại: <form id="download-form" action="..."> với các input ẩn id, export, confirm, uuid
+    form = re.search(r"<form\b[^>]*\bid=\"download-form\"[^>]*>(.*?)</form>", page, re.S | re.I)
+    if form:
+        action = re.search(r"\baction=\"([^\"]+)\"", form.group(0), re.I)
+        fields = {}
+        for tag in re.finditer(r"<input\b[^>]*>", form.group(1), re.I):
+            name = re.search(r"\bname=\"([^\"]*)\"", tag.group(0))
+            value = re.search(r"\bvalue=\"([^\"]*)\"", tag.group(0))
+            if name:
+                fields[html.unescape(name.group(1))] = html.unescape(value.group(1)) if value else ""
+        if action and fields:
+            return urljoin(base_url, html.unescape(action.group(1))) + "?" + urlencode(fields)
+    # Dạng cũ: link /uc?export=download&confirm=<token>&id=...
+    link = re.search(r"href=\"(/uc\?export=download[^\"]*confirm=[^\"]+)\"", page)
+    if link:
+        return urljoin("https://drive.google.com", html.unescape(link.group(1)))
+    token = re.search(r"confirm=([0-9A-Za-z_-]+)", page)
+    file_id = drive_file_id(base_url)
+    if token and file_id:
+        return f"{DIRECT_DOWNLOAD_URL}?{urlencode({'id': file_id, 'export': 'download', 'confirm': token.group(1)})}"
+    return None
+
+
+# ---------- Folders ----------
+def list_folder(folder_id: str, session: requests.Session | None = None,
+                depth: int = MAX_FOLDER_DEPTH) -> List[Tuple[str, str]]:
+    """Các file PDF trong thư mục Drive công khai (kể cả thư mục con) -> [(link file, tên file)], theo tên."""
+    session = session or requests.Session()
+    resp = session.get(FOLDER_VIEW_URL, params={"id": folder_id}, timeout=FOLDER_TIMEOUT)
+    resp.raise_for_status()
+    files = []
+    for entry in re.finditer(
+            r"<div class=\"flip-entry\" id=\"entry-([^\"]+)\".*?<a href=\"([^\"]+)\".*?"
+            r"<div class=\"flip-entry-title\">(.*?)</div>", resp.text, re.S):
+        entry_id, href, name = entry.group(1), html.unescape(entry.group(2)), html.unescape(entry.group(3)).strip()
+        if "/folders/" in href:
+            if depth > 0:
+                files.extend((url, f"{name}/{child}") for url, child in list_folder(entry_id, session, depth - 1))
+        elif name.lower().endswith(".pdf"):
+            files.append((f"https://drive.google.com/file/d/{entry_id}/view", name))
+    return sorted(files, key=lambda f: f[1].lower())
+
+
+def expand_drive_folders(urls: Iterable[str], session: requests.Session | None = None) -> Iterator[str]:
+    """Thay mỗi link thư mục Drive bằng link các file PDF trong đó (đọc dần, link khác giữ nguyên).
+
+    Thư mục không liệt kê được (chưa chia sẻ công khai, lỗi mạng) hoặc không có PDF thì giữ nguyên link,
+    dòng kết quả của nó sẽ báo lỗi thay vì bị bỏ qua âm thầm.
+    """
+    session = session or requests.Session()
+    for url in urls:
+        folder_id = drive_folder_id(url)
+        if folder_id is None:
+            yield url
+            continue
+        try:
+            files = list_folder(folder_id, session)
+        except Exception:
+            files = []
+        if not files:
+            yield url
+        for file_url, _ in files:
+            yield file_url
@@ -0,0 +1,841 @@
+import functools
+import importlib.util
+import math
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from pdf2image import pdfinfo_from_path
+from pdf2image.parsers import parse_buffer_to_pgm, parse_buffer_to_ppm
+from pyzbar.pyzbar import ZBarSymbol, decode
+from PIL import Image
+
+from localizer import crop_region, find_barcode_regions
+
+# ---------- Cấu hình ----------
+DEFAULT_DPI = 300
+# Thang DPI: render ở DPI thấp trước, chỉ render lại ở DPI cao hơn khi trang chưa đọc được barcode
+DPI_LADDER = (120, 200, DEFAULT_DPI)
+# pyzbar tự chuyển ảnh về xám 8-bit, nên yêu cầu poppler render thẳng ảnh xám
+GRAYSCALE = True
+# Vùng ưu tiên (left, top, right, bottom) theo tỉ lệ trang, vd. 1/3 phía trên nơi có barcode tracking
+ROI_TOP_THIRD = (0.0, 0.0, 1.0, 1 / 3)
+DEFAULT_ROI = None
+# Đọc text layer (pdftotext) trước khi rasterize; chỉ chấp nhận chuỗi có dạng payload barcode
+TEXT_FIRST = True
+TEXT_PATTERNS = [
+    ("9631", r"9631\d{18,30}"),
+    ("usps-impb", r"420\d{5}(?:\d{4})?9[2-5]\d{20}"),
+    ("ups-1z", r"1Z[0-9A-Z]{16}"),
+]
+# Trang chỉ có một ảnh phủ >= 80% diện tích -> decode thẳng ảnh nhúng ở độ phân giải gốc
+EMBEDDED_IMAGES = True
+DOMINANT_IMAGE_COVERAGE = 0.8
+# Backend render: "poppler" (pdfinfo/pdftoppm/pdftotext/pdfimages, mỗi lệnh một process)
+# hoặc "pdfium" (pypdfium2, cài thêm nếu cần: mở PDF một lần và render ngay trong process decode)
+RENDER_BACKENDS = ("poppler", "pdfium")
+RENDER_BACKEND = "poppler"
+# Chỉ quét các loại mã vạch này (mã tracking trên nhãn là Code 128); () = quét mọi loại
+SYMBOLOGIES = ("CODE128",)
+# Decoder được thử lần lượt, rẻ trước: "zbar" (pyzbar) rồi "zxing" (zxing-cpp, cài thêm nếu cần);
+# decoder sau chỉ chạy khi decoder trước không đọc được gì, decoder chưa cài thì bỏ qua
+DECODERS = ("zbar", "zxing")
+# Tên loại mã (theo zbar) -> tên trong zxing-cpp
+ZXING_FORMATS = {
+    "CODE128": "Code128", "CODE39": "Code39", "CODE93": "Code93", "CODABAR": "Codabar", "I25": "ITF",
+    "EAN13": "EAN13", "EAN8": "EAN8", "UPCA": "UPCA", "UPCE": "UPCE", "DATABAR": "DataBar",
+    "QRCODE": "QRCode", "PDF417": "PDF417", "DATAMATRIX": "DataMatrix",
+}
+# Khi chỉ cần mã đầu tiên: tìm vùng nghi là barcode trên ảnh thu nhỏ (localizer, cần NumPy) rồi chỉ
+# decode các vùng đó ở độ phân giải gốc (xoay thẳng nếu nghiêng); không vùng nào đọc được mới quét cả ảnh
+LOCALIZE = True
+
+
+# ---------- Helpers ----------
+def parse_dpi_ladder(text: str) -> Tuple[int, ...]:
+    """'120, 200, 300' -> (120, 200, 300), loại trùng và sắp xếp tăng dần."""
+    values = sorted({int(p) for p in re.split(r"[\s,;>→]+", text.strip()) if p})
+    if not values or values[0] <= 0:
+        raise ValueError(f"Invalid DPI ladder: {text!r}")
+    return tuple(values)
+
+
+def parse_roi(text: str) -> Tuple[float, float, float, float] | None:
+    """'0, 0, 1, 0.33' -> (left, top, right, bottom) theo tỉ lệ trang; chuỗi rỗng -> None."""
+    if not text.strip():
+        return None
+    values = tuple(float(p) for p in re.split(r"[\s,;]+", text.strip()) if p)
+    if len(values) != 4:
+        raise ValueError(f"Invalid ROI: {text!r}")
+    left, top, right, bottom = values
+    if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+        raise ValueError(f"Invalid ROI: {text!r}")
+    return values
+
+
+def parse_symbologies(text: str) -> Tuple[str, ...]:
+    """'code128, qrcode' -> ("CODE128", "QRCODE"); chuỗi rỗng -> () = mọi loại."""
+    names = tuple(dict.fromkeys(p.upper() for p in re.split(r"[\s,;]+", text.strip()) if p))
+    unknown = [n for n in names if n not in ZXING_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown symbology: {', '.join(unknown)}")
+    return names
+
+
+def parse_decoders(text: str) -> Tuple[str, ...]:
+    """'zbar, zxing' -> ("zbar", "zxing") theo đúng thứ tự thử."""
+    names = tuple(dict.fromkeys(p.lower() for p in re.split(r"[\s,;>]+", text.strip()) if p))
+    if not names or any(n not in ("zbar", "zxing") for n in names):
+        raise ValueError(f"Invalid decoder list: {text!r}")
+    return names
+
+
+def new_rung_stats(dpi_ladder: Iterable[int]) -> Dict[int, Dict[str, int]]:
+    """Bộ đếm hit/miss cho từng nấc DPI."""
+    return {dpi: {"hit": 0, "miss": 0} for dpi in dpi_ladder}
+
+
+def merge_rung_stats(rows: Iterable[Dict | None]) -> Dict[int, Dict[str, int]]:
+    """Cộng dồn bộ đếm hit/miss của từng nấc DPI trên toàn bộ kết quả."""
+    total = {}
+    for r in rows:
+        if not r:
+            continue
+        for dpi, counts in (r.get("rungs") or {}).items():
+            slot = total.setdefault(int(dpi), {"hit": 0, "miss": 0})
+            slot["hit"] += counts.get("hit", 0)
+            slot["miss"] += counts.get("miss", 0)
+    return dict(sorted(total.items()))
+
+
+def format_rung_stats(rungs: Dict[int, Dict[str, int]]) -> str:
+    """{120: {'hit': 3, 'miss': 1}} -> '120dpi 3/1' (hit/miss)."""
+    return " · ".join(f"{dpi}dpi {c['hit']}/{c['miss']}" for dpi, c in sorted(rungs.items()))
+
+
+# ---------- Decoders ----------
+class ZbarDecoder:
+    """pyzbar, chỉ bật các loại mã trong allow-list (symbols=) thay vì để zbar thử mọi loại."""
+
+    name = "zbar"
+
+    def __init__(self, symbologies: Tuple[str, ...] = SYMBOLOGIES):
+        self.symbols = [getattr(ZBarSymbol, s) for s in symbologies if hasattr(ZBarSymbol, s)] or None
+        # Allow-list chỉ gồm loại zbar không đọc được (vd. DATAMATRIX) -> bỏ qua decoder này
+        self.enabled = not symbologies or self.symbols is not None
+
+    def decode(self, img: Image.Image, boxes: bool = False) -> List[str]:
+        if not self.enabled:
+            return []
+        found = []
+        for c in sorted(decode(img, symbols=self.symbols), key=lambda c: c.rect.top):
+            try:
+                s = c.data.decode("utf-8")
+            except:
+                s = c.data.decode(errors="ignore")
+            if boxes:
+                r = c.rect
+                found.append((s, _relative_box(img, r.left, r.top, r.left + r.width, r.top + r.height)))
+            else:
+                found.append(s)
+        return found
+
+
+class ZxingDecoder:
+    """zxing-cpp (tùy chọn): engine thứ hai, đọc được một số mã mờ / lệch mà zbar bỏ sót."""
+
+    name = "zxing"
+
+    def __init__(self, symbologies: Tuple[str, ...] = SYMBOLOGIES):
+        try:
+            import zxingcpp
+        except ImportError:
+            raise RuntimeError("decoder 'zxing' needs zxing-cpp (pip install zxing-cpp)")
+        self._zxing = zxingcpp
+        formats = [ZXING_FORMATS[s] for s in symbologies if s in ZXING_FORMATS]
+        self.options = {"text_mode": zxingcpp.TextMode.Plain}
+        if formats:
+            self.options["formats"] = zxingcpp.barcode_formats_from_str(",".join(formats))
+
+    def decode(self, img: Image.Image, boxes: bool = False) -> List[str]:
+        results = self._zxing.read_barcodes(img, **self.options)
+        results = [r for r in sorted(results, key=lambda r: r.position.top_left.y) if r.text]
+        if not boxes:
+            return [r.text for r in results]
+        found = []
+        for r in results:
+            p = r.position
+            xs = [p.top_left.x, p.top_right.x, p.bottom_left.x, p.bottom_right.x]
+            ys = [p.top_left.y, p.top_right.y, p.bottom_left.y, p.bottom_right.y]
+            found.append((r.text, _relative_box(img, min(xs), min(ys), max(xs), max(ys))))
+        return found
+
+
+def _relative_box(img: Image.Image, left, top, right, bottom) -> Tuple[float, float, float, float]:
+    """Khung của mã theo tỉ lệ ảnh (left, top, right, bottom trong 0..1), không phụ thuộc DPI."""
+    width, height = img.size
+    return (round(max(0, left) / width, 4), round(max(0, top) / height, 4),
+            round(min(width, right) / width, 4), round(min(height, bottom) / height, 4))
+
+
+def available_decoders() -> List[str]:
+    """Các decoder dùng được trong môi trường hiện tại (zxing cần cài zxing-cpp)."""
+    decoders = ["zbar"]
+    if importlib.util.find_spec("zxingcpp") is not None:
+        decoders.append("zxing")
+    return decoders
+
+
+@functools.lru_cache(maxsize=16)
+def get_decoders(names: Tuple[str, ...] = DECODERS, symbologies: Tuple[str, ...] = SYMBOLOGIES) -> tuple:
+    """Dựng cascade decoder theo thứ tự `names` (mỗi process dựng một lần); decoder chưa cài thì bỏ qua."""
+    decoders = []
+    for name in names:
+        if name == "zbar":
+            decoders.append(ZbarDecoder(symbologies))
+        elif name == "zxing":
+            if importlib.util.find_spec("zxingcpp") is not None:
+                decoders.append(ZxingDecoder(symbologies))
+        else:
+            raise ValueError(f"Unknown decoder: {name!r}")
+    if not decoders:
+        raise RuntimeError(f"No barcode decoder available from {', '.join(names)}")
+    return tuple(decoders)
+
+
+def _accepted(codes: List[str], accept: Callable[[str], bool] | None) -> bool:
+    return bool(codes) and (accept is None or any(accept(code) for code in codes))
+
+
+def decode_cascade(img: Image.Image, decoders: tuple, boxes: bool = False,
+                   accept: Callable[[str], bool] | None = None) -> Tuple[List[str], str | None]:
+    """Thử lần lượt từng decoder, dừng ở decoder đầu tiên đọc được -> (codes, tên decoder).
+
+    boxes=True: mỗi mã kèm khung theo tỉ lệ ảnh -> [(code, (left, top, right, bottom)), ...].
+    accept(code) -> False: mã đó không tính là đọc được (vd. barcode mã ZIP bị luật skip), decoder
+    sau vẫn được thử; không decoder nào đọc được mã nhận -> ([], None). Không dùng cùng boxes=True.
+    """
+    for decoder in decoders:
+        try:
+            codes = decoder.decode(img, boxes=boxes) if boxes else decoder.decode(img)
+        except Exception:
+            continue
+        if _accepted(codes, accept):
+            return codes, decoder.name
+    return [], None
+
+
+def decode_image(img: Image.Image, decoders: tuple | None = None) -> List[str]:
+    """Đọc barcode trên một ảnh, sắp xếp từ trên xuống dưới."""
+    return decode_cascade(img, decoders or get_decoders())[0]
+
+
+# ---------- Poppler ----------
+def _poppler_command(name: str, poppler_path: str | None) -> str:
+    if platform.system() == "Windows":
+        name = name + ".exe"
+    return os.path.join(poppler_path, name) if poppler_path else name
+
+
+def _run_poppler(name: str, args: List[str], poppler_path: str | None) -> bytes:
+    """Chạy một tool của poppler (pdftoppm, pdfinfo...) và trả về stdout."""
+    env = os.environ.copy()
+    if poppler_path:
+        env["LD_LIBRARY_PATH"] = poppler_path + os.pathsep + env.get("LD_LIBRARY_PATH", "")
+    startupinfo = None
+    if platform.system() == "Windows":
+        # Không bật cửa sổ console khi chạy dưới bản build windowed (PyInstaller)
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    proc = subprocess.run([_poppler_command(name, poppler_path)] + args, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} error: {proc.stderr.decode('utf8', 'ignore').strip()}")
+    return proc.stdout
+
+
+def get_page_count(pdf_path: str, poppler_path: str | None) -> int:
+    return pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"]
+
+
+def get_page_sizes(pdf_path: str, poppler_path: str | None, page_count: int) -> List[Tuple[float, float]]:
+    """Kích thước (rộng, cao) theo point của từng trang, đã tính cả góc xoay."""
+    info = pdfinfo_from_path(pdf_path, poppler_path=poppler_path, first_page=1, last_page=page_count)
+    sizes = {}
+    rotations = {}
+    for key, value in info.items():
+        m = re.match(r"Page\s+(\d+)\s+(size|rot)", key)
+        if not m:
+            continue
+        page = int(m.group(1))
+        if m.group(2) == "size":
+            dims = re.match(r"([\d.]+) x ([\d.]+)", str(value))
+            if dims:
+                sizes[page] = (float(dims.group(1)), float(dims.group(2)))
+        else:
+            rotations[page] = int(float(value or 0))
+    result = []
+    for page in range(1, page_count + 1):
+        w, h = sizes.get(page, (595.0, 842.0))  # mặc định A4
+        if rotations.get(page, 0) % 180 == 90:
+            w, h = h, w
+        result.append((w, h))
+    return result
+
+
+def render_pages(pdf_path: str, poppler_path: str | None, dpi: int, first_page: int | None = None,
+                 last_page: int | None = None, grayscale: bool = True,
+                 crop: Tuple[int, int, int, int] | None = None) -> List[Image.Image]:
+    """Gọi pdftoppm, đọc ảnh qua stdout (PGM nếu grayscale, PPM nếu màu).
+
+    crop = (x, y, w, h) theo pixel ở DPI đã chọn, để poppler chỉ render vùng đó.
+    """
+    args = ["-r", str(dpi)]
+    if first_page is not None:
+        args.extend(["-f", str(first_page)])
+    if last_page is not None:
+        args.extend(["-l", str(last_page)])
+    if grayscale:
+        args.append("-gray")
+    if crop is not None:
+        x, y, w, h = crop
+        args.extend(["-x", str(x), "-y", str(y), "-W", str(w), "-H", str(h)])
+    args.append(pdf_path)
+    data = _run_poppler("pdftoppm", args, poppler_path)
+    return parse_buffer_to_pgm(data) if grayscale else parse_buffer_to_ppm(data)
+
+
+def render_page(pdf_path: str, poppler_path: str | None, page: int, dpi: int, grayscale: bool = True,
+                roi: Tuple[float, float, float, float] | None = None,
+                page_size: Tuple[float, float] | None = None) -> Image.Image:
+    """Render đúng một trang (đánh số từ 1); nếu có roi thì chỉ render vùng đó của trang."""
+    crop = None
+    if roi is not None and page_size is not None:
+        w_px = page_size[0] * dpi / 72
+        h_px = page_size[1] * dpi / 72
+        left, top, right, bottom = roi
+        crop = (int(left * w_px), int(top * h_px),
+                math.ceil((right - left) * w_px), math.ceil((bottom - top) * h_px))
+    images = render_pages(pdf_path, poppler_path, dpi, page, page, grayscale, crop)
+    if not images:
+        raise RuntimeError(f"page {page} rendered no image")
+    return images[0]
+
+
+def _decode_localized(img: Image.Image, decoders, localize: bool,
+                      accept: Callable[[str], bool] | None = None) -> Tuple[List[str], str | None]:
+    """decode_cascade, nhưng thử các vùng localizer tìm được (từ trên xuống) trước khi quét cả ảnh.
+
+    Vùng chỉ đọc được mã không nhận (accept) thì tiếp tục sang vùng sau, cuối cùng là cả ảnh.
+    """
+    if localize:
+        for box, angle in find_barcode_regions(img):
+            codes, decoder = decode_cascade(crop_region(img, box, angle), decoders, accept=accept)
+            if codes:
+                return codes, decoder
+    return decode_cascade(img, decoders, accept=accept)
+
+
+def _decode_page(renderer, decoders, page, dpi_ladder, rungs, grayscale=True, roi=None, page_size=None,
+                 first_img=None, localize=False, accept=None):
+    """Decode một trang theo thang DPI, thử vùng ROI trước rồi mới đến cả trang.
+
+    first_img là ảnh cả trang đã render sẵn ở nấc đầu tiên (nếu có).
+    localize=True: mỗi ảnh render được decode theo vùng localizer tìm được trước (xem LOCALIZE).
+    accept: lượt chỉ đọc được mã không nhận tính là miss (xem decode_cascade).
+    Trả về (codes, dpi, "roi"|"page", decoder) hoặc ([], None, None, None) nếu mọi lượt đều miss.
+    """
+    passes = [("roi", roi), ("page", None)] if roi is not None else [("page", None)]
+    for region, box in passes:
+        for i, dpi in enumerate(dpi_ladder):
+            if box is None and i == 0 and first_img is not None:
+                img = first_img
+            else:
+                img = renderer.render(page, dpi, grayscale, box, page_size)
+            codes, decoder = _decode_localized(img, decoders, localize, accept)
+            if codes:
+                rungs[dpi]["hit"] += 1
+                return codes, dpi, region, decoder
+            rungs[dpi]["miss"] += 1
+    return [], None, None, None
+
+
+# ---------- Text layer ----------
+def extract_text_pages(pdf_path: str, poppler_path: str | None) -> List[str]:
+    """Đọc text layer bằng pdftotext, trả về text của từng trang."""
+    data = _run_poppler("pdftotext", ["-enc", "UTF-8", pdf_path, "-"], poppler_path)
+    return data.decode("utf-8", "ignore").split("\f")
+
+
+def find_tracking_in_text(text: str) -> List[str]:
+    """Tìm các chuỗi khớp TEXT_PATTERNS, theo thứ tự xuất hiện trong text."""
+    # Số tracking thường được in tách nhóm: "9400 1000 ..." -> "94001000..."
+    text = re.sub(r"(?<=\d) (?=\d)", "", text)
+    hits = []
+    for _, pattern in TEXT_PATTERNS:
+        for m in re.finditer(rf"(?<![0-9A-Za-z])(?:{pattern})(?![0-9A-Za-z])", text):
+            hits.append((m.start(), m.group(0)))
+    hits.sort()
+    found = []
+    for _, s in hits:
+        if s not in found:
+            found.append(s)
+    return found
+
+
+def _extract_text_first(renderer, accept=None) -> List[str]:
+    """Pre-pass text layer: trả về các mã của trang đầu tiên có kết quả (mã được accept nhận), lỗi -> []."""
+    try:
+        pages = renderer.text_pages()
+    except Exception:
+        return []
+    for text in pages:
+        codes = [code for code in find_tracking_in_text(text) if accept is None or accept(code)]
+        if codes:
+            return codes
+    return []
+
+
+# ---------- Embedded images ----------
+def list_page_images(pdf_path: str, poppler_path: str | None) -> Dict[int, List[Tuple[int, int, float, float]]]:
+    """`pdfimages -list` -> {trang: [(width, height, x-ppi, y-ppi), ...]}, bỏ qua smask/stencil."""
+    data = _run_poppler("pdfimages", ["-list", pdf_path], poppler_path)
+    images = {}
+    for line in data.decode("utf-8", "ignore").splitlines()[2:]:
+        parts = line.split()
+        # page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio
+        if len(parts) < 14 or parts[2] != "image":
+            continue
+        try:
+            page, width, height = int(parts[0]), int(parts[3]), int(parts[4])
+            x_ppi, y_ppi = float(parts[12]), float(parts[13])
+        except ValueError:
+            continue
+        images.setdefault(page, []).append((width, height, x_ppi, y_ppi))
+    return images
+
+
+def find_image_pages(renderer, page_sizes: List[Tuple[float, float]]) -> set:
+    """Các trang chỉ gồm một ảnh chiếm phần lớn diện tích trang (nhãn dạng ảnh bọc trong PDF)."""
+    try:
+        images = renderer.list_images()
+    except Exception:
+        return set()
+    pages = set()
+    for page, items in images.items():
+        if len(items) != 1 or page > len(page_sizes):
+            continue
+        width, height, x_ppi, y_ppi = items[0]
+        if x_ppi <= 0 or y_ppi <= 0:
+            continue
+        image_area = (width / x_ppi * 72) * (height / y_ppi * 72)
+        page_w, page_h = page_sizes[page - 1]
+        if image_area >= DOMINANT_IMAGE_COVERAGE * page_w * page_h:
+            pages.add(page)
+    return pages
+
+
+def extract_page_images(pdf_path: str, poppler_path: str | None, page: int) -> List[Image.Image]:
+    """Xuất các ảnh nhúng của một trang ở độ phân giải gốc (pdfimages -png), không render lại trang."""
+    with tempfile.TemporaryDirectory() as out_dir:
+        _run_poppler("pdfimages", ["-f", str(page), "-l", str(page), "-png", pdf_path,
+                                   os.path.join(out_dir, "img")], poppler_path)
+        images = []
+        for name in sorted(os.listdir(out_dir)):
+            with Image.open(os.path.join(out_dir, name)) as img:
+                img.load()
+                images.append(img)
+        return images
+
+
+def _decode_embedded(renderer, decoders, page, localize=False, accept=None) -> Tuple[List[str], str | None]:
+    """Decode trực tiếp ảnh nhúng của trang -> (codes, decoder); lỗi -> [] để quay về đường render."""
+    try:
+        images = renderer.page_images(page)
+    except Exception:
+        return [], None
+    found = []
+    hit_decoder = None
+    for img in images:
+        codes, decoder = _decode_localized(img, decoders, localize, accept)
+        if codes:
+            found.extend(codes)
+            hit_decoder = hit_decoder or decoder
+    return found, hit_decoder
+
+
+# ---------- Render backends ----------
+class PopplerRenderer:
+    """Backend mặc định: các tool CLI của poppler, mỗi thao tác là một process con."""
+
+    name = "poppler"
+
+    def __init__(self, pdf_path: str, poppler_path: str | None):
+        self.pdf_path = pdf_path
+        self.poppler_path = poppler_path
+        self._page_count = None
+
+    def page_count(self) -> int:
+        if self._page_count is None:
+            self._page_count = get_page_count(self.pdf_path, self.poppler_path)
+        return self._page_count
+
+    def page_sizes(self) -> List[Tuple[float, float]]:
+        return get_page_sizes(self.pdf_path, self.poppler_path, self.page_count())
+
+    def render_all(self, dpi: int, grayscale: bool = True) -> List[Image.Image]:
+        return render_pages(self.pdf_path, self.poppler_path, dpi, grayscale=grayscale)
+
+    def render(self, page: int, dpi: int, grayscale: bool = True,
+               roi: Tuple[float, float, float, float] | None = None,
+               page_size: Tuple[float, float] | None = None) -> Image.Image:
+        return render_page(self.pdf_path, self.poppler_path, page, dpi, grayscale, roi, page_size)
+
+    def text_pages(self) -> List[str]:
+        return extract_text_pages(self.pdf_path, self.poppler_path)
+
+    def list_images(self) -> Dict[int, List[Tuple[int, int, float, float]]]:
+        return list_page_images(self.pdf_path, self.poppler_path)
+
+    def page_images(self, page: int) -> List[Image.Image]:
+        return extract_page_images(self.pdf_path, self.poppler_path, page)
+
+    def close(self):
+        pass
+
+
+class PdfiumRenderer:
+    """Backend pypdfium2: PDF được mở một lần, trang render thẳng ra bitmap trong bộ nhớ.
+
+    Không tạo process / file PPM tạm nào; thư viện được nạp một lần cho mỗi process decode
+    (process trong pool sống suốt batch). `source` là đường dẫn file hoặc nội dung PDF (bytes).
+    """
+
+    name = "pdfium"
+
+    def __init__(self, source: str | bytes):
+        try:
+            import pypdfium2
+            import pypdfium2.raw
+        except ImportError:
+            raise RuntimeError("render backend 'pdfium' needs pypdfium2 (pip install pypdfium2)")
+        self._pdfium = pypdfium2
+        self._image_type = pypdfium2.raw.FPDF_PAGEOBJ_IMAGE
+        self.doc = pypdfium2.PdfDocument(source)
+
+    def page_count(self) -> int:
+        return len(self.doc)
+
+    def page_sizes(self) -> List[Tuple[float, float]]:
+        # get_size() đã tính cả góc xoay của trang, giống get_page_sizes
+        return [tuple(self.doc[i].get_size()) for i in range(len(self.doc))]
+
+    def render_all(self, dpi: int, grayscale: bool = True) -> List[Image.Image]:
+        return [self.render(page, dpi, grayscale) for page in range(1, len(self.doc) + 1)]
+
+    def render(self, page: int, dpi: int, grayscale: bool = True,
+               roi: Tuple[float, float, float, float] | None = None,
+               page_size: Tuple[float, float] | None = None) -> Image.Image:
+        pdf_page = self.doc[page - 1]
+        crop = (0, 0, 0, 0)
+        if roi is not None:
+            w, h = page_size or pdf_page.get_size()
+            left, top, right, bottom = roi
+            # pdfium cắt theo (left, bottom, right, top) tính từ mép trang, đơn vị point
+            crop = (left * w, (1 - bottom) * h, (1 - right) * w, top * h)
+        bitmap = pdf_page.render(scale=dpi / 72, crop=crop, grayscale=grayscale)
+        img = bitmap.to_pil()
+        return img.convert("L") if grayscale and img.mode != "L" else img
+
+    def text_pages(self) -> List[str]:
+        pages = []
+        for i in range(len(self.doc)):
+            textpage = self.doc[i].get_textpage()
+            pages.append(textpage.get_text_range())
+            textpage.close()
+        return pages
+
+    def _image_objects(self, page: int):
+        return list(self.doc[page - 1].get_objects(filter=(self._image_type,)))
+
+    def list_images(self) -> Dict[int, List[Tuple[int, int, float, float]]]:
+        images = {}
+        for page in range(1, len(self.doc) + 1):
+            for obj in self._image_objects(page):
+                width, height = obj.get_px_size()
+                left, bottom, right, top = obj.get_bounds()
+                if right <= left or top <= bottom:
+                    continue
+                images.setdefault(page, []).append(
+                    (width, height, width / ((right - left) / 72), height / ((top - bottom) / 72)))
+        return images
+
+    def page_images(self, page: int) -> List[Image.Image]:
+        return [obj.get_bitmap(render=False).to_pil() for obj in self._image_objects(page)]
+
+    def close(self):
+        self.doc.close()
+
+
+def available_backends() -> List[str]:
+    """Các backend dùng được trong môi trường hiện tại (pdfium cần cài pypdfium2)."""
+    backends = ["poppler"]
+    if importlib.util.find_spec("pypdfium2") is not None:
+        backends.append("pdfium")
+    return backends
+
+
+def open_renderer(backend: str, pdf: str | bytes, poppler_path: str | None = None):
+    """Mở backend render cho một PDF (đường dẫn file; backend pdfium nhận cả bytes)."""
+    if backend == "pdfium":
+        return PdfiumRenderer(pdf)
+    if backend == "poppler":
+        return PopplerRenderer(pdf, poppler_path)
+    raise ValueError(f"Unknown render backend: {backend!r}")
+
+
+# ---------- Instrumentation ----------
+class _MeteredRenderer:
+    """Bọc backend render: mọi lời gọi vào backend (render, text layer, ảnh nhúng...) được cộng thời gian
+    vào meter["render_ms"], số trang đã render vào meter["pages_rendered"]."""
+
+    def __init__(self, renderer, meter: Dict):
+        self._renderer = renderer
+        self._meter = meter
+
+    def __getattr__(self, name):
+        attr = getattr(self._renderer, name)
+        if not callable(attr) or name == "close":
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            finally:
+                self._meter["render_ms"] += (time.perf_counter() - started) * 1000
+            if name == "render":
+                self._meter["pages_rendered"] += 1
+            elif name == "render_all":
+                self._meter["pages_rendered"] += len(result)
+            return result
+        return timed
+
+
+class _MeteredDecoder:
+    """Bọc một decoder để đếm số lần thực sự gọi decode (meter["decode_attempts"])."""
+
+    def __init__(self, decoder, meter: Dict):
+        self._decoder = decoder
+        self._meter = meter
+        self.name = decoder.name
+
+    def decode(self, img: Image.Image, **kwargs) -> List[str]:
+        if getattr(self._decoder, "enabled", True):
+            self._meter["decode_attempts"] += 1
+        return self._decoder.decode(img, **kwargs)
+
+
+# ---------- Raster ----------
+def _extract_pages(renderer, decoders, first_only, dpi_ladder, grayscale, roi, embedded, rungs, localize=False,
+                   accept=None):
+    """Đọc barcode từng trang -> (codes, dpi, region, decoder) của lần hit cuối cùng.
+
+    Trang chỉ gồm một ảnh lớn (embedded=True) được decode thẳng từ ảnh nhúng, region = "image";
+    các trang khác (hoặc khi ảnh nhúng miss) thì render + decode theo thang DPI.
+    localize chỉ có tác dụng với first_only: đọc mọi mã thì vẫn quét cả ảnh để không sót mã nào.
+    accept (chỉ áp dụng với first_only): trang / lượt chỉ đọc được mã không nhận thì tìm tiếp, không dừng.
+    """
+    localize = localize and first_only
+    accept = accept if first_only else None
+    found = []
+    hit_dpi = None
+    hit_region = None
+    hit_decoder = None
+    page_count = renderer.page_count()
+    page_sizes = None
+    if roi is not None or embedded:
+        page_sizes = renderer.page_sizes()
+    image_pages = find_image_pages(renderer, page_sizes) if embedded else set()
+    first_imgs = None
+    if not first_only and roi is None and not image_pages:
+        # Render nấc đầu tiên cho cả tài liệu một lần (poppler: một lần gọi pdftoppm)
+        first_imgs = renderer.render_all(dpi_ladder[0], grayscale)
+    for page in range(1, page_count + 1):
+        codes, dpi, region, decoder = [], None, None, None
+        if page in image_pages:
+            codes, decoder = _decode_embedded(renderer, decoders, page, localize, accept)
+            region = "image" if codes else None
+        if not codes:
+            codes, dpi, region, decoder = _decode_page(
+                renderer, decoders, page, dpi_ladder, rungs, grayscale, roi,
+                page_sizes[page - 1] if page_sizes else None,
+                first_imgs[page - 1] if first_imgs and page <= len(first_imgs) else None,
+                localize, accept,
+            )
+        if codes:
+            found.extend(codes)
+            hit_dpi = dpi
+            hit_region = region
+            hit_decoder = decoder
+            if first_only:
+                break
+    return found, hit_dpi, hit_region, hit_decoder
+
+
+def _extract_labels(renderer, decoders, dpi_ladder, grayscale, embedded, rungs) -> List[Dict]:
+    """Đọc mọi mã trên mọi trang (PDF gồm nhiều nhãn, mỗi trang một nhãn) trong một lượt render.
+
+    -> [{"page", "code", "box", "dpi", "region", "decoder"}] theo thứ tự trang, trong trang từ trên xuống;
+    box = (left, top, right, bottom) theo tỉ lệ trang. Nấc DPI đầu tiên được render cho cả tài liệu một
+    lần, trang nào không đọc được gì mới render lại ở nấc cao hơn. Luôn quét cả trang (không ROI /
+    localizer) để không sót nhãn nào.
+    """
+    page_count = renderer.page_count()
+    image_pages = find_image_pages(renderer, renderer.page_sizes()) if embedded else set()
+    first_imgs = renderer.render_all(dpi_ladder[0], grayscale) if page_count > len(image_pages) else []
+    labels = []
+    for page in range(1, page_count + 1):
+        hits, dpi, region, decoder = [], None, None, None
+        if page in image_pages:
+            try:
+                images = renderer.page_images(page)
+            except Exception:
+                images = []
+            # Ảnh nhúng phủ gần hết trang: khung trong ảnh ~ khung trong trang
+            if len(images) == 1:
+                hits, decoder = decode_cascade(images[0], decoders, boxes=True)
+                region = "image" if hits else None
+        if not hits:
+            for i, rung in enumerate(dpi_ladder):
+                if i == 0 and page <= len(first_imgs) and first_imgs[page - 1] is not None:
+                    img = first_imgs[page - 1]
+                    first_imgs[page - 1] = None  # nhả ảnh đã dùng, tài liệu dài không giữ mọi trang
+                else:
+                    img = renderer.render(page, rung, grayscale)
+                hits, decoder = decode_cascade(img, decoders, boxes=True)
+                if hits:
+                    rungs[rung]["hit"] += 1
+                    dpi, region = rung, "page"
+                    break
+                rungs[rung]["miss"] += 1
+        for code, box in hits:
+            labels.append({"page": page, "code": code, "box": list(box), "dpi": dpi, "region": region,
+                           "decoder": decoder})
+    return labels
+
+
+# ---------- Extract ----------
+def extract_tracking_from_pdf_path(pdf_path: str, poppler_path: str | None, first_only: bool = False,
+                                   dpi_ladder: Tuple[int, ...] = DPI_LADDER, grayscale: bool = GRAYSCALE,
+                                   roi: Tuple[float, float, float, float] | None = DEFAULT_ROI,
+                                   text_first: bool = TEXT_FIRST, embedded: bool = EMBEDDED_IMAGES,
+                                   backend: str = RENDER_BACKEND, symbologies: Tuple[str, ...] = SYMBOLOGIES,
+                                   decoders: Tuple[str, ...] = DECODERS, localize: bool = LOCALIZE,
+                                   multi_label: bool = False, stats: Dict | None = None,
+                                   accept: Callable[[str], bool] | None = None) -> List[str]:
+    """Chuyển PDF (file trên đĩa, backend đọc thẳng) sang ảnh rồi đọc barcode.
+
+    first_only=True: render + decode từng trang, dừng ngay ở trang đầu tiên có barcode.
+    first_only=False: đọc toàn bộ tài liệu (nấc DPI đầu tiên được render cho cả tài liệu một lần).
+    Mỗi trang chỉ được render lại ở nấc DPI cao hơn khi nấc thấp hơn không đọc được gì.
+    grayscale=True: yêu cầu backend render thẳng ảnh xám 8-bit (pyzbar chỉ dùng kênh xám).
+    roi=(left, top, right, bottom): chỉ render vùng này trước, miss thì mới render cả trang.
+    text_first=True (chỉ áp dụng với first_only): đọc text layer trước,
+    không khớp TEXT_PATTERNS mới rasterize.
+    embedded=True: trang chỉ gồm một ảnh lớn được decode thẳng từ ảnh nhúng, không render.
+    backend: "poppler" hoặc "pdfium" (xem RENDER_BACKENDS).
+    symbologies: chỉ đọc các loại mã này (() = mọi loại); decoders: thứ tự cascade decoder (xem DECODERS).
+    localize=True (chỉ áp dụng với first_only): decode các vùng nghi là barcode trước khi quét cả trang.
+    accept (chỉ áp dụng với first_only): accept(code) -> False nghĩa là mã đó không phải thứ cần tìm
+    (vd. barcode mã ZIP / routing cạnh số tracking); vùng / trang chỉ có mã như vậy không làm dừng tìm kiếm.
+    multi_label=True: PDF gồm nhiều nhãn; đọc mọi mã trên mọi trang kèm số trang và vị trí (bỏ qua
+    first_only, text_first, roi, localize), stats["labels"] = danh sách mã (xem _extract_labels).
+    Nếu truyền `stats`, hàm ghi vào đó "source" ("text"/"image"/"raster"), "dpi" (nấc đọc được cuối cùng),
+    "region" ("roi"/"page"/"image"), "decoder" ("zbar"/"zxing"), "rungs" (bộ đếm hit/miss) và số đo
+    theo tầng: "render_ms" (thời gian trong backend render), "decode_ms" (phần còn lại: khoanh vùng +
+    decode), "pages_rendered" và "decode_attempts" (số lần gọi decoder).
+    """
+    return _extract_tracking(backend, pdf_path, poppler_path, first_only, dpi_ladder, grayscale, roi,
+                             text_first, embedded, tuple(symbologies), tuple(decoders), localize, multi_label,
+                             stats, accept)
+
+
+def extract_tracking_from_pdf_bytes(pdf_bytes: bytes, poppler_path: str | None, **kwargs) -> List[str]:
+    """Như extract_tracking_from_pdf_path, cho PDF đang nằm trong RAM.
+
+    Backend poppler cần ghi ra file tạm; backend pdfium đọc thẳng từ bộ nhớ.
+    """
+    if kwargs.get("backend", RENDER_BACKEND) == "pdfium":
+        return extract_tracking_from_pdf_path(pdf_bytes, poppler_path, **kwargs)
+    fh, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fh, "wb") as f:
+            f.write(pdf_bytes)
+        return extract_tracking_from_pdf_path(pdf_path, poppler_path, **kwargs)
+    finally:
+        os.remove(pdf_path)
+
+
+def _extract_tracking(backend, pdf, poppler_path, first_only, dpi_ladder, grayscale, roi, text_first, embedded,
+                      symbologies, decoder_names, localize, multi_label, stats, accept=None) -> List[str]:
+    dpi_ladder = tuple(sorted(dpi_ladder)) or (DEFAULT_DPI,)
+    rungs = new_rung_stats(dpi_ladder)
+    found = []
+    source = None
+    hit_dpi = None
+    hit_region = None
+    hit_decoder = None
+    labels = None
+    meter = {"render_ms": 0.0, "pages_rendered": 0, "decode_attempts": 0}
+    started = time.perf_counter()
+
+    renderer = None
+    try:
+        try:
+            renderer = _MeteredRenderer(open_renderer(backend, pdf, poppler_path), meter)
+        except Exception as e:
+            raise RuntimeError(f"render error: {e}")
+        finally:
+            meter["render_ms"] += (time.perf_counter() - started) * 1000
+        if first_only and text_first and not multi_label:
+            found = _extract_text_first(renderer, accept)
+            if found:
+                source = "text"
+        if not found:
+            try:
+                decoders = tuple(_MeteredDecoder(d, meter) for d in get_decoders(decoder_names, symbologies))
+                if multi_label:
+                    labels = _extract_labels(renderer, decoders, dpi_ladder, grayscale, embedded, rungs)
+                    found = [label["code"] for label in labels]
+                    if labels:
+                        hit_dpi, hit_region, hit_decoder = (labels[-1][k] for k in ("dpi", "region", "decoder"))
+                else:
+                    found, hit_dpi, hit_region, hit_decoder = _extract_pages(
+                        renderer, decoders, first_only, dpi_ladder, grayscale, roi, embedded, rungs, localize,
+                        accept)
+            except Exception as e:
+                raise RuntimeError(f"render error: {e}")
+            if found:
+                source = "image" if hit_region == "image" else "raster"
+    finally:
+        if renderer is not None:
+            renderer.close()
+        if stats is not None:
+            stats["source"] = source
+            stats["dpi"] = hit_dpi
+            stats["region"] = hit_region
+            stats["decoder"] = hit_decoder
+            stats["rungs"] = rungs
+            if multi_label:
+                stats["labels"] = labels or []
+            elapsed = (time.perf_counter() - started) * 1000
+            stats["render_ms"] = round(meter["render_ms"], 1)
+            stats["decode_ms"] = round(max(0.0, elapsed - meter["render_ms"]), 1)
+            stats["pages_rendered"] = meter["pages_rendered"]
+            stats["decode_attempts"] = meter["decode_attempts"]
+    return found
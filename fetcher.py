@@ -0,0 +1,348 @@
+import hashlib
+import os
+import random
+import re
+import tempfile
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from concurrency import ConcurrencyController
+from drive import INTERSTITIAL_MAX_BYTES, direct_download_url, find_confirm_url, is_drive_url
+
+# ---------- Cấu hình ----------
+REQUEST_TIMEOUT = 30
+# Số kết nối giữ sẵn (keep-alive) trong pool và số request đồng thời tối đa tới cùng một host
+POOL_SIZE = 32
+PER_HOST_LIMIT = 8
+CHUNK_SIZE = 64 * 1024
+# PDF nhỏ hơn SPOOL_MAX_MEMORY được giữ trong RAM, lớn hơn thì ghi dần ra file tạm trên đĩa;
+# PDF lớn hơn MAX_PDF_SIZE bị hủy ngay khi phát hiện (Content-Length hoặc lúc đang tải)
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+MAX_PDF_SIZE = 100 * 1024 * 1024
+# Lỗi tạm thời (mất kết nối, timeout, các status dưới đây) được thử lại tối đa MAX_RETRIES lần,
+# chờ RETRY_BACKOFF, 2 x RETRY_BACKOFF, ... giây giữa các lần
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_RETRIES = 2
+RETRY_BACKOFF = 1.0
+# Bị giới hạn tốc độ (429, Drive báo hết quota bằng 403 / trang HTML): thử lại tối đa RATE_LIMIT_RETRIES lần,
+# chờ theo Retry-After của server, không có thì RATE_LIMIT_BACKOFF, 2 x RATE_LIMIT_BACKOFF, ... giây;
+# mọi lần chờ được cộng thêm ngẫu nhiên tới RETRY_JITTER (tỉ lệ) để các luồng không cùng gửi lại một lúc
+RATE_LIMIT_RETRIES = 4
+RATE_LIMIT_BACKOFF = 5.0
+RETRY_JITTER = 0.5
+# Retry-After dài hơn MAX_RETRY_DELAY giây (vd. quota theo ngày) thì không chờ, báo lỗi luôn
+MAX_RETRY_DELAY = 120.0
+# Dấu hiệu hết quota trong trang / JSON lỗi của Google Drive
+DRIVE_QUOTA_MARKERS = ("Too many users have viewed or downloaded this file recently", "downloadQuotaExceeded",
+                       "rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+# File PDF phải có "%PDF" trong PDF_HEADER_WINDOW byte đầu; không có thì dừng tải ngay (NotPdf)
+PDF_MAGIC = b"%PDF"
+PDF_HEADER_WINDOW = 1024
+# Số lần tối đa đi theo link xác nhận của trang cảnh báo virus-scan Drive (mỗi lần Drive có thể trả
+# về một trang mới với uuid / confirm khác); quá số này thì bỏ (NotPdf) để trả lại slot của host
+DRIVE_CONFIRM_MAX_HOPS = 2
+
+
+# ---------- Helpers ----------
+def normalize_drive_url(url: str) -> str:
+    """Chuẩn hóa link Google Drive sang link tải trực tiếp (direct download)."""
+    url = url.strip()
+
+    # --- Dạng: https://drive.google.com/file/d/<id>/view hoặc /edit ---
+    match = re.search(r"drive\.google\.com/file/d/([^/?]+)", url)
+    if match:
+        file_id = match.group(1)
+        return f"https://drive.google.com/uc?export=download&id={file_id}"
+
+    # --- Dạng: https://drive.google.com/open?id=<id> ---
+    match = re.search(r"drive\.google\.com/open\?id=([^&]+)", url)
+    if match:
+        file_id = match.group(1)
+        return f"https://drive.google.com/uc?export=download&id={file_id}"
+
+    # --- Dạng: https://drive.google.com/uc?id=<id> ---
+    match = re.search(r"drive\.google\.com/uc\?id=([^&]+)", url)
+    if match:
+        file_id = match.group(1)
+        return f"https://drive.google.com/uc?export=download&id={file_id}"
+
+    # Không phải link Drive -> giữ nguyên
+    return url
+
+
+# ---------- Download ----------
+class PdfTooLarge(RuntimeError):
+    pass
+
+
+class NotPdf(RuntimeError):
+    pass
+
+
+class RateLimited(RuntimeError):
+    """Server từ chối vì quá nhiều request (429 / hết quota Drive); retry_after: giây server yêu cầu chờ."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _size_label(size: int) -> str:
+    return f"{round(size / (1024 * 1024), 1):g} MB"
+
+
+class SpooledPdf:
+    """Nội dung PDF đang/đã tải: giữ trong RAM tới `max_memory` byte, vượt quá thì chuyển sang file tạm.
+
+    SHA-256 được tính dần theo từng chunk nên không cần đọc lại file. payload() -> bytes (PDF nhỏ)
+    hoặc đường dẫn file (PDF lớn, poppler đọc thẳng); gọi cleanup() khi không cần file nữa.
+    """
+
+    def __init__(self, max_memory: int = SPOOL_MAX_MEMORY, max_size: int | None = MAX_PDF_SIZE):
+        self.max_memory = max_memory
+        self.max_size = max_size
+        self.size = 0
+        self.path = None
+        self.head = b""
+        self._buf = bytearray()
+        self._file = None
+        self._sha = hashlib.sha256()
+
+    def write(self, chunk: bytes):
+        if len(self.head) < PDF_HEADER_WINDOW:
+            self.head += chunk[:PDF_HEADER_WINDOW - len(self.head)]
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            self.cleanup()
+            raise PdfTooLarge(f"PDF too large (> {_size_label(self.max_size)})")
+        self._sha.update(chunk)
+        if self._file is None and len(self._buf) + len(chunk) > self.max_memory:
+            fh, self.path = tempfile.mkstemp(suffix=".pdf")
+            self._file = os.fdopen(fh, "wb")
+            self._file.write(self._buf)
+            self._buf = bytearray()
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buf += chunk
+
+    def looks_like_pdf(self) -> bool:
+        return PDF_MAGIC in self.head
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def sha256(self) -> str:
+        return self._sha.hexdigest()
+
+    def payload(self) -> bytes | str:
+        return self.path if self.path is not None else bytes(self._buf)
+
+    def read(self) -> bytes:
+        if self.path is None:
+            return bytes(self._buf)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        self.finish()
+        self._buf = bytearray()
+        if self.path is not None:
+            discard_pdf_file(self.path)
+            self.path = None
+
+
+class LocalPath(str):
+    """Payload là file của người dùng (đầu vào local, xem local_files.py): decode đọc thẳng, không bao giờ bị xóa."""
+
+
+def discard_pdf_file(payload: bytes | str | None):
+    """Xóa file tạm của một payload dạng đường dẫn (bytes / None / LocalPath thì bỏ qua)."""
+    if isinstance(payload, str) and not isinstance(payload, LocalPath):
+        try:
+            os.remove(payload)
+        except OSError:
+            pass
+
+
+def _is_html(resp: requests.Response) -> bool:
+    return resp.headers.get("Content-Type", "").split(";")[0].strip().lower() in ("text/html", "application/xhtml+xml")
+
+
+def _read_text(resp: requests.Response, limit: int) -> str:
+    data = bytearray()
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        data += chunk
+        if len(data) >= limit:
+            break
+    return data.decode(resp.encoding or "utf-8", errors="replace")
+
+
+def _retry_after(resp: requests.Response | None) -> float | None:
+    """Header Retry-After (số giây hoặc ngày giờ HTTP) -> số giây cần chờ; không có / sai -> None."""
+    value = (resp.headers.get("Retry-After", "") if resp is not None else "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _jittered(delay: float) -> float:
+    return delay * random.uniform(1.0, 1.0 + RETRY_JITTER)
+
+
+def _is_drive_quota(text: str) -> bool:
+    return any(marker in text for marker in DRIVE_QUOTA_MARKERS)
+
+
+def _check_pdf(pdf: SpooledPdf, resp: requests.Response):
+    if not pdf.looks_like_pdf():
+        kind = resp.headers.get("Content-Type", "").split(";")[0].strip()
+        kind = kind or ("empty response" if not pdf.size else "unknown content")
+        raise NotPdf(f"Not a PDF ({kind})")
+
+
+class Fetcher:
+    """Tải PDF qua một requests.Session dùng chung.
+
+    - Kết nối được giữ lại (keep-alive) giữa các lần tải, không phải bắt tay TCP + TLS lại mỗi URL.
+    - Mỗi host có một giới hạn riêng, tối đa `per_host_limit` request đồng thời; với `controller`
+      (concurrency.ConcurrencyController) giới hạn này tự giảm khi host chặn / lỗi và tăng lại khi ổn định.
+    - Nội dung được đọc theo chunk (stream) thay vì giữ cả response trong requests.
+    - Lỗi tạm thời (mất kết nối, timeout, 5xx) được thử lại `retries` lần với backoff tăng dần.
+    - Bị giới hạn tốc độ (429, Drive hết quota) -> cả host tạm nghỉ theo Retry-After (hoặc backoff), thử lại
+      `rate_limit_retries` lần; hết lượt thì dòng đó báo lỗi RateLimited.
+    - fetch_spooled(): PDF lớn được ghi dần ra đĩa thay vì nằm trong RAM; vượt `max_size` thì hủy
+      ngay (PdfTooLarge), kể cả trước khi tải nếu Content-Length đã cho biết.
+    - Nội dung không bắt đầu bằng %PDF (trang HTML, trang lỗi...) bị hủy sau chunk đầu (NotPdf),
+      không tới được bước render / decode.
+    - Link Google Drive được tải thẳng từ host download; gặp trang cảnh báo virus-scan thì đi theo
+      link xác nhận trong trang đó trên cùng session.
+    Dùng được từ nhiều thread cùng lúc.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, per_host_limit: int = PER_HOST_LIMIT,
+                 timeout: float = REQUEST_TIMEOUT, retries: int = MAX_RETRIES,
+                 retry_backoff: float = RETRY_BACKOFF, max_size: int | None = MAX_PDF_SIZE,
+                 spool_max_memory: int = SPOOL_MAX_MEMORY, rate_limit_retries: int = RATE_LIMIT_RETRIES,
+                 controller: ConcurrencyController | None = None):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.spool_max_memory = spool_max_memory
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.rate_limit_retries = max(0, rate_limit_retries)
+        self.per_host_limit = max(1, per_host_limit)
+        # Không có controller: giới hạn cố định per_host_limit mỗi host (vẫn nghỉ theo Retry-After)
+        self.controller = controller or ConcurrencyController(pool_size, 1, self.per_host_limit, adaptive=False)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch_spooled(self, url: str, headers: Dict[str, str] | None = None, meta: Dict | None = None) -> SpooledPdf:
+        """Tải nội dung của URL đã chuẩn hóa vào một SpooledPdf (304 -> SpooledPdf rỗng); người gọi phải cleanup().
+
+        headers: header thêm (vd. If-None-Match để tải có điều kiện).
+        Nếu truyền `meta`, hàm ghi vào đó "status", "etag" và "last_modified" của response.
+        """
+        target = direct_download_url(url)
+        attempt = limited = 0
+        while True:
+            try:
+                return self._fetch_once(target, headers, meta)
+            except RateLimited as e:
+                delay = e.retry_after if e.retry_after is not None else RATE_LIMIT_BACKOFF * (2 ** limited)
+                if limited >= self.rate_limit_retries or delay > MAX_RETRY_DELAY:
+                    raise
+                delay = _jittered(delay)
+                self.controller.record_rate_limited(target, delay)
+                limited += 1
+            except (requests.ConnectionError, requests.Timeout):
+                self.controller.record_error(target)
+                if attempt >= self.retries:
+                    raise
+                delay = _jittered(self.retry_backoff * (2 ** attempt))
+                attempt += 1
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if attempt >= self.retries or status not in RETRY_STATUSES:
+                    raise
+                self.controller.record_error(target)
+                retry_after = _retry_after(e.response)
+                delay = _jittered(retry_after if retry_after is not None and retry_after <= MAX_RETRY_DELAY
+                                  else self.retry_backoff * (2 ** attempt))
+                attempt += 1
+            # Chờ ngoài slot của host để slot được nhường cho request khác
+            time.sleep(delay)
+
+    def _fetch_once(self, target: str, headers: Dict[str, str] | None, meta: Dict | None) -> SpooledPdf:
+        self.controller.wait_host(target)
+        hops = 0
+        with self.controller.host_slot(target):
+            while True:
+                started = time.perf_counter()
+                with self.session.get(target, headers=headers, timeout=self.timeout, stream=True) as resp:
+                    if resp.status_code == 429:
+                        raise RateLimited("HTTP 429 Too Many Requests (rate limited)", _retry_after(resp))
+                    if resp.status_code == 403 and is_drive_url(resp.url) and _is_drive_quota(
+                            _read_text(resp, INTERSTITIAL_MAX_BYTES)):
+                        raise RateLimited("Google Drive download quota exceeded (HTTP 403)", _retry_after(resp))
+                    resp.raise_for_status()
+                    self.controller.record_success(target, (time.perf_counter() - started) * 1000)
+                    if is_drive_url(resp.url) and _is_html(resp):
+                        # Trang cảnh báo virus-scan (file lớn) -> tải lại theo link xác nhận, cookie giữ trong session
+                        page = _read_text(resp, INTERSTITIAL_MAX_BYTES)
+                        if _is_drive_quota(page):
+                            raise RateLimited("Google Drive download quota exceeded", _retry_after(resp))
+                        confirm = find_confirm_url(page, resp.url)
+                        if confirm is None or confirm == target:
+                            raise NotPdf("Google Drive returned an HTML page instead of the PDF "
+                                         "(not shared publicly, quota exceeded or removed?)")
+                        if hops >= DRIVE_CONFIRM_MAX_HOPS:
+                            raise NotPdf(f"Google Drive kept returning a confirmation page "
+                                         f"({DRIVE_CONFIRM_MAX_HOPS} confirm links followed)")
+                        hops += 1
+                        target = confirm
+                        continue
+                    return self._read_pdf(resp, meta)
+
+    def _read_pdf(self, resp: requests.Response, meta: Dict | None) -> SpooledPdf:
+        if meta is not None:
+            meta["status"] = resp.status_code
+            meta["etag"] = resp.headers.get("ETag")
+            meta["last_modified"] = resp.headers.get("Last-Modified")
+        pdf = SpooledPdf(self.spool_max_memory, self.max_size)
+        if resp.status_code == 304:
+            return pdf
+        length = resp.headers.get("Content-Length", "")
+        if self.max_size is not None and length.isdigit() and int(length) > self.max_size:
+            raise PdfTooLarge(f"PDF too large ({_size_label(int(length))} > {_size_label(self.max_size)})")
+        checked = False
+        try:
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                pdf.write(chunk)
+                if not checked and len(pdf.head) >= PDF_HEADER_WINDOW:
+                    _check_pdf(pdf, resp)
+                    checked = True
+            if not checked:
+                _check_pdf(pdf, resp)
+        except BaseException:
+            pdf.cleanup()
+            raise
+        pdf.finish()
+        return pdf
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, Iterator
+
+from local_files import normalize_input
+from result_cache import default_cache_dir
+
+# ---------- Cấu hình ----------
+JOBS_DIRNAME = "jobs"
+
+
+# ---------- Helpers ----------
+def default_jobs_dir() -> str:
+    return os.path.join(default_cache_dir(), JOBS_DIRNAME)
+
+
+def job_id_for_urls(urls: Iterable[str]) -> str:
+    """Job ID cố định theo danh sách URL: dán lại đúng danh sách cũ -> chạy tiếp job cũ."""
+    digest = hashlib.sha1("\n".join(u.strip() for u in urls).encode("utf-8")).hexdigest()
+    return f"batch-{digest[:16]}"
+
+
+def new_job_id() -> str:
+    return time.strftime("job-%Y%m%d-%H%M%S-") + os.urandom(3).hex()
+
+
+def is_completed(row: Dict) -> bool:
+    """Dòng đã xong: đọc được barcode hoặc đọc hết mà không thấy ("Not found"); còn lại là lỗi, cần chạy lại."""
+    return bool(row.get("raw")) or row.get("error") == "Not found"
+
+
+# ---------- Journal ----------
+class JobJournal:
+    """Nhật ký append-only (JSONL) của một batch: mỗi dòng kết quả được ghi ngay khi xong.
+
+    Chạy lại với cùng job ID thì bỏ qua các index đã xong (cùng URL), chỉ xử lý dòng còn chờ hoặc lỗi.
+    Dòng ghi dở (process chết giữa chừng) bị bỏ qua khi đọc lại.
+    """
+
+    def __init__(self, job_id: str, jobs_dir: str | None = None):
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", job_id):
+            raise ValueError(f"Invalid job ID: {job_id!r}")
+        jobs_dir = jobs_dir or default_jobs_dir()
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.job_id = job_id
+        self.path = os.path.join(jobs_dir, f"{job_id}.jsonl")
+        self._lock = threading.Lock()
+        self._file = None
+        # index -> (url, số dòng trong journal) của bản ghi "đã xong" mới nhất
+        self._completed = {}
+        self._lines = 0
+        for line_no, row in self._iter_records():
+            self._lines = line_no + 1
+            if not isinstance(row, dict):
+                continue
+            idx = row.get("index")
+            if not isinstance(idx, int):
+                continue
+            if is_completed(row):
+                self._completed[idx] = (row.get("url", ""), line_no)
+            else:
+                self._completed.pop(idx, None)
+
+    def _iter_records(self) -> Iterator[tuple]:
+        """-> (số dòng, bản ghi); dòng hỏng (ghi dở) cho bản ghi None."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError:
+                    yield line_no, None
+
+    def is_done(self, idx: int, url: str) -> bool:
+        """Index này đã xong với đúng URL này (so sau khi chuẩn hóa link Drive) chưa."""
+        entry = self._completed.get(idx)
+        return entry is not None and entry[0] == normalize_input(url)
+
+    def completed_rows(self) -> Iterator[Dict]:
+        """Đọc lại (streaming) các dòng đã xong, mỗi index một dòng."""
+        wanted = {line_no for _, line_no in self._completed.values()}
+        for line_no, row in self._iter_records():
+            if line_no in wanted:
+                yield row
+
+    def __len__(self):
+        return len(self._completed)
+
+    def append(self, row: Dict):
+        """Ghi một dòng kết quả và flush ngay xuống đĩa."""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    # Dòng cuối bị ghi dở: xuống dòng để bản ghi mới không dính vào nó
+                    self._file.write("\n")
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if is_completed(row):
+                self._completed[row["index"]] = (row.get("url", ""), self._lines)
+            else:
+                self._completed.pop(row["index"], None)
+            self._lines += 1
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """Đóng và xóa journal (job đã chạy xong trọn vẹn, không cần chạy tiếp nữa)."""
+        self.close()
+        with self._lock:
+            self._completed.clear()
+            self._lines = 0
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,210 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple
+
+from concurrency import ConcurrencyController
+from fetcher import MAX_PDF_SIZE, PER_HOST_LIMIT
+from job_journal import JobJournal, is_completed, new_job_id
+from pipeline import DEFAULT_DECODE_WORKERS, DEFAULT_DOWNLOAD_WORKERS, run_pipeline
+from result_cache import ResultCache
+
+# ---------- Cấu hình ----------
+# Tổng số luồng tải / process decode cho mọi job của server, chia đều cho các job đang chạy
+DOWNLOAD_BUDGET = 64
+DECODE_BUDGET = DEFAULT_DECODE_WORKERS
+# Job đã xong được giữ lại (để trang còn poll được kết quả) trong JOB_TTL giây
+JOB_TTL = 3600
+
+
+# ---------- Job ----------
+class Job:
+    """Trạng thái một batch chạy nền; mọi hàm đều an toàn khi gọi từ nhiều thread."""
+
+    def __init__(self, job_id: str, total: int):
+        self.job_id = job_id
+        self.total = total
+        self.state = "running"  # running / done / cancelled / error
+        self.error = ""
+        self.started = time.time()
+        self.finished = None
+        self.stop_event = threading.Event()
+        # Giới hạn tải / decode hiện tại của job (tự điều chỉnh), gán khi job bắt đầu chạy
+        self.controller = None
+        self._results = [None] * total
+        self._log = []  # dòng kết quả theo thứ tự hoàn thành, để poll tăng dần theo cursor
+        self._processed = 0
+        self._lock = threading.Lock()
+
+    def add(self, row: Dict):
+        with self._lock:
+            if self._results[row["index"]] is None:
+                self._processed += 1
+            self._results[row["index"]] = row
+            self._log.append(row)
+
+    def rows_since(self, cursor: int) -> Tuple[List[Dict], int]:
+        """-> (các dòng hoàn thành sau vị trí cursor, cursor mới)."""
+        with self._lock:
+            return self._log[cursor:], len(self._log)
+
+    def results(self) -> List[Dict | None]:
+        with self._lock:
+            return list(self._results)
+
+    def status(self) -> Dict:
+        """Trạng thái job; "limits" = controller.snapshot() (None khi job chưa chạy)."""
+        controller = self.controller
+        with self._lock:
+            return {"job_id": self.job_id, "state": self.state, "processed": self._processed,
+                    "total": self.total, "error": self.error,
+                    "elapsed": (self.finished or time.time()) - self.started,
+                    "limits": controller.snapshot() if controller is not None else None}
+
+    def all_completed(self) -> bool:
+        with self._lock:
+            return all(r is not None and is_completed(r) for r in self._results)
+
+    def finish(self, state: str, error: str = ""):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.finished = time.time()
+
+
+# ---------- Manager ----------
+class JobManager:
+    """Chạy các batch trên thread nền, độc lập với vòng đời của trang / session.
+
+    - submit() trả về job ID ngay; trang poll tiến độ và các dòng mới qua get(job_id).
+    - Mọi job dùng chung một process pool `decode_budget` process; số PDF decode cùng lúc của mỗi
+      job được chia đều cho các job đang chạy (tính lại liên tục), luồng tải chia đều lúc job bắt đầu.
+    - Job có journal thì chạy tiếp được sau khi server khởi động lại (xem job_journal).
+    """
+
+    def __init__(self, download_budget: int = DOWNLOAD_BUDGET, decode_budget: int = DECODE_BUDGET,
+                 job_ttl: float = JOB_TTL):
+        self.download_budget = max(1, download_budget)
+        self.decode_budget = max(1, decode_budget)
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Pool dùng chung; pool đã hỏng (process con bị kill) thì tạo pool mới."""
+        with self._lock:
+            if self._pool is not None:
+                try:
+                    self._pool.submit(int)  # pool hỏng -> BrokenProcessPool ngay lúc submit
+                except BrokenProcessPool:
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.decode_budget,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def running_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state == "running")
+
+    def _fair_share(self, budget: int, requested: int) -> int:
+        return max(1, min(requested, budget // max(1, self.running_count())))
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            for job_id in [j.job_id for j in self._jobs.values()
+                           if j.finished is not None and now - j.finished > self.job_ttl]:
+                del self._jobs[job_id]
+
+    def submit(self, urls: List[str], poppler_path: str | None, extract_options: Dict | None = None,
+               download_workers: int = DEFAULT_DOWNLOAD_WORKERS, decode_workers: int = DEFAULT_DECODE_WORKERS,
+               per_host_limit: int = PER_HOST_LIMIT, cache: ResultCache | None = None,
+               bypass_cache: bool = False, journal: JobJournal | None = None,
+               max_pdf_size: int | None = MAX_PDF_SIZE) -> str:
+        """Bắt đầu một batch trên thread nền -> job ID.
+
+        download_workers / decode_workers là mức tối đa mong muốn của job, thực tế bị giới hạn
+        bởi phần chia đều của ngân sách chung. Nếu job cùng ID (cùng journal) đang chạy thì
+        không chạy trùng mà trả về luôn ID đó.
+        """
+        self._prune()
+        job_id = journal.job_id if journal is not None else new_job_id()
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.state == "running":
+                if journal is not None:
+                    journal.close()
+                return job_id
+            job = self._jobs[job_id] = Job(job_id, len(urls))
+
+        skip = None
+        if journal is not None and not bypass_cache:
+            # Các dòng đã xong ở lần chạy trước: có ngay, không tải/decode nữa
+            for row in journal.completed_rows():
+                if 0 <= row["index"] < len(urls):
+                    job.add(row)
+            skip = journal.is_done
+
+        thread = threading.Thread(
+            target=self._run, daemon=True,
+            args=(job, urls, poppler_path, extract_options, download_workers, decode_workers,
+                  per_host_limit, cache, bypass_cache, journal, skip, max_pdf_size))
+        thread.start()
+        return job_id
+
+    def _run(self, job: Job, urls, poppler_path, extract_options, download_workers, decode_workers,
+             per_host_limit, cache, bypass_cache, journal, skip, max_pdf_size):
+        def on_result(result):
+            if journal is not None:
+                journal.append(result)
+            job.add(result)
+
+        def decode_limit():
+            return self._fair_share(self.decode_budget, decode_workers)
+
+        download_workers = self._fair_share(self.download_budget, download_workers)
+        job.controller = ConcurrencyController(download_workers, decode_workers, per_host_limit)
+        try:
+            run_pipeline(urls, poppler_path, on_result, extract_options,
+                         download_workers=download_workers,
+                         decode_workers=decode_workers, per_host_limit=per_host_limit,
+                         cache=cache, bypass_cache=bypass_cache, stop_event=job.stop_event, skip=skip,
+                         max_pdf_size=max_pdf_size,
+                         pool=self._get_pool(), decode_limit=decode_limit, controller=job.controller)
+        except Exception as e:
+            job.finish("error", str(e))
+        else:
+            job.finish("cancelled" if job.stop_event.is_set() else "done")
+        finally:
+            if journal is not None:
+                # Xong trọn vẹn thì bỏ journal; còn dòng lỗi / chưa chạy thì giữ để chạy tiếp
+                if job.state == "done" and job.all_completed():
+                    journal.discard()
+                else:
+                    journal.close()
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Dừng job: URL chưa bắt đầu sẽ không được xử lý. -> False nếu không có job đó."""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.stop_event.set()
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            pool, self._pool = self._pool, None
+        for job in jobs:
+            job.stop_event.set()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
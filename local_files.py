@@ -0,0 +1,211 @@
+"""Đầu vào là file trên máy / ổ mạng thay vì URL: file PDF, thư mục (quét đệ quy) và file ZIP.
+
+- expand_inputs(): thư mục -> các file PDF / ZIP bên trong (theo tên); ZIP -> từng PDF trong đó, dạng
+  "<đường dẫn zip>!<tên file trong zip>"; link thư mục Drive -> các file PDF (xem drive.py). URL giữ nguyên.
+- LocalReader: cùng giao diện với fetcher.Fetcher nên tầng tải của pipeline dùng chung cho cả hai,
+  nhưng không qua HTTP. File PDF thường được băm SHA-256 qua mmap và đưa thẳng đường dẫn cho backend
+  render (không chép vào RAM, không ghi file tạm); PDF trong ZIP được giải nén dần vào SpooledPdf như
+  một lần tải.
+"""
+import hashlib
+import mmap
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Dict, Iterable, Iterator, Tuple
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+from drive import expand_drive_folders
+from fetcher import (CHUNK_SIZE, MAX_PDF_SIZE, PDF_HEADER_WINDOW, PDF_MAGIC, SPOOL_MAX_MEMORY, LocalPath, NotPdf,
+                     PdfTooLarge, SpooledPdf, _size_label, normalize_drive_url)
+
+# ---------- Cấu hình ----------
+PDF_SUFFIX = ".pdf"
+ZIP_SUFFIX = ".zip"
+# "<đường dẫn zip>!<tên file trong zip>"
+ZIP_MEMBER_SEP = "!"
+# Số file ZIP giữ mở cùng lúc (đọc nhiều PDF trong cùng một ZIP không phải đọc lại mục lục mỗi lần)
+MAX_OPEN_ZIPS = 8
+
+
+# ---------- Inputs ----------
+def is_local(item: str) -> bool:
+    """Đường dẫn file / thư mục / ZIP (kể cả file:// và ổ đĩa Windows "C:\\..."), không phải URL HTTP."""
+    scheme = urlsplit(item.strip()).scheme.lower()
+    return scheme in ("", "file") or len(scheme) == 1
+
+
+def local_path(item: str) -> str:
+    """Đầu vào local -> đường dẫn tuyệt đối (file:// được đổi sang đường dẫn của hệ điều hành)."""
+    item = item.strip()
+    if item.lower().startswith("file:"):
+        item = url2pathname(urlsplit(item).path)
+    zip_path, member = split_member(item)
+    path = os.path.abspath(os.path.expanduser(zip_path))
+    return f"{path}{ZIP_MEMBER_SEP}{member}" if member is not None else path
+
+
+def split_member(path: str) -> Tuple[str, str | None]:
+    """"a.zip!x/1.pdf" -> ("a.zip", "x/1.pdf"); đường dẫn thường -> (path, None)."""
+    match = re.match(rf"(.+?{re.escape(ZIP_SUFFIX)}){re.escape(ZIP_MEMBER_SEP)}(.+)$", path, re.I)
+    return (match.group(1), match.group(2)) if match else (path, None)
+
+
+def normalize_input(item: str) -> str:
+    """Khóa của một dòng đầu vào: đường dẫn tuyệt đối với đầu vào local, link tải trực tiếp với URL."""
+    return local_path(item) if is_local(item) else normalize_drive_url(item)
+
+
+def _zip_members(zip_path: str) -> Iterator[str]:
+    with zipfile.ZipFile(zip_path) as zf:
+        names = sorted(i.filename for i in zf.infolist() if not i.is_dir() and i.filename.lower().endswith(PDF_SUFFIX))
+    for name in names:
+        yield f"{zip_path}{ZIP_MEMBER_SEP}{name}"
+
+
+def expand_local(item: str) -> Iterator[str]:
+    """Một dòng đầu vào -> các PDF nó chứa (thư mục quét đệ quy, ZIP mở ra); URL / file PDF giữ nguyên.
+
+    Thư mục / ZIP không đọc được thì giữ nguyên dòng đó, dòng kết quả của nó sẽ báo lỗi.
+    """
+    if not is_local(item):
+        yield item
+        return
+    path = local_path(item)
+    try:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    if name.lower().endswith(PDF_SUFFIX):
+                        yield full
+                    elif name.lower().endswith(ZIP_SUFFIX) and zipfile.is_zipfile(full):
+                        yield from _zip_members(full)
+            return
+        if path.lower().endswith(ZIP_SUFFIX) and zipfile.is_zipfile(path):
+            yield from _zip_members(path)
+            return
+    except (OSError, zipfile.BadZipFile):
+        pass
+    yield path
+
+
+def expand_inputs(items: Iterable[str]) -> Iterator[str]:
+    """Mở rộng cả link thư mục Drive lẫn thư mục / ZIP local thành từng PDF (đọc dần)."""
+    for item in expand_drive_folders(items):
+        yield from expand_local(item)
+
+
+# ---------- Reader ----------
+def local_stamp(path: str) -> Tuple[str, str]:
+    """(etag, last_modified) của file (ZIP thì theo file ZIP) để cache nhận ra file chưa đổi mà không cần đọc."""
+    st = os.stat(split_member(path)[0])
+    return f'"{st.st_size}-{st.st_mtime_ns}"', formatdate(st.st_mtime, usegmt=True)
+
+
+class LocalFile:
+    """File PDF trên đĩa dùng thẳng làm payload: như SpooledPdf nhưng không chép nội dung,
+    cleanup() không xóa gì (payload là LocalPath)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.head = b""
+        sha = hashlib.sha256()
+        if self.size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                self.head = m[:PDF_HEADER_WINDOW]
+                sha.update(m)
+        self.sha256 = sha.hexdigest()
+
+    def looks_like_pdf(self) -> bool:
+        return PDF_MAGIC in self.head
+
+    def payload(self) -> str:
+        return LocalPath(self.path)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        pass
+
+
+class LocalReader:
+    """Đọc đầu vào local với cùng giao diện fetch_spooled của fetcher.Fetcher.
+
+    - meta["etag"] / meta["last_modified"] lấy từ kích thước + thời gian sửa file; header If-None-Match
+      trùng -> meta["status"] = 304 và không đọc file (như tải có điều kiện).
+    - File lớn hơn `max_size` -> PdfTooLarge; không có %PDF ở đầu -> NotPdf.
+    Dùng được từ nhiều thread cùng lúc.
+    """
+
+    def __init__(self, max_size: int | None = MAX_PDF_SIZE, spool_max_memory: int = SPOOL_MAX_MEMORY):
+        self.max_size = max_size
+        self.spool_max_memory = spool_max_memory
+        self._zips = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _zip(self, zip_path: str) -> zipfile.ZipFile:
+        with self._lock:
+            zf = self._zips.get(zip_path)
+            if zf is None:
+                zf = self._zips[zip_path] = zipfile.ZipFile(zip_path)
+                if len(self._zips) > MAX_OPEN_ZIPS:
+                    # Không close(): thread khác có thể đang đọc dở, ZipFile tự đóng khi không còn ai giữ
+                    self._zips.popitem(last=False)
+            self._zips.move_to_end(zip_path)
+            return zf
+
+    def fetch_spooled(self, url: str, headers: Dict[str, str] | None = None,
+                      meta: Dict | None = None) -> LocalFile | SpooledPdf:
+        path = local_path(url)
+        etag, last_modified = local_stamp(path)
+        status = 304 if headers and headers.get("If-None-Match") == etag else 200
+        if meta is not None:
+            meta.update(status=status, etag=etag, last_modified=last_modified)
+        if status == 304:
+            return SpooledPdf(self.spool_max_memory, self.max_size)
+        zip_path, member = split_member(path)
+        if member is None:
+            size = os.path.getsize(path)
+            if self.max_size is not None and size > self.max_size:
+                raise PdfTooLarge(f"PDF too large ({_size_label(size)} > {_size_label(self.max_size)})")
+            pdf = LocalFile(path)
+        else:
+            pdf = self._read_member(zip_path, member)
+        if not pdf.looks_like_pdf():
+            pdf.cleanup()
+            raise NotPdf("Not a PDF")
+        return pdf
+
+    def _read_member(self, zip_path: str, member: str) -> SpooledPdf:
+        zf = self._zip(zip_path)
+        try:
+            info = zf.getinfo(member)
+        except KeyError:
+            raise FileNotFoundError(f"{member} not found in {zip_path}")
+        if self.max_size is not None and info.file_size > self.max_size:
+            raise PdfTooLarge(f"PDF too large ({_size_label(info.file_size)} > {_size_label(self.max_size)})")
+        pdf = SpooledPdf(self.spool_max_memory, self.max_size)
+        try:
+            with zf.open(info) as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    pdf.write(chunk)
+        except BaseException:
+            pdf.cleanup()
+            raise
+        pdf.finish()
+        return pdf
+
+    def close(self):
+        with self._lock:
+            for zf in self._zips.values():
+                zf.close()
+            self._zips.clear()
@@ -0,0 +1,157 @@
+"""Tìm vùng có khả năng chứa barcode trên ảnh trang trước khi decode.
+
+Trang được thu nhỏ rồi chia thành lưới ô vuông; với mỗi ô tính structure tensor của gradient
+(năng lượng cạnh + độ "cùng hướng" của cạnh). Barcode 1D là vùng cạnh rất dày và song song nhau,
+khác với chữ (cạnh nhiều hướng) hay nền trắng (không có cạnh). Các ô đạt ngưỡng được gom thành
+vùng liên thông, trả về khung (theo pixel ảnh gốc) và góc xoay của vạch để decode riêng từng vùng.
+
+Chỉ cần NumPy (không GPU, không OpenCV); thiếu NumPy thì available() = False và không localize.
+"""
+import math
+from collections import deque
+from typing import List, Tuple
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tùy chọn: không có thì decode cả trang như cũ
+    np = None
+
+# ---------- Cấu hình ----------
+# Chiều rộng (xấp xỉ, tối thiểu) của ảnh thu nhỏ dùng để tìm vùng, và kích thước một ô lưới trên ảnh đó (pixel)
+WORK_WIDTH = 640
+CELL = 8
+# Ngưỡng: độ cùng hướng của cạnh (0..1) và năng lượng cạnh so với ô mạnh nhất trang
+MIN_COHERENCE = 0.55
+MIN_ENERGY_RATIO = 0.12
+# Vùng nhỏ hơn MIN_CELLS ô bị bỏ; lấy tối đa MAX_REGIONS vùng mạnh nhất mỗi trang
+MIN_CELLS = 16
+MAX_REGIONS = 4
+# Nới khung mỗi phía (tỉ lệ theo cạnh ngắn của vùng) để không cắt mất quiet zone của barcode
+PADDING = 0.35
+# Góc ước lượng từ gradient được tinh chỉnh trong khoảng ±ANGLE_SEARCH độ, bước ANGLE_STEP
+ANGLE_SEARCH = 12
+ANGLE_STEP = 1.5
+# Lệch ít hơn SKEW_TOLERANCE độ so với ngang / dọc thì zbar vẫn đọc được, không cần xoay
+SKEW_TOLERANCE = 3
+# Vùng hẹp hơn MIN_CROP_WIDTH pixel (barcode nhỏ / DPI thấp) được phóng to 2x trước khi decode
+MIN_CROP_WIDTH = 400
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _cell_sums(values, rows: int, cols: int):
+    return values[:rows * CELL, :cols * CELL].reshape(rows, CELL, cols, CELL).sum(axis=(1, 3))
+
+
+def _box_3x3(a):
+    """Tổng 3x3 quanh mỗi ô (gộp ô kề nhau để vạch thưa vẫn đủ năng lượng)."""
+    p = np.pad(a, 1)
+    return sum(p[dy:dy + a.shape[0], dx:dx + a.shape[1]] for dy in range(3) for dx in range(3))
+
+
+def _components(mask) -> List[List[Tuple[int, int]]]:
+    """Các vùng liên thông (8 hướng) của mask trên lưới ô."""
+    rows, cols = mask.shape
+    seen = np.zeros_like(mask, dtype=bool)
+    regions = []
+    for r0, c0 in zip(*np.nonzero(mask)):
+        if seen[r0, c0]:
+            continue
+        seen[r0, c0] = True
+        cells = []
+        todo = deque([(r0, c0)])
+        while todo:
+            r, c = todo.popleft()
+            cells.append((r, c))
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    rr, cc = r + dr, c + dc
+                    if 0 <= rr < rows and 0 <= cc < cols and mask[rr, cc] and not seen[rr, cc]:
+                        seen[rr, cc] = True
+                        todo.append((rr, cc))
+        regions.append(cells)
+    return regions
+
+
+def find_barcode_regions(img: Image.Image, max_regions: int = MAX_REGIONS) -> List[Tuple[Tuple[int, int, int, int], float]]:
+    """-> [((left, top, right, bottom), góc), ...] theo pixel của `img`, từ trên xuống.
+
+    Giữ max_regions vùng mạnh nhất, rồi xếp theo cạnh trên như thứ tự decode() trả về mã.
+    góc (độ, ước lượng thô từ hướng gradient): crop.rotate(góc) đưa vạch về gần thẳng đứng,
+    crop_region tinh chỉnh thêm. Không có NumPy hoặc không tìm thấy vùng nào -> [].
+    """
+    if np is None:
+        return []
+    # Thu nhỏ theo hệ số nguyên bằng reduce() (lấy trung bình khối, nhanh hơn resize nhiều lần)
+    scale = max(1, img.width // WORK_WIDTH)
+    small = img if img.mode == "L" else img.convert("L")
+    if scale > 1:
+        small = small.reduce(scale)
+    a = np.asarray(small, dtype=np.float32)
+    rows, cols = (a.shape[0] - 1) // CELL, (a.shape[1] - 1) // CELL
+    if rows < 2 or cols < 2:
+        return []
+    # Gradient trên khối 2x2 (gx, gy cùng một tâm) để tích gx*gy không bị lệch pha ở cạnh nghiêng
+    dx = a[:, 1:] - a[:, :-1]
+    dy = a[1:, :] - a[:-1, :]
+    gx = (dx[:-1] + dx[1:]) / 2
+    gy = (dy[:, :-1] + dy[:, 1:]) / 2
+    jxx = _box_3x3(_cell_sums(gx * gx, rows, cols))
+    jyy = _box_3x3(_cell_sums(gy * gy, rows, cols))
+    jxy = _box_3x3(_cell_sums(gx * gy, rows, cols))
+    energy = jxx + jyy
+    peak = float(energy.max())
+    if peak <= 0:
+        return []
+    coherence = np.sqrt((jxx - jyy) ** 2 + 4 * jxy ** 2) / (energy + 1e-6)
+    mask = (coherence >= MIN_COHERENCE) & (energy >= MIN_ENERGY_RATIO * peak)
+
+    found = []
+    for cells in _components(mask):
+        if len(cells) < MIN_CELLS:
+            continue
+        rs = [r for r, _ in cells]
+        cs = [c for _, c in cells]
+        sxx = sum(float(jxx[r, c]) for r, c in cells)
+        syy = sum(float(jyy[r, c]) for r, c in cells)
+        sxy = sum(float(jxy[r, c]) for r, c in cells)
+        angle = math.degrees(0.5 * math.atan2(2 * sxy, sxx - syy))
+        score = sum(float(energy[r, c] * coherence[r, c]) for r, c in cells)
+        top, bottom = min(rs) * CELL, (max(rs) + 1) * CELL
+        left, right = min(cs) * CELL, (max(cs) + 1) * CELL
+        pad = PADDING * min(right - left, bottom - top)
+        box = (max(0, int((left - pad) * scale)), max(0, int((top - pad) * scale)),
+               min(img.width, math.ceil((right + pad) * scale)), min(img.height, math.ceil((bottom + pad) * scale)))
+        found.append((score, box, angle))
+    found.sort(key=lambda f: -f[0])
+    return sorted(((box, angle) for _, box, angle in found[:max_regions]), key=lambda r: r[0][1])
+
+
+def _refine_angle(crop: Image.Image, angle: float) -> float:
+    """Chọn góc quanh `angle` mà sau khi xoay, các vạch thẳng đứng nhất (profile theo cột sắc nhất)."""
+    small = crop.convert("L")
+    small.thumbnail((WORK_WIDTH // 2, WORK_WIDTH // 2))
+    best, best_score = angle, -1.0
+    steps = int(ANGLE_SEARCH / ANGLE_STEP)
+    for i in range(-steps, steps + 1):
+        candidate = angle + i * ANGLE_STEP
+        profile = np.asarray(small.rotate(candidate, resample=Image.BILINEAR, fillcolor=255),
+                             dtype=np.float32).mean(axis=0)
+        score = float(np.abs(np.diff(profile)).sum())
+        if score > best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def crop_region(img: Image.Image, box: Tuple[int, int, int, int], angle: float) -> Image.Image:
+    """Cắt vùng ở độ phân giải gốc; vạch bị nghiêng thì xoay cho thẳng (zbar chỉ quét ngang/dọc)."""
+    crop = img.crop(box)
+    if abs(((angle + 45) % 90) - 45) > SKEW_TOLERANCE:
+        crop = crop.rotate(_refine_angle(crop, angle), resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if crop.width < MIN_CROP_WIDTH:
+        crop = crop.resize((crop.width * 2, crop.height * 2), Image.BICUBIC)
+    return crop
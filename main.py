@@ -1,20 +1,49 @@
+import time
+# Mốc 0 của báo cáo khởi động: đặt trước mọi import khác để đo được cả thời gian nạp tkinter
+STARTED = time.perf_counter()
 import os
 import sys
-import re
-import threading
 import queue
+import threading
+import importlib
+import multiprocessing
 import csv
-import requests
 from tkinter import Tk, Text, Button, Label, filedialog, StringVar, END, DISABLED, NORMAL, messagebox
 from tkinter import ttk
-from pdf2image import convert_from_bytes
-from pyzbar.pyzbar import decode
-from PIL import Image
 
 # ---------- Cấu hình ----------
 BUNDLED_POPPLER_DIRNAME = "poppler_bin"
-TRIM_FROM = 8
-REQUEST_TIMEOUT = 30
+# Số luồng tải (I/O) và số process decode (CPU) chạy độc lập với nhau; None = mặc định của pipeline.py
+DOWNLOAD_WORKERS = None
+DECODE_WORKERS = None
+# Số kết nối đồng thời tới một host; None = mặc định của fetcher.py
+PER_HOST_LIMIT = None
+# Các số trên là mức tối đa: số request mỗi host / số PDF decode cùng lúc tự giảm khi host chặn (429, hết quota
+# Drive) hoặc máy thiếu RAM / CPU rồi tăng lại dần; False = luôn chạy đúng các số trên
+ADAPTIVE_CONCURRENCY = True
+# Cache kết quả trên đĩa: chạy lại cùng danh sách URL chỉ xử lý các dòng mới / lỗi
+USE_CACHE = True
+# Backend render: "poppler" (poppler_bin đi kèm) hoặc "pdfium" (cần đóng gói thêm pypdfium2)
+BACKEND = "poppler"
+# Loại mã, thứ tự decoder, khoanh vùng barcode... theo mặc định của extractor.py (thêm khóa vào
+# EXTRACT_OPTIONS để đổi, vd. "localize": False)
+# MULTI_LABEL: mỗi URL là một PDF nhiều nhãn (vd. mỗi trang một nhãn) -> mỗi số tracking một dòng, kèm trang
+MULTI_LABEL = False
+EXTRACT_OPTIONS = {"backend": BACKEND, "multi_label": MULTI_LABEL}
+# Journal theo job: app bị tắt giữa chừng thì bấm Start lại với cùng danh sách URL để chạy tiếp
+USE_JOURNAL = True
+# Kết quả từ luồng nền được gom vào hàng đợi, Tk lấy ra theo lô mỗi DRAIN_INTERVAL_MS (tối đa DRAIN_BATCH dòng/lần)
+DRAIN_INTERVAL_MS = 100
+DRAIN_BATCH = 500
+# Stack decode / mạng (requests, pdf2image, pyzbar + libzbar, PIL, NumPy...) không nạp lúc mở app mà nạp trên
+# luồng nền sau khi cửa sổ đã hiện, theo thứ tự phụ thuộc để đo được thời gian nạp của từng module
+BACKEND_MODULES = ("PIL.Image", "requests", "pdf2image", "pyzbar.pyzbar", "localizer", "extractor", "concurrency",
+                   "drive", "fetcher", "local_files", "rules", "result_cache", "job_journal", "metrics", "pipeline")
+WARM_UP_POLL_MS = 50
+# Chạy `main --startup-report`: in báo cáo thời gian khởi động khi nạp xong rồi thoát. Bản exe không có
+# console (sys.stdout là None) thì ghi ra STARTUP_REPORT_FILENAME cạnh file exe
+STARTUP_REPORT_FLAG = "--startup-report"
+STARTUP_REPORT_FILENAME = "startup_report.txt"
 
 
 # --- Nếu chạy dưới PyInstaller (frozen), thêm thư mục poppler_bin vào PATH ---
@@ -33,84 +62,54 @@ def get_poppler_path():
     return os.path.join(base, BUNDLED_POPPLER_DIRNAME)
 
 
-def normalize_drive_url(url: str) -> str:
-    """Chuẩn hóa link Google Drive sang link tải trực tiếp (direct download)."""
-    url = url.strip()
-
-    # --- Dạng: https://drive.google.com/file/d/<id>/view hoặc /edit ---
-    match = re.search(r"drive\.google\.com/file/d/([^/?]+)", url)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
-
-    # --- Dạng: https://drive.google.com/open?id=<id> ---
-    match = re.search(r"drive\.google\.com/open\?id=([^&]+)", url)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
+# ---------- Startup ----------
+# Mốc khởi động (giây tính từ STARTED): "window" = frame đầu tiên đã vẽ, "backend" = nạp xong BACKEND_MODULES
+STARTUP_TIMES = {}
+# [(module, giây)] theo thứ tự nạp; mỗi module chỉ tính phần chưa được module trước đó nạp sẵn
+IMPORT_TIMES = []
+_backend_lock = threading.Lock()
 
-    # --- Dạng: https://drive.google.com/uc?id=<id> ---
-    match = re.search(r"drive\.google\.com/uc\?id=([^&]+)", url)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
 
-    # Không phải link Drive -> giữ nguyên
-    return url
+def load_backend():
+    """Nạp BACKEND_MODULES (lần đầu gọi; các lần sau trả về ngay), ghi thời gian nạp từng module.
 
-
-def extract_tracking_from_pdf_bytes(pdf_bytes, poppler_path):
-    """Chuyển PDF sang ảnh rồi đọc barcode."""
+    Luồng warm-up gọi ngay sau khi cửa sổ hiện; luồng chạy batch gọi lại trước khi dùng và chờ nếu
+    warm-up chưa xong. Code của App import các module này tại chỗ dùng (đã có sẵn trong sys.modules).
+    """
+    with _backend_lock:
+        if "backend" in STARTUP_TIMES:
+            return
+        for name in BACKEND_MODULES:
+            started = time.perf_counter()
+            importlib.import_module(name)
+            IMPORT_TIMES.append((name, time.perf_counter() - started))
+        STARTUP_TIMES["backend"] = time.perf_counter() - STARTED
+
+
+def format_startup_report():
+    """Báo cáo khởi động nhiều dòng: mốc cửa sổ / backend và thời gian nạp từng module (lâu nhất trước)."""
+    lines = []
+    if "window" in STARTUP_TIMES:
+        lines.append(f"First frame: {STARTUP_TIMES['window'] * 1000:.0f} ms")
+    if "backend" in STARTUP_TIMES:
+        lines.append(f"Decode/network stack ready: {STARTUP_TIMES['backend'] * 1000:.0f} ms (background)")
+    for name, seconds in sorted(IMPORT_TIMES, key=lambda t: -t[1]):
+        lines.append(f"  {name:<16}{seconds * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+def write_startup_report():
+    """In báo cáo khởi động; không có stdout thì ghi ra file, không ghi được file thì hiện messagebox."""
+    report = format_startup_report()
+    if sys.stdout is not None:
+        print(report)
+        return
+    base = os.path.dirname(sys.executable) if getattr(sys, "frozen", False) else os.path.dirname(os.path.abspath(__file__))
     try:
-        images = convert_from_bytes(pdf_bytes, dpi=300, poppler_path=poppler_path)
-    except Exception as e:
-        raise RuntimeError(f"convert_from_bytes error: {e}")
-
-    found = []
-    for img in images:
-        try:
-            codes = decode(img)
-            codes_sorted = sorted(codes, key=lambda c: c.rect.top)
-            for c in codes_sorted:
-                try:
-                    s = c.data.decode("utf-8")
-                except:
-                    s = c.data.decode(errors="ignore")
-                found.append(s)
-        except Exception:
-            continue
-    return found
-
-
-# ---------- Worker ----------
-def worker_thread(input_queue, output_list, poppler_path, progress_callback):
-    """Luồng xử lý từng URL."""
-    while True:
-        item = input_queue.get()
-        if item is None:
-            input_queue.task_done()
-            break
-        idx, url = item
-        try:
-            url = normalize_drive_url(url)
-            resp = requests.get(url, timeout=REQUEST_TIMEOUT)
-            resp.raise_for_status()
-            pdf_bytes = resp.content
-            codes = extract_tracking_from_pdf_bytes(pdf_bytes, poppler_path)
-            if codes:
-                raw = codes[0]
-                if raw.startswith("9631"):
-                    trimmed = raw[-12:]
-                else:
-                    trimmed = raw[TRIM_FROM:] if len(raw) > TRIM_FROM else raw
-                result = {"index": idx, "url": url, "raw": raw, "trimmed": trimmed, "error": ""}
-            else:
-                result = {"index": idx, "url": url, "raw": "", "trimmed": "N/A", "error": "Not found"}
-        except Exception as e:
-            result = {"index": idx, "url": url, "raw": "", "trimmed": "N/A", "error": str(e)}
-        output_list[idx] = result
-        input_queue.task_done()
-        progress_callback()
+        with open(os.path.join(base, STARTUP_REPORT_FILENAME), "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    except OSError:
+        messagebox.showinfo("Startup", report)
 
 
 # ---------- GUI ----------
@@ -120,7 +119,7 @@ class App:
         root.title("📦 PDF Barcode Batch Reader - Extract & Trim")
         root.geometry("950x620")
 
-        Label(root, text="Dán danh sách URL PDF hoặc link Google Drive (mỗi link 1 dòng):").pack(anchor="w", padx=8, pady=(8,0))
+        Label(root, text="Dán danh sách URL PDF, link Google Drive hoặc đường dẫn file PDF / thư mục / ZIP (mỗi dòng 1 mục):").pack(anchor="w", padx=8, pady=(8,0))
         self.txt = Text(root, height=12)
         self.txt.pack(fill="x", padx=8)
 
@@ -131,17 +130,24 @@ class App:
         self.btn_start.pack(side="left")
 
         Button(frame, text="📂 Load from file...", command=self.load_file).pack(side="left", padx=4)
+        Button(frame, text="📄 Add PDF/ZIP...", command=self.add_files).pack(side="left", padx=4)
+        Button(frame, text="📁 Add folder...", command=self.add_folder).pack(side="left", padx=4)
         Button(frame, text="💾 Save results...", command=self.save_results).pack(side="left", padx=4)
         Button(frame, text="📋 Copy trimmed", command=self.copy_trimmed).pack(side="left", padx=4)
         Button(frame, text="🔄 Refresh", command=self.refresh_all).pack(side="left", padx=4)
+        Button(frame, text="📊 Export metrics...", command=self.export_metrics).pack(side="left", padx=4)
 
         self.status_var = StringVar(value="Idle")
         Label(frame, textvariable=self.status_var).pack(side="left", padx=12)
 
         self.progress = ttk.Progressbar(root, length=400)
         self.progress.pack(fill="x", padx=8, pady=6)
+        self.summary_var = StringVar(value="")
+        summary = Label(root, textvariable=self.summary_var, anchor="w")
+        summary.pack(fill="x", padx=8)
+        summary.bind("<Double-Button-1>", self.show_startup_report)
 
-        cols = ("index", "url", "raw", "trimmed", "error")
+        cols = ("index", "url", "raw", "trimmed", "error", "carrier", "page")
         self.tree = ttk.Treeview(root, columns=cols, show="headings", height=12)
         for c in cols:
             self.tree.heading(c, text=c, command=lambda _col=c: self.treeview_sort_column(_col, False))
@@ -149,9 +155,16 @@ class App:
         self.tree.pack(fill="both", expand=True, padx=8, pady=6)
 
         self.results = []
-        self.input_queue = None
         self.total = 0
         self.processed = 0
+        self.cache = None
+        self.controller = None
+        self.job_label = ""
+        self.started = None
+        self.finished = None
+        self.warm_up_error = None
+        # ("row", result) / ("done", None) / ("error", message) từ luồng chạy batch
+        self.completion_queue = queue.Queue()
 
     def treeview_sort_column(self, col, reverse):
         data = [(self.tree.set(k, col), k) for k in self.tree.get_children('')]
@@ -167,12 +180,14 @@ class App:
         if not self.results:
             messagebox.showwarning("Warning", "Chưa có kết quả để copy!")
             return
+        from pipeline import label_rows
         trimmed_list = []
         for r in self.results:
             if not r:
                 trimmed_list.append("N/A")
-            else:
-                val = r.get("trimmed")
+                continue
+            for row in label_rows(r):
+                val = row.get("trimmed")
                 trimmed_list.append(val if val not in ("", None) else "N/A")
         text_to_copy = "\n".join(trimmed_list)
         self.root.clipboard_clear()
@@ -185,9 +200,13 @@ class App:
         self.tree.delete(*self.tree.get_children())
         self.progress["value"] = 0
         self.status_var.set("Idle")
+        self.summary_var.set("")
         self.results = []
         self.total = 0
         self.processed = 0
+        self.started = None
+        self.finished = None
+        self.completion_queue = queue.Queue()
 
     def load_file(self):
         path = filedialog.askopenfilename(filetypes=[("Text files","*.txt"),("All files","*.*")])
@@ -197,38 +216,131 @@ class App:
         self.txt.delete("1.0", END)
         self.txt.insert("1.0", data)
 
+    def append_inputs(self, paths):
+        """Thêm đường dẫn local vào ô nhập (đọc thẳng từ đĩa khi Start, không qua HTTP)."""
+        text = self.txt.get("1.0", END).rstrip("\n")
+        self.txt.delete("1.0", END)
+        self.txt.insert("1.0", "\n".join(([text] if text.strip() else []) + list(paths)))
+
+    def add_files(self):
+        paths = filedialog.askopenfilenames(filetypes=[("PDF / ZIP", "*.pdf *.zip"), ("All files", "*.*")])
+        if paths:
+            self.append_inputs(paths)
+
+    def add_folder(self):
+        path = filedialog.askdirectory()
+        if path:
+            self.append_inputs([path])
+
     def save_results(self):
         if not self.results:
             messagebox.showwarning("Warning", "Chưa có kết quả để lưu!")
             return
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV","*.csv")])
         if not path: return
+        from pipeline import label_rows
         with open(path, "w", newline="", encoding="utf-8") as csvf:
             writer = csv.writer(csvf)
-            writer.writerow(["index", "url", "raw", "trimmed", "error"])
+            writer.writerow(["index", "url", "raw", "trimmed", "error", "carrier", "page"])
             for idx, r in enumerate(self.results):
                 if not r:
-                    writer.writerow([idx, "", "", "N/A", "Pending"])
-                else:
-                    writer.writerow([r.get("index"), r.get("url"), r.get("raw"), r.get("trimmed"), r.get("error")])
+                    writer.writerow([idx, "", "", "N/A", "Pending", "", ""])
+                    continue
+                for row in label_rows(r):
+                    writer.writerow([row.get("index"), row.get("url"), row.get("raw"), row.get("trimmed"),
+                                     row.get("error"), row.get("carrier") or "", row.get("page") or ""])
         self.status_var.set(f"Saved {path}")
 
-    def update_progress(self):
-        self.processed += 1
-        if self.total:
-            self.progress["value"] = (self.processed / self.total) * 100
-        self.status_var.set(f"Processing {self.processed}/{self.total}")
+    def run_summary(self):
+        """Số đo theo tầng của batch hiện tại (tính trên các dòng đã xong)."""
+        from metrics import summarize_run
+        elapsed = None
+        if self.started is not None:
+            elapsed = (self.finished or time.time()) - self.started
+        return summarize_run(self.results, elapsed)
+
+    def export_metrics(self):
+        if not any(self.results):
+            messagebox.showwarning("Warning", "Chưa có kết quả để xuất metrics!")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+        if not path: return
+        from metrics import export_metrics
+        export_metrics(self.run_summary(), path)
+        self.status_var.set(f"Saved {path}")
 
-        for idx, r in enumerate(self.results):
-            if not r:
+    def drain_results(self, completion_queue):
+        """Lấy kết quả mới từ completion_queue theo lô: chỉ chèn dòng mới, cập nhật progress một lần mỗi lô."""
+        if completion_queue is not self.completion_queue:
+            return  # batch cũ (đã Refresh hoặc Start lại)
+        finished = None
+        drained = 0
+        while drained < DRAIN_BATCH:
+            try:
+                kind, payload = completion_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "total":
+                self.set_total(payload)
                 continue
-            iid = f"r{idx}"
-            if not self.tree.exists(iid):
-                self.tree.insert("", "end", iid, values=(r["index"], r["url"], r["raw"], r["trimmed"], r["error"]))
+            if kind != "row":
+                finished = (kind, payload)
+                break
+            self.add_result(payload)
+            drained += 1
+
+        if finished is None:
+            # Cả khi chưa có dòng mới: giới hạn tải / decode hiện tại vẫn có thể đổi (vd. host đang nghỉ vì 429)
+            self.update_progress()
+            # Lô đầy thì còn hàng chờ: lấy tiếp ngay sau khi Tk kịp vẽ lại
+            delay = 1 if drained == DRAIN_BATCH else DRAIN_INTERVAL_MS
+            self.root.after(delay, self.drain_results, completion_queue)
+        elif finished[0] == "error":
+            self.fail_batch(finished[1])
+        else:
+            self.finish_batch()
+
+    def add_result(self, r):
+        from pipeline import label_rows
+        idx = r["index"]
+        if self.results[idx] is None:
+            self.processed += 1
+        self.results[idx] = r
+        # PDF nhiều nhãn: mỗi số tracking một dòng trong bảng (r0, r0.1, r0.2, ...)
+        for n, row in enumerate(label_rows(r)):
+            values = (row["index"], row["url"], row["raw"], row["trimmed"], row["error"],
+                      row.get("carrier") or "", row.get("page") or "")
+            iid = f"r{idx}" if n == 0 else f"r{idx}.{n}"
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert("", "end", iid, values=values)
 
-        if self.processed >= self.total:
-            self.btn_start.config(state=NORMAL)
-            self.status_var.set("✅ Completed")
+    def set_total(self, total):
+        """Số dòng thật của batch sau khi mở rộng link thư mục Drive."""
+        self.results = self.results[:total] + [None] * max(0, total - len(self.results))
+        self.total = total
+        self.update_progress()
+
+    def update_progress(self):
+        if self.total:
+            self.progress["value"] = (self.processed / self.total) * 100
+        limits = ""
+        if self.controller is not None:
+            from concurrency import format_limits
+            limits = " | " + format_limits(self.controller.snapshot())
+        self.status_var.set(f"Processing {self.processed}/{self.total}{self.job_label}{limits}")
+
+    def finish_batch(self):
+        from extractor import format_rung_stats, merge_rung_stats
+        from metrics import format_summary
+        self.update_progress()
+        self.btn_start.config(state=NORMAL)
+        self.finished = time.time()
+        rung_totals = merge_rung_stats(self.results)
+        self.status_var.set("✅ Completed" + (f" | DPI hit/miss: {format_rung_stats(rung_totals)}" if rung_totals else ""))
+        self.summary_var.set("📊 " + format_summary(self.run_summary()))
 
     def start_processing(self):
         text = self.txt.get("1.0", END).strip()
@@ -246,35 +358,154 @@ class App:
         self.progress["value"] = 0
         self.processed = 0
         self.results = [None] * self.total
-
-        q = queue.Queue()
-        for idx, url in enumerate(urls):
-            q.put((idx, url))
-        num_workers = min(6, max(2, os.cpu_count() or 2))
-        for _ in range(num_workers):
-            q.put(None)
+        self.completion_queue = queue.Queue()
+        self.summary_var.set("")
+        self.started = time.time()
+        self.finished = None
 
         poppler_path = get_poppler_path()
-        if not os.path.exists(poppler_path):
+        if BACKEND == "poppler" and not os.path.exists(poppler_path):
             self.status_var.set(f"poppler path not found: {poppler_path}")
             self.btn_start.config(state=NORMAL)
             return
 
-        safe_progress_callback = lambda: self.root.after(0, self.update_progress)
+        t = threading.Thread(target=self.run_batch, args=(urls, poppler_path), daemon=True)
+        t.start()
+        self.status_var.set("Started processing...")
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_results, self.completion_queue)
+
+    def get_cache(self):
+        """Mở cache kết quả lần đầu cần dùng; không mở được thì chạy không cache."""
+        if self.cache is None and USE_CACHE:
+            from result_cache import ResultCache
+            try:
+                self.cache = ResultCache()
+            except Exception:
+                self.cache = None
+        return self.cache
+
+    def open_journal(self, urls):
+        """Journal của danh sách URL này (cùng danh sách -> cùng job); lỗi thì chạy không journal."""
+        if not USE_JOURNAL:
+            return None
+        from job_journal import JobJournal, job_id_for_urls
+        try:
+            return JobJournal(job_id_for_urls(urls))
+        except Exception:
+            return None
 
-        for _ in range(num_workers):
-            t = threading.Thread(target=worker_thread, args=(q, self.results, poppler_path, safe_progress_callback), daemon=True)
-            t.start()
+    def run_batch(self, urls, poppler_path):
+        """Chạy pipeline tải + decode trên luồng nền; kết quả đi qua completion_queue về Tk."""
+        completion_queue = self.completion_queue
+        try:
+            load_backend()
+        except Exception as e:
+            completion_queue.put(("error", f"Cannot load decoder: {e}"))
+            return
+        from concurrency import ConcurrencyController
+        from fetcher import PER_HOST_LIMIT as DEFAULT_PER_HOST_LIMIT
+        from job_journal import is_completed
+        from local_files import expand_inputs
+        from pipeline import DEFAULT_DECODE_WORKERS, DEFAULT_DOWNLOAD_WORKERS, run_pipeline
+        journal = None
+        completed = set()
+
+        def show(result):
+            if is_completed(result):
+                completed.add(result["index"])
+            completion_queue.put(("row", result))
+
+        def on_result(result):
+            if journal is not None:
+                journal.append(result)
+            show(result)
 
-        self.input_queue = q
-        self.status_var.set("Started processing...")
+        try:
+            # Thư mục / ZIP local, link thư mục Drive -> từng PDF bên trong (cần đọc đĩa / mạng nên làm ở đây, không chặn Tk)
+            expanded = list(expand_inputs(urls))
+            if not expanded:
+                raise RuntimeError("No PDF found in the given URLs / paths")
+            if expanded != urls:
+                urls = expanded
+                completion_queue.put(("total", len(urls)))
+            # Journal theo danh sách đã mở rộng: các dòng trong journal đánh số theo danh sách này
+            journal = self.open_journal(urls)
+            self.job_label = f" | job {journal.job_id}" if journal is not None else ""
+            download_workers = DOWNLOAD_WORKERS or DEFAULT_DOWNLOAD_WORKERS
+            decode_workers = DECODE_WORKERS or DEFAULT_DECODE_WORKERS
+            per_host_limit = PER_HOST_LIMIT or DEFAULT_PER_HOST_LIMIT
+            self.controller = ConcurrencyController(download_workers, decode_workers, per_host_limit,
+                                                    adaptive=ADAPTIVE_CONCURRENCY)
+            skip = None
+            if journal is not None:
+                # Các dòng đã xong ở lần chạy trước: hiện lại ngay, không tải/decode nữa
+                for row in journal.completed_rows():
+                    if 0 <= row["index"] < len(urls):
+                        show(row)
+                skip = journal.is_done
+            run_pipeline(urls, poppler_path, on_result, EXTRACT_OPTIONS,
+                         download_workers=download_workers, decode_workers=decode_workers,
+                         per_host_limit=per_host_limit, cache=self.get_cache(), skip=skip,
+                         controller=self.controller)
+        except Exception as e:
+            completion_queue.put(("error", str(e)))
+            if journal is not None:
+                journal.close()
+            return
+        if journal is not None:
+            # Xong trọn vẹn thì bỏ journal (Start lại sẽ chạy từ đầu, có cache);
+            # còn dòng lỗi thì giữ lại để Start lần nữa chỉ chạy lại các dòng đó
+            if len(completed) == len(urls):
+                journal.discard()
+            else:
+                journal.close()
+        completion_queue.put(("done", None))
+
+    def fail_batch(self, error):
+        self.finished = time.time()
+        self.btn_start.config(state=NORMAL)
+        self.status_var.set(f"❌ Error: {error}")
+
+    def on_first_frame(self, report_and_exit=False):
+        """Cửa sổ đã vẽ xong: ghi mốc khởi động rồi nạp stack decode / mạng trên luồng nền."""
+        STARTUP_TIMES["window"] = time.perf_counter() - STARTED
+        warm_up = threading.Thread(target=self.warm_up, daemon=True)
+        warm_up.start()
+        self.root.after(WARM_UP_POLL_MS, self.check_warm_up, warm_up, report_and_exit)
+
+    def warm_up(self):
+        try:
+            load_backend()
+        except Exception as e:
+            # Không chặn app: bấm Start sẽ thử nạp lại và báo lỗi trên dòng trạng thái
+            self.warm_up_error = str(e)
+
+    def check_warm_up(self, warm_up, report_and_exit):
+        if warm_up.is_alive():
+            self.root.after(WARM_UP_POLL_MS, self.check_warm_up, warm_up, report_and_exit)
+            return
+        if report_and_exit:
+            write_startup_report()
+            self.root.destroy()
+            return
+        if self.warm_up_error:
+            self.status_var.set(f"❌ Cannot load decoder: {self.warm_up_error}")
+        elif not self.summary_var.get():
+            self.summary_var.set(f"⏱ Startup: window {STARTUP_TIMES['window'] * 1000:.0f} ms, decoder ready "
+                                 f"{STARTUP_TIMES['backend'] * 1000:.0f} ms (double-click for details)")
+
+    def show_startup_report(self, event=None):
+        if STARTUP_TIMES:
+            messagebox.showinfo("Startup", format_startup_report())
 
 
 # ---------- Run ----------
 def main():
     root = Tk()
     app = App(root)
+    root.after_idle(app.on_first_frame, STARTUP_REPORT_FLAG in sys.argv[1:])
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -6,7 +6,9 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('poppler_bin', 'poppler_bin')],
-    hiddenimports=['pyzbar.pyzbar'],
+    # main.py nạp stack decode / mạng bằng importlib sau khi cửa sổ hiện (xem BACKEND_MODULES)
+    hiddenimports=['pyzbar.pyzbar', 'extractor', 'localizer', 'concurrency', 'drive', 'fetcher', 'local_files', 'rules',
+                   'result_cache', 'job_journal', 'metrics', 'pipeline'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,182 @@
+"""Tổng hợp số đo theo tầng của một batch (từ các dòng kết quả) và xuất ra JSON hoặc Prometheus text.
+
+Mỗi dòng kết quả (pipeline.make_result) mang số đo của riêng nó: bytes tải về, thời gian tải / chờ decode /
+render / decode, số trang render và số lần gọi decoder. summarize_run() gộp chúng thành bản tóm tắt của cả
+batch để biết tầng nào đang chậm (mạng, backend render hay decoder) khi tính toán năng lực xử lý.
+"""
+import json
+import math
+from array import array
+from typing import Dict, Iterable, List
+
+from extractor import merge_rung_stats
+
+# ---------- Cấu hình ----------
+# Tầng -> trường thời gian (ms) trên dòng kết quả
+STAGE_FIELDS = {"download": "download_ms", "queue": "queue_ms", "render": "render_ms", "decode": "decode_ms"}
+# Các trường đếm được cộng dồn cho cả batch
+COUNTER_FIELDS = ("bytes", "pages_rendered", "decode_attempts")
+METRIC_PREFIX = "pdf_barcode"
+QUANTILES = (0.5, 0.95)
+
+
+# ---------- Summary ----------
+def percentile(values: List[float], pct: float) -> float | None:
+    """Percentile kiểu nearest-rank; danh sách rỗng -> None."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered)))) - 1]
+
+
+def _stage_summary(values: List[float]) -> Dict:
+    summary = {"count": len(values), "sum_ms": round(sum(values), 1)}
+    summary["mean_ms"] = round(sum(values) / len(values), 1) if values else None
+    for q in QUANTILES:
+        value = percentile(values, q * 100)
+        summary[f"p{round(q * 100)}_ms"] = None if value is None else round(value, 1)
+    summary["max_ms"] = round(max(values), 1) if values else None
+    return summary
+
+
+class RunMetrics:
+    """Cộng dồn số đo của từng dòng khi batch đang chạy. Không giữ lại dòng kết quả, nhưng vẫn giữ mọi
+    mẫu thời gian để tính phân vị: mỗi dòng thêm 8 byte / stage vào array, tức RAM tăng tuyến tính theo
+    số dòng (nhỏ hơn nhiều so với giữ dict kết quả). summary() -> bản tóm tắt hiện tại."""
+
+    def __init__(self):
+        self.rows = 0
+        self.outcomes = {"found": 0, "not_found": 0, "error": 0}
+        self.cached = 0
+        self.duplicates = 0
+        self.totals = dict.fromkeys(COUNTER_FIELDS, 0)
+        self.samples = {stage: array("d") for stage in STAGE_FIELDS}
+        self.sources = {}
+        self.decoders = {}
+        self.rungs = {}
+
+    def add(self, row: Dict):
+        self.rows += 1
+        if row.get("raw"):
+            self.outcomes["found"] += 1
+        elif row.get("error") == "Not found":
+            self.outcomes["not_found"] += 1
+        else:
+            self.outcomes["error"] += 1
+        if row.get("cached"):
+            self.cached += 1
+        if row.get("duplicate_of") is not None:
+            self.duplicates += 1
+        for field in COUNTER_FIELDS:
+            self.totals[field] += row.get(field) or 0
+        for stage, field in STAGE_FIELDS.items():
+            if row.get(field) is not None:
+                self.samples[stage].append(row[field])
+        if row.get("source"):
+            self.sources[row["source"]] = self.sources.get(row["source"], 0) + 1
+        if row.get("decoder"):
+            self.decoders[row["decoder"]] = self.decoders.get(row["decoder"], 0) + 1
+        if row.get("rungs"):
+            self.rungs = merge_rung_stats([{"rungs": self.rungs}, row])
+
+    def summary(self, wall_seconds: float | None = None) -> Dict:
+        """wall_seconds: thời gian chạy của batch, để tính số dòng / giây."""
+        return {
+            "rows": self.rows,
+            "outcomes": dict(self.outcomes),
+            "cached": self.cached,
+            "duplicates": self.duplicates,
+            **self.totals,
+            "stages": {stage: _stage_summary(list(values)) for stage, values in self.samples.items()},
+            "sources": dict(self.sources),
+            "decoders": dict(self.decoders),
+            "rungs": self.rungs,
+            "wall_seconds": None if wall_seconds is None else round(wall_seconds, 2),
+            "rows_per_second": round(self.rows / wall_seconds, 2) if wall_seconds else None,
+        }
+
+
+def summarize_run(rows: Iterable[Dict | None], wall_seconds: float | None = None) -> Dict:
+    """Bản tóm tắt của cả batch từ các dòng kết quả (None = chưa xong, bị bỏ qua)."""
+    metrics = RunMetrics()
+    for row in rows:
+        if row:
+            metrics.add(row)
+    return metrics.summary(wall_seconds)
+
+
+def format_summary(summary: Dict) -> str:
+    """Một dòng ngắn cho status bar của UI."""
+    parts = [f"{summary['rows']} rows"]
+    if summary["rows_per_second"] is not None:
+        parts.append(f"{summary['rows_per_second']:g} rows/s")
+    parts.append(f"{summary['bytes'] / (1024 * 1024):.1f} MB")
+    for stage, s in summary["stages"].items():
+        if s["count"]:
+            parts.append(f"{stage} p50 {s['p50_ms']:g} ms")
+    parts.append(f"{summary['pages_rendered']} pages")
+    return " · ".join(parts)
+
+
+# ---------- Export ----------
+def to_json(summary: Dict) -> str:
+    return json.dumps(summary, indent=1, ensure_ascii=False)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, value, labels: Dict | None = None) -> str:
+    text = name
+    if labels:
+        text += "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}"
+    return f"{text} {value if isinstance(value, int) else repr(float(value))}"
+
+
+def to_prometheus(summary: Dict, prefix: str = METRIC_PREFIX) -> str:
+    """Bản tóm tắt -> Prometheus text exposition format (thời gian đổi sang giây)."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for suffix, value, labels in samples:
+            lines.append(_sample(f"{prefix}_{name}{suffix}", value, labels))
+
+    metric("rows_total", "counter", "Result rows by outcome.",
+           [("", n, {"outcome": k}) for k, n in summary["outcomes"].items()])
+    metric("cached_rows_total", "counter", "Result rows served from the result cache.",
+           [("", summary["cached"], None)])
+    metric("duplicate_rows_total", "counter", "Result rows reused from a duplicate URL or PDF in the batch.",
+           [("", summary["duplicates"], None)])
+    metric("download_bytes_total", "counter", "PDF bytes downloaded.", [("", summary["bytes"], None)])
+    metric("pages_rendered_total", "counter", "Pages rasterized.", [("", summary["pages_rendered"], None)])
+    metric("decode_attempts_total", "counter", "Barcode decoder calls.", [("", summary["decode_attempts"], None)])
+    stage_samples = []
+    for stage, s in summary["stages"].items():
+        for q in QUANTILES:
+            value = s[f"p{round(q * 100)}_ms"]
+            if value is not None:
+                stage_samples.append(("", value / 1000, {"stage": stage, "quantile": f"{q:g}"}))
+        stage_samples.append(("_sum", s["sum_ms"] / 1000, {"stage": stage}))
+        stage_samples.append(("_count", s["count"], {"stage": stage}))
+    metric("stage_seconds", "summary", "Per-PDF time spent in each stage.", stage_samples)
+    metric("rows_by_source_total", "counter", "Rows with a barcode by source (text/image/raster).",
+           [("", n, {"source": k}) for k, n in sorted(summary["sources"].items())])
+    metric("rows_by_decoder_total", "counter", "Rows with a barcode by decoder.",
+           [("", n, {"decoder": k}) for k, n in sorted(summary["decoders"].items())])
+    metric("dpi_rung_total", "counter", "Decode passes per DPI rung by outcome.",
+           [("", c[outcome], {"dpi": dpi, "outcome": outcome})
+            for dpi, c in summary["rungs"].items() for outcome in ("hit", "miss")])
+    if summary["wall_seconds"] is not None:
+        metric("run_seconds", "gauge", "Wall time of the batch.", [("", summary["wall_seconds"], None)])
+        metric("rows_per_second", "gauge", "Batch throughput.", [("", summary["rows_per_second"] or 0.0, None)])
+    return "\n".join(lines) + "\n"
+
+
+def export_metrics(summary: Dict, path: str):
+    """Ghi bản tóm tắt ra file: đuôi .json -> JSON, còn lại -> Prometheus text (vd. .prom)."""
+    data = to_json(summary) if path.lower().endswith(".json") else to_prometheus(summary)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
@@ -0,0 +1,432 @@
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Sized
+
+from concurrency import ConcurrencyController
+from drive import drive_file_id, drive_folder_id
+from extractor import extract_tracking_from_pdf_bytes, extract_tracking_from_pdf_path
+from fetcher import (MAX_PDF_SIZE, MAX_RETRIES, PER_HOST_LIMIT, REQUEST_TIMEOUT, RETRY_BACKOFF, Fetcher,
+                     discard_pdf_file)
+from local_files import LocalReader, is_local, normalize_input
+from result_cache import ResultCache, conditional_headers
+from rules import DEFAULT_RULES, classify, is_tracking, select_code
+
+# ---------- Cấu hình ----------
+# Tầng tải (I/O) chạy bằng thread, tầng decode (CPU, tranh GIL) chạy bằng process
+DEFAULT_DOWNLOAD_WORKERS = 16
+DEFAULT_DECODE_WORKERS = os.cpu_count() or 2
+# Số đo theo tầng trên mỗi dòng kết quả (xem metrics.summarize_run): byte tải về, thời gian (ms) tải,
+# chờ process decode rảnh, trong backend render, khoanh vùng + decode; số trang render, số lần gọi decoder
+METRIC_FIELDS = ("bytes", "download_ms", "queue_ms", "render_ms", "decode_ms", "pages_rendered", "decode_attempts")
+# Chống trùng trong batch: nhớ kết quả của DEDUP_WINDOW URL / nội dung PDF xong gần nhất để trả lại cho
+# các dòng trùng đến sau (URL / nội dung đang xử lý thì luôn được gộp, không giới hạn)
+DEDUP_WINDOW = 10000
+
+
+# ---------- Result ----------
+def trim_code(raw: str, rules: Iterable[Dict] = DEFAULT_RULES) -> str:
+    """Cắt barcode thô ra số tracking theo bảng luật (xem rules.py)."""
+    hit = classify(raw, rules)
+    return hit[0] if hit is not None else raw
+
+
+def _label_entries(labels: List[Dict], rules: Iterable[Dict]) -> List[Dict]:
+    """Các mã đọc được ở chế độ nhiều nhãn -> chỉ giữ số tracking theo bảng luật, kèm trang + vị trí."""
+    entries = []
+    for label in labels:
+        hit = classify(label["code"], rules)
+        if hit is not None:
+            entries.append({"page": label["page"], "raw": label["code"], "trimmed": hit[0],
+                            "carrier": hit[1] or None, "box": label["box"], "dpi": label.get("dpi"),
+                            "region": label.get("region"), "decoder": label.get("decoder")})
+    return entries
+
+
+def make_result(idx: int, url: str, codes: List[str] | None = None, error: str = "",
+                stats: Dict | None = None, cached: bool = False, rules: Iterable[Dict] = DEFAULT_RULES) -> Dict:
+    """Dựng một dòng kết quả; không có codes và không có lỗi -> "Not found".
+
+    Mã của dòng là mã đầu tiên là số tracking theo `rules`; không mã nào là số tracking (vd. chỉ đọc được
+    barcode mã ZIP bị luật skip) -> cũng là "Not found". stats["labels"] (chế độ nhiều nhãn) ->
+    result["labels"]: mọi số tracking trong PDF kèm trang + vị trí (xem label_rows).
+    """
+    stats = stats or {}
+    labels = None
+    if stats.get("labels") is not None:
+        labels = _label_entries(stats["labels"], rules)
+        codes = [label["raw"] for label in labels]
+    raw = select_code(codes, rules) if codes else None
+    if raw is not None:
+        trimmed, carrier = classify(raw, rules)
+        result = {"index": idx, "url": url, "raw": raw, "trimmed": trimmed, "error": "", "carrier": carrier or None}
+    else:
+        result = {"index": idx, "url": url, "raw": "", "trimmed": "N/A", "error": error or "Not found",
+                  "carrier": None}
+    result["source"] = stats.get("source")
+    result["dpi"] = stats.get("dpi")
+    result["region"] = stats.get("region")
+    result["decoder"] = stats.get("decoder")
+    result["rungs"] = stats.get("rungs", {})
+    result["cached"] = cached
+    result["duplicate_of"] = None
+    result["labels"] = labels
+    for field in METRIC_FIELDS:
+        result[field] = stats.get(field)
+    return result
+
+
+def label_rows(result: Dict) -> List[Dict]:
+    """Dòng kết quả của PDF nhiều nhãn -> mỗi số tracking một dòng (cùng index / url, thêm label =
+    thứ tự trong PDF, page, box); dòng thường -> [result]. Dùng khi ghi / hiển thị kết quả."""
+    labels = result.get("labels")
+    if not labels:
+        return [result]
+    base = {k: v for k, v in result.items() if k != "labels"}
+    return [{**base, "label": n, **label} for n, label in enumerate(labels)]
+
+
+def _reject_drive_folder(url: str):
+    """Link thư mục Drive còn lại trong batch = expand_drive_folders() không liệt kê được nó."""
+    if drive_folder_id(url) is not None:
+        raise RuntimeError("Drive folder could not be expanded (not shared publicly, or no PDF inside)")
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def cached_result(idx: int, url: str, entry: Dict, rules: Iterable[Dict] = DEFAULT_RULES) -> Dict:
+    """Dòng kết quả lấy từ cache (không render nên không có bộ đếm nấc DPI), chọn + cắt mã theo `rules`."""
+    result = make_result(idx, url, entry["codes"], stats=entry["stats"], cached=True, rules=rules)
+    result["rungs"] = {}
+    return result
+
+
+def duplicate_result(result: Dict, idx: int, url: str, stats: Dict | None = None) -> Dict:
+    """Dòng kết quả cho một bản trùng (cùng URL / cùng nội dung): mã và lỗi như dòng gốc,
+    duplicate_of = index dòng gốc; số đo là của riêng nó (không render / decode lại)."""
+    stats = stats or {}
+    original = result["index"] if result.get("duplicate_of") is None else result["duplicate_of"]
+    dup = dict(result, index=idx, url=url, rungs={}, duplicate_of=original)
+    for field in METRIC_FIELDS:
+        dup[field] = stats.get(field)
+    return dup
+
+
+def dedup_key(url: str) -> str:
+    """Khóa chống trùng của một URL: các link khác nhau tới cùng file Drive có cùng khóa."""
+    url = normalize_input(url)
+    file_id = drive_file_id(url)
+    return f"drive:{file_id}" if file_id is not None else url
+
+
+# ---------- Stages ----------
+def decode_pdf(idx: int, url: str, pdf: bytes | str, poppler_path: str | None,
+               extract_options: Dict | None = None) -> Dict:
+    """Tầng CPU: rasterize + decode một PDF đã tải (chạy được trong process con).
+
+    pdf: nội dung PDF (bytes) hoặc đường dẫn file tạm của PDF lớn (poppler đọc thẳng, không copy).
+    extract_options: tham số của extract_tracking_from_pdf_path, thêm "rules" = bảng luật chọn + cắt mã.
+    """
+    stats = {}
+    options = dict(extract_options or {})
+    rules = options.pop("rules", None) or DEFAULT_RULES
+    extract = extract_tracking_from_pdf_path if isinstance(pdf, str) else extract_tracking_from_pdf_bytes
+    try:
+        # Chỉ dừng tìm khi đọc được số tracking: barcode mã ZIP / routing đọc được trước không tính
+        codes = extract(pdf, poppler_path, first_only=True, stats=stats,
+                        accept=functools.partial(is_tracking, rules=rules), **options)
+    except Exception as e:
+        return make_result(idx, url, error=str(e), stats=stats, rules=rules)
+    return make_result(idx, url, codes, stats=stats, rules=rules)
+
+
+def fetch_stage(idx: int, url: str, fetcher: Fetcher, cache: ResultCache | None = None,
+                bypass_cache: bool = False, local_reader: LocalReader | None = None,
+                rules: Iterable[Dict] = DEFAULT_RULES):
+    """Tầng I/O: chuẩn hóa URL, tải PDF (có điều kiện nếu có cache).
+
+    Đầu vào local (đường dẫn file, PDF trong ZIP) được đọc bằng `local_reader` thay vì qua HTTP;
+    file PDF thường đi thẳng tới tầng decode dưới dạng LocalPath (không chép, không bị xóa).
+
+    -> (idx, url, pdf, result, cache_key, fetched): `result` khác None khi đã có kết quả ngay
+    (lỗi tải hoặc trúng cache); ngược lại `pdf` (bytes, hoặc đường dẫn file tạm với PDF lớn)
+    cần được decode rồi discard_pdf_file, và cache_key = (sha256, etag, last_modified) dùng để
+    lưu kết quả vào cache sau đó. fetched = {"bytes", "download_ms", "fetched_at", "sha256"}: số đo
+    của lần tải (fetched_at = perf_counter lúc tải xong, để tính thời gian chờ decode) và SHA-256
+    của nội dung.
+    bypass_cache=True: không đọc cache nhưng vẫn ghi kết quả mới vào.
+    rules: bảng luật chọn + cắt mã cho dòng lấy từ cache.
+    """
+    started = time.perf_counter()
+    fetched = {"bytes": None, "download_ms": None, "fetched_at": None, "sha256": None}
+
+    def ready(result):
+        result["bytes"] = fetched["bytes"]
+        result["download_ms"] = fetched["download_ms"]
+        return idx, url, None, result, None, fetched
+
+    try:
+        source = fetcher
+        if is_local(url):
+            source = local_reader if local_reader is not None else LocalReader()
+        url = normalize_input(url)
+        _reject_drive_folder(url)
+        entry = cache.lookup_url(url) if cache is not None and not bypass_cache else None
+        meta = {}
+        spooled = source.fetch_spooled(url, headers=conditional_headers(entry), meta=meta)
+        fetched["bytes"] = spooled.size
+        fetched["sha256"] = spooled.sha256
+        fetched["download_ms"] = _elapsed_ms(started)
+        fetched["fetched_at"] = time.perf_counter()
+        if entry is not None and meta.get("status") == 304:
+            spooled.cleanup()
+            cache.remember_url(url, entry["sha256"], entry["etag"], entry["last_modified"])
+            return ready(cached_result(idx, url, entry, rules))
+        if cache is None:
+            return idx, url, spooled.payload(), None, None, fetched
+        cache_key = (spooled.sha256, meta.get("etag"), meta.get("last_modified"))
+        hit = cache.lookup_content(cache_key[0]) if not bypass_cache else None
+        if hit is not None:
+            spooled.cleanup()
+            cache.remember_url(url, *cache_key)
+            return ready(cached_result(idx, url, hit, rules))
+        return idx, url, spooled.payload(), None, cache_key, fetched
+    except Exception as e:
+        fetched["download_ms"] = _elapsed_ms(started)
+        return ready(make_result(idx, url, error=str(e)))
+
+
+def _store_in_cache(cache: ResultCache | None, url: str, cache_key, result: Dict):
+    """Lưu kết quả decode vào cache; lỗi cache không được làm hỏng dòng kết quả."""
+    if cache is None or cache_key is None or not result.get("raw"):
+        return
+    sha256, etag, last_modified = cache_key
+    stats = {k: result.get(k) for k in ("source", "dpi", "region", "decoder")}
+    try:
+        cache.store(url, sha256, [result["raw"]], stats, etag, last_modified)
+    except Exception:
+        pass
+
+
+# ---------- Pipeline ----------
+def run_pipeline(urls: Iterable[str], poppler_path: str | None, on_result: Callable[[Dict], None],
+                 extract_options: Dict | None = None, download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+                 decode_workers: int = DEFAULT_DECODE_WORKERS, queue_size: int | None = None,
+                 per_host_limit: int = PER_HOST_LIMIT, request_timeout: float = REQUEST_TIMEOUT,
+                 cache: ResultCache | None = None, bypass_cache: bool = False,
+                 stop_event: threading.Event | None = None, retries: int = MAX_RETRIES,
+                 retry_backoff: float = RETRY_BACKOFF, max_pdf_size: int | None = MAX_PDF_SIZE,
+                 skip: Callable[[int, str], bool] | None = None,
+                 pool: Executor | None = None, decode_limit: Callable[[], int] | None = None,
+                 dedup: bool = True, controller: ConcurrencyController | None = None) -> None:
+    """Xử lý một batch URL theo hai tầng độc lập.
+
+    - Tầng tải: `download_workers` thread tải PDF qua một Fetcher dùng chung (giữ kết nối keep-alive,
+      tối đa `per_host_limit` request đồng thời mỗi host) và đẩy vào một hàng đợi giới hạn `queue_size`
+      (mặc định 2 x decode_workers); hàng đợi đầy thì tầng tải phải chờ, nên RAM không phình ra.
+    - Tầng decode: ProcessPoolExecutor `decode_workers` process chạy rasterize + decode.
+    - controller (concurrency.ConcurrencyController): số request mỗi host và số PDF decode cùng lúc tự
+      điều chỉnh trong giới hạn `per_host_limit` / `decode_workers` (host chặn 429 / hết quota thì giảm và
+      chờ theo Retry-After, RAM / CPU hết chỗ thì decode ít lại); mặc định tạo một controller thích ứng
+      mới, truyền vào để đọc giới hạn hiện tại (snapshot) từ UI, hoặc adaptive=False để giữ số cố định.
+    - cache (ResultCache): URL/nội dung đã có kết quả thì không decode lại; bypass_cache=True để
+      bỏ qua phần đọc cache (vẫn ghi kết quả mới).
+    - retries / retry_backoff: số lần thử lại và thời gian chờ ban đầu khi gặp lỗi mạng tạm thời.
+    - max_pdf_size: PDF lớn hơn (byte) bị hủy khi đang tải, dòng kết quả báo lỗi "PDF too large".
+      PDF lớn được ghi tạm ra đĩa trong lúc chờ decode thay vì giữ trong RAM.
+    - skip(idx, url) -> True: bỏ qua URL đó (vd. đã xong trong lần chạy trước của cùng job),
+      không tạo dòng kết quả nào cho nó.
+    - pool: process pool dùng chung giữa nhiều batch (không bị đóng khi batch xong); mặc định tạo
+      pool riêng `decode_workers` process. decode_limit() -> số PDF tối đa đang decode cùng lúc,
+      được hỏi lại liên tục để chia pool dùng chung cho các batch đang chạy (thêm vào giới hạn của controller).
+    - dedup: URL trùng (sau chuẩn hóa, kể cả các link khác nhau tới cùng file Drive) chỉ tải một lần;
+      PDF tải về trùng nội dung (SHA-256) với một PDF đang / vừa decode thì không decode lại. Mỗi
+      index vẫn có đúng một dòng kết quả (bản trùng có duplicate_of = index dòng gốc).
+    - extract_options["multi_label"]: đọc mọi nhãn trong PDF, dòng kết quả có "labels" (xem label_rows);
+      chế độ này không dùng cache (cache chỉ giữ một mã mỗi PDF). extract_options["rules"]: bảng luật
+      chọn + cắt mã, áp dụng cả cho dòng lấy từ cache.
+
+    Mỗi phần tử của `urls` là URL hoặc đầu vào local (file PDF, "a.zip!x.pdf"; xem local_files.py,
+    thư mục / ZIP cần expand_inputs trước). `urls` có thể là iterator (vd. đọc dần từ file): URL chỉ được lấy ra khi có luồng tải rảnh,
+    index của dòng kết quả là thứ tự của URL trong `urls`.
+    on_result(result) luôn được gọi trên luồng đang chạy run_pipeline, theo thứ tự hoàn thành.
+    Đặt stop_event để dừng sớm: các URL chưa bắt đầu sẽ không được xử lý.
+    """
+    if isinstance(urls, Sized):
+        if len(urls) == 0:
+            return
+        download_workers = min(download_workers, len(urls))
+        decode_workers = min(decode_workers, len(urls))
+    download_workers = max(1, download_workers)
+    decode_workers = max(1, decode_workers)
+    pdf_queue = queue.Queue(maxsize=queue_size or decode_workers * 2)
+    todo = enumerate(urls)
+    todo_lock = threading.Lock()
+    if controller is None:
+        controller = ConcurrencyController(download_workers, decode_workers, per_host_limit)
+    fetcher = Fetcher(pool_size=download_workers, per_host_limit=per_host_limit, timeout=request_timeout,
+                      retries=retries, retry_backoff=retry_backoff, max_size=max_pdf_size, controller=controller)
+    local_reader = LocalReader(max_size=max_pdf_size)
+    rules = (extract_options or {}).get("rules")
+    if (extract_options or {}).get("multi_label"):
+        cache = None
+    # Chống trùng: URL / nội dung đang xử lý -> index dòng gốc, đã xong -> kết quả (giữ DEDUP_WINDOW cái);
+    # followers[index gốc] = các dòng trùng chờ kết quả của nó: (idx, url, số đo, cache_key)
+    dedup_lock = threading.Lock()
+    url_inflight, url_done = {}, OrderedDict()
+    content_inflight, content_done = {}, OrderedDict()
+    leader_keys = {}
+    followers = {}
+
+    def remember(done: OrderedDict, key, result):
+        done[key] = result
+        if len(done) > DEDUP_WINDOW:
+            done.popitem(last=False)
+
+    def deliver(result):
+        """Trả một dòng kết quả, rồi trả bản sao cho các dòng trùng đang chờ nó."""
+        on_result(result)
+        with dedup_lock:
+            key, sha256 = leader_keys.pop(result["index"], (None, None))
+            if key is not None:
+                url_inflight.pop(key, None)
+                remember(url_done, key, result)
+            if sha256 is not None:
+                content_inflight.pop(sha256, None)
+                remember(content_done, sha256, result)
+            waiting = followers.pop(result["index"], [])
+        for idx, url, stats, cache_key in waiting:
+            dup = duplicate_result(result, idx, url, stats)
+            _store_in_cache(cache, url, cache_key, dup)
+            deliver(dup)
+
+    def coalesce(idx, url, pdf, cache_key, metrics, sha256) -> bool:
+        """PDF trùng nội dung với một PDF đang / vừa decode -> gộp vào đó thay vì decode lại."""
+        with dedup_lock:
+            done = content_done.get(sha256)
+            leader = content_inflight.get(sha256) if done is None else None
+            if done is None and leader is None:
+                content_inflight[sha256] = idx
+                key, _ = leader_keys.get(idx, (None, None))
+                leader_keys[idx] = (key, sha256)
+                return False
+            if leader is not None:
+                followers.setdefault(leader, []).append((idx, url, metrics, cache_key))
+        discard_pdf_file(pdf)
+        if done is not None:
+            dup = duplicate_result(done, idx, url, metrics)
+            _store_in_cache(cache, url, cache_key, dup)
+            deliver(dup)
+        return True
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    def hand_off(item):
+        while not stopped():
+            try:
+                pdf_queue.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+        discard_pdf_file(item[2])
+
+    def download_stage():
+        while not stopped():
+            with todo_lock:
+                try:
+                    idx, url = next(todo)
+                except StopIteration:
+                    return
+            if skip is not None and skip(idx, url):
+                continue
+            if dedup:
+                key = dedup_key(url)
+                with dedup_lock:
+                    done = url_done.get(key)
+                    leader = url_inflight.get(key) if done is None else None
+                    if done is None and leader is None:
+                        url_inflight[key] = idx
+                        leader_keys[idx] = (key, None)
+                    elif leader is not None:
+                        followers.setdefault(leader, []).append((idx, normalize_input(url), None, None))
+                        continue
+                if done is not None:
+                    hand_off((idx, url, None, duplicate_result(done, idx, normalize_input(url)), None, None))
+                    continue
+            hand_off(fetch_stage(idx, url, fetcher, cache, bypass_cache, local_reader, rules or DEFAULT_RULES))
+
+    try:
+        threads = [threading.Thread(target=download_stage, daemon=True) for _ in range(download_workers)]
+        for t in threads:
+            t.start()
+
+        pending = {}
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=decode_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            while not stopped():
+                # Kiểm tra luồng tải trước hàng đợi: luồng đã dừng thì mọi PDF của nó đã nằm trong hàng đợi
+                downloading = any(t.is_alive() for t in threads)
+                if not downloading and not pending and pdf_queue.empty():
+                    break
+                # Chỉ nhận thêm PDF khi còn process rảnh; phần còn lại nằm chờ trong pdf_queue
+                limit = min(decode_workers, controller.decode_limit())
+                if decode_limit is not None:
+                    limit = max(1, min(limit, decode_limit()))
+                while len(pending) < limit:
+                    try:
+                        idx, url, pdf, ready, cache_key, fetched = pdf_queue.get(block=not pending, timeout=0.1)
+                    except queue.Empty:
+                        break
+                    if ready is not None:
+                        deliver(ready)
+                        continue
+                    metrics = {"bytes": fetched["bytes"], "download_ms": fetched["download_ms"],
+                               "queue_ms": round((time.perf_counter() - fetched["fetched_at"]) * 1000, 1)}
+                    if dedup and coalesce(idx, url, pdf, cache_key, metrics, fetched["sha256"]):
+                        continue
+                    try:
+                        future = pool.submit(decode_pdf, idx, url, pdf, poppler_path, extract_options)
+                    except Exception as e:
+                        discard_pdf_file(pdf)
+                        deliver(make_result(idx, url, error=str(e), stats=metrics))
+                        continue
+                    pending[future] = (idx, url, pdf, cache_key, metrics)
+                if not pending:
+                    continue
+                finished, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    idx, url, pdf, cache_key, metrics = pending.pop(future)
+                    try:
+                        result = future.result()
+                        result.update(metrics)
+                    except Exception as e:
+                        result = make_result(idx, url, error=str(e), stats=metrics)
+                    discard_pdf_file(pdf)
+                    _store_in_cache(cache, url, cache_key, result)
+                    deliver(result)
+            for future in pending:
+                future.cancel()
+        finally:
+            if own_pool:
+                pool.shutdown()
+            for _, _, pdf, _, _ in pending.values():
+                discard_pdf_file(pdf)
+    finally:
+        fetcher.close()
+        local_reader.close()
+        # Dừng sớm: PDF đã tải nhưng chưa decode có thể còn file tạm trong hàng đợi
+        while True:
+            try:
+                discard_pdf_file(pdf_queue.get_nowait()[2])
+            except queue.Empty:
+                break
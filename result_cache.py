@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List
+
+# ---------- Cấu hình ----------
+CACHE_DIRNAME = "pdf_barcode_reader"
+CACHE_FILENAME = "results.sqlite3"
+# Số kết quả (theo nội dung PDF) tối đa; vượt quá thì xóa các mục lâu không dùng nhất (LRU)
+MAX_ENTRIES = 50_000
+
+
+# ---------- Helpers ----------
+def default_cache_dir() -> str:
+    """Thư mục cache của user theo từng hệ điều hành."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, CACHE_DIRNAME)
+
+
+def pdf_sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# ---------- Cache ----------
+class ResultCache:
+    """Cache kết quả trên đĩa (SQLite): URL đã chuẩn hóa -> SHA-256 của PDF -> barcode đã đọc.
+
+    - Bảng `urls` giữ ETag / Last-Modified để tải lại có điều kiện (304 -> dùng luôn kết quả cũ).
+    - Bảng `results` đánh khóa theo nội dung, nên nhiều URL trỏ tới cùng một file chỉ decode một lần.
+    - Chỉ lưu kết quả đọc được barcode; lỗi / "Not found" luôn được xử lý lại.
+    Dùng được từ nhiều thread cùng lúc.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int = MAX_ENTRIES):
+        if path is None:
+            path = os.path.join(default_cache_dir(), CACHE_FILENAME)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+                "etag TEXT, last_modified TEXT, last_used REAL NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (sha256 TEXT PRIMARY KEY, codes TEXT NOT NULL, "
+                "stats TEXT NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def lookup_url(self, url: str) -> Dict | None:
+        """-> {"sha256", "etag", "last_modified", "codes", "stats"} nếu URL đã có kết quả."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT u.sha256, u.etag, u.last_modified, r.codes, r.stats FROM urls u "
+                "JOIN results r ON r.sha256 = u.sha256 WHERE u.url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {"sha256": row[0], "etag": row[1], "last_modified": row[2],
+                "codes": json.loads(row[3]), "stats": json.loads(row[4])}
+
+    def lookup_content(self, sha256: str) -> Dict | None:
+        """-> {"codes", "stats"} nếu nội dung PDF này đã từng được decode."""
+        with self._lock:
+            row = self._conn.execute("SELECT codes, stats FROM results WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None:
+                with self._conn:
+                    self._conn.execute("UPDATE results SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+        if row is None:
+            return None
+        return {"codes": json.loads(row[0]), "stats": json.loads(row[1])}
+
+    def remember_url(self, url: str, sha256: str, etag: str | None = None, last_modified: str | None = None):
+        """Ghi/cập nhật URL -> SHA-256 (kèm validator) và đánh dấu vừa dùng."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified, last_used) VALUES (?, ?, ?, ?, ?)",
+                (url, sha256, etag, last_modified, now))
+            self._conn.execute("UPDATE results SET last_used = ? WHERE sha256 = ?", (now, sha256))
+
+    def store(self, url: str, sha256: str, codes: List[str], stats: Dict | None = None,
+              etag: str | None = None, last_modified: str | None = None):
+        """Lưu kết quả decode của một PDF (bỏ qua nếu không có barcode)."""
+        if not codes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (sha256, codes, stats, last_used) VALUES (?, ?, ?, ?)",
+                (sha256, json.dumps(codes), json.dumps(stats or {}), now))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified, last_used) VALUES (?, ?, ?, ?, ?)",
+                (url, sha256, etag, last_modified, now))
+            self._evict()
+
+    def _evict(self):
+        """Xóa các kết quả lâu không dùng nhất khi vượt max_entries (gọi khi đang giữ lock)."""
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM results WHERE sha256 IN (SELECT sha256 FROM results ORDER BY last_used LIMIT ?)", (excess,))
+        self._conn.execute("DELETE FROM urls WHERE sha256 NOT IN (SELECT sha256 FROM results)")
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM urls")
+            self._conn.execute("DELETE FROM results")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def conditional_headers(entry: Dict | None) -> Dict[str, str]:
+    """Header If-None-Match / If-Modified-Since từ một mục cache của URL."""
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
@@ -0,0 +1,117 @@
+"""Bảng luật chọn + cắt mã: mã thô decode được -> hãng vận chuyển -> số tracking.
+
+Mỗi luật là một dict (đọc được từ file JSON, xem load_rules):
+
+    {"carrier": "FedEx", "prefix": "9631", "trim": "last:12"}
+    {"carrier": "USPS", "pattern": "420\\\\d{5}(9[2-5]\\\\d{20})", "trim": "group:1"}
+    {"pattern": "420\\\\d{5}(\\\\d{4})?", "skip": true}
+
+- "prefix" / "pattern" (regex, khớp toàn bộ mã): điều kiện của luật; không có cả hai -> khớp mọi mã.
+- "trim": "last:N" (giữ N ký tự cuối), "from:N" (bỏ N ký tự đầu nếu mã dài hơn N),
+  "group:N" (nhóm N của pattern), bỏ trống -> giữ nguyên mã.
+- "skip": true -> mã khớp luật này không phải số tracking (vd. barcode mã ZIP riêng trên nhãn USPS).
+Luật đầu tiên khớp được dùng; mã không khớp luật nào cũng không phải số tracking.
+"""
+import json
+import re
+from typing import Dict, Iterable, List, Tuple
+
+# ---------- Cấu hình ----------
+# Bảng mặc định theo cách cắt cũ ("9631..." -> 12 ký tự cuối, còn lại bỏ 8 ký tự đầu = "420" + ZIP), trừ:
+# - UPS "1Z" + 16 ký tự: giữ nguyên cả mã (cách cũ bỏ 8 ký tự đầu) -> kết quả mặc định của nhãn UPS đã đổi;
+# - barcode chỉ có "420" + ZIP (không kèm số tracking): bị bỏ qua, không còn được cắt như số tracking
+TRIM_FROM = 8
+DEFAULT_RULES = (
+    {"carrier": "FedEx", "prefix": "9631", "trim": "last:12"},
+    {"carrier": "USPS", "pattern": r"420\d{5}(\d{4})?", "skip": True},
+    {"carrier": "USPS", "pattern": r"420\d{5}.+", "trim": f"from:{TRIM_FROM}"},
+    {"carrier": "UPS", "pattern": r"1Z[0-9A-Z]{16}"},
+    {"carrier": "", "trim": f"from:{TRIM_FROM}"},
+)
+RULE_KEYS = {"carrier", "prefix", "pattern", "trim", "skip"}
+TRIM_KINDS = ("last", "from", "group")
+
+
+# ---------- Rules ----------
+def _check_rule(rule: Dict, pos: int) -> Dict:
+    if not isinstance(rule, dict):
+        raise ValueError(f"rule {pos}: expected an object")
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"rule {pos}: unknown keys {', '.join(sorted(unknown))}")
+    if "pattern" in rule:
+        try:
+            re.compile(rule["pattern"])
+        except re.error as e:
+            raise ValueError(f"rule {pos}: bad pattern ({e})")
+    trim = rule.get("trim") or ""
+    if trim:
+        kind, _, n = trim.partition(":")
+        if kind not in TRIM_KINDS or not n.isdigit():
+            raise ValueError(f"rule {pos}: trim must be last:N, from:N or group:N, got {trim!r}")
+        if kind == "group" and ("pattern" not in rule or re.compile(rule["pattern"]).groups < int(n)):
+            raise ValueError(f"rule {pos}: trim {trim} needs a pattern with that many groups")
+    return dict(rule)
+
+
+def parse_rules(rules: Iterable[Dict] | Dict) -> Tuple[Dict, ...]:
+    """Kiểm tra một bảng luật (list các luật, hoặc {"rules": [...]} như trong file JSON) -> tuple;
+    luật sai -> ValueError."""
+    if isinstance(rules, dict):
+        rules = rules.get("rules", [])
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError("rule table must be a list of rules")
+    rules = tuple(_check_rule(rule, pos) for pos, rule in enumerate(rules, 1))
+    if not rules:
+        raise ValueError("rule table is empty")
+    return rules
+
+
+def load_rules(path: str) -> Tuple[Dict, ...]:
+    """Đọc bảng luật từ file JSON (một list các luật, hoặc {"rules": [...]})."""
+    with open(path, encoding="utf-8") as f:
+        return parse_rules(json.load(f))
+
+
+def match_rule(raw: str, rules: Iterable[Dict] = DEFAULT_RULES) -> Tuple[Dict, re.Match | None] | None:
+    """Luật đầu tiên khớp mã -> (luật, match của pattern); không luật nào khớp -> None."""
+    for rule in rules:
+        if "prefix" in rule and not raw.startswith(rule["prefix"]):
+            continue
+        match = None
+        if "pattern" in rule:
+            match = re.fullmatch(rule["pattern"], raw)
+            if match is None:
+                continue
+        return rule, match
+    return None
+
+
+def classify(raw: str, rules: Iterable[Dict] = DEFAULT_RULES) -> Tuple[str, str] | None:
+    """Mã thô -> (số tracking đã cắt, hãng); không phải số tracking (luật skip / không khớp) -> None."""
+    hit = match_rule(raw, rules)
+    if hit is None or hit[0].get("skip"):
+        return None
+    rule, match = hit
+    trimmed = raw
+    kind, _, n = (rule.get("trim") or "").partition(":")
+    if kind == "last":
+        trimmed = raw[-int(n):]
+    elif kind == "from":
+        trimmed = raw[int(n):] if len(raw) > int(n) else raw
+    elif kind == "group":
+        trimmed = match.group(int(n)) or raw
+    return trimmed, rule.get("carrier", "")
+
+
+def is_tracking(raw: str, rules: Iterable[Dict] = DEFAULT_RULES) -> bool:
+    """Mã này có phải số tracking theo bảng luật không (không khớp luật nào / khớp luật skip -> False)."""
+    return classify(raw, rules) is not None
+
+
+def select_code(codes: List[str], rules: Iterable[Dict] = DEFAULT_RULES) -> str | None:
+    """Mã đầu tiên là số tracking theo bảng luật; không mã nào là số tracking -> None."""
+    for raw in codes:
+        if is_tracking(raw, rules):
+            return raw
+    return None